@@ -1,19 +1,24 @@
 import os
+
+# Charts are rendered headless; set before anything imports matplotlib
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
 from flask import Flask, render_template
-from flask_caching import Cache
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
 from flask_compress import Compress
 from flask_talisman import Talisman
-from .extensions import db, migrate, login_manager
+from config import Config
+from .extensions import db, migrate, login_manager, cache, config_value
 from .models import User
+from . import availability  # registers the slot reservation hooks on Appointment
+from . import rollups  # maintains the daily appointment rollup from Appointment writes
+from . import response_cache  # expires cached responses when models change
+from . import live_metrics  # keeps the system health counters current from model writes
+from .rate_limiter import rate_limiter
 
 # Initialize extensions
-cache = Cache()
-limiter = Limiter(key_func=get_remote_address)
 compress = Compress()
 
-def create_app():
+def create_app(config_overrides=None):
     # Set templates_path to the correct directory at the project root
     templates_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'templates'))
     
@@ -32,9 +37,11 @@ def create_app():
         'max_overflow': 20
     }
     
-    # Caching configuration
-    app.config['CACHE_TYPE'] = 'simple'
+    # Caching configuration; the SQLite backend is shared by every worker on the host
+    app.config['CACHE_TYPE'] = Config.CACHE_TYPE
     app.config['CACHE_DEFAULT_TIMEOUT'] = 300
+    app.config['CACHE_THRESHOLD'] = 10000
+    app.config['CACHE_SQLITE_PATH'] = Config.CACHE_SQLITE_PATH
     
     # Security headers
     app.config['SECURITY_HEADERS'] = {
@@ -44,6 +51,10 @@ def create_app():
         'Strict-Transport-Security': 'max-age=31536000; includeSubDomains'
     }
     
+    # Allow scripts (benchmarks, one-off tooling) to point at another database
+    if config_overrides:
+        app.config.update(config_overrides)
+    
     # Initialize extensions
     db.init_app(app)
     migrate.init_app(app, db)
@@ -54,7 +65,7 @@ def create_app():
     
     # Initialize performance extensions
     cache.init_app(app)
-    limiter.init_app(app)
+    rate_limiter.init_app(app)
     compress.init_app(app)
     
     # Security middleware
@@ -83,6 +94,25 @@ def create_app():
     from . import routes
     app.register_blueprint(routes.bp)
     
+    # Precompute the admin analytics in the background
+    from .snapshots import snapshot_scheduler
+    snapshot_scheduler.init_app(app)
+    
+    # Run report exports in the background
+    from .export_jobs import export_jobs
+    export_jobs.init_app(app)
+    
+    # Dispatch appointment reminders when they come due
+    from .reminder_dispatcher import reminder_dispatcher
+    reminder_dispatcher.init_app(app)
+    
+    # Real-time notifications; the service also starts the reminder dispatcher
+    if config_value('REALTIME_ENABLED', app):
+        from .realtime_service import create_socketio, init_realtime_service
+        socketio = create_socketio(app)
+        with app.app_context():
+            init_realtime_service(socketio)
+    
     # Error handlers
     @app.errorhandler(404)
     def not_found_error(error):
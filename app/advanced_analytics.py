@@ -1,61 +1,85 @@
-import pandas as pd
-import numpy as np
+from __future__ import annotations
+import threading
+import time as clock
 from datetime import datetime, date, timedelta
 from typing import Dict, List, Tuple, Optional, Any
 from .models import db, User, Appointment, MedicalRecord, DentalHistory, Service, Notification
 import json
-import matplotlib.pyplot as plt
-import seaborn as sns
-from io import BytesIO
-import base64
-from sklearn.linear_model import LinearRegression
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.preprocessing import StandardScaler
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import mean_squared_error, r2_score
+from .extensions import config_value
+from .lazy import lazy_import
+from .model_registry import model_registry
+from .forecasting import RecursiveForecaster
+from .rollups import count_appointments, daily_appointment_counts
+from .charts import chart_renderer
+from .response_cache import response_cache
 import warnings
 warnings.filterwarnings('ignore')
 
+# Loaded on first use so booting the app and CLI commands skip the scientific stack
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+
 class AdvancedAnalytics:
     """Advanced analytics with machine learning capabilities"""
     
+    # Bump when the demand model's feature definitions change so stored models are retrained
+    DEMAND_FEATURES_VERSION = 2
+    
     def __init__(self):
         self.colors = ['#007bff', '#28a745', '#ffc107', '#dc3545', '#6c757d', '#17a2b8', '#6f42c1', '#fd7e14']
         self.models = {}
         self.scalers = {}
+        # Upper bound on staleness for writes that bump no response cache tag (raw SQL, external tools)
+        self.patient_features_ttl = 300
+        self._patient_features: Optional[Tuple[float, Dict, pd.DataFrame]] = None
+        self._patient_features_lock = threading.Lock()
         
     def prepare_appointment_data(self, days: int = 365) -> pd.DataFrame:
         """Prepare appointment data for ML analysis"""
         end_date = date.today()
         start_date = end_date - timedelta(days=days)
         
-        appointments = Appointment.query.filter(
-            Appointment.date >= start_date,
-            Appointment.date <= end_date,
-            Appointment.is_deleted == False
-        ).all()
-        
-        data = []
-        for apt in appointments:
-            data.append({
-                'date': apt.date,
-                'day_of_week': apt.date.weekday(),
-                'month': apt.date.month,
-                'year': apt.date.year,
-                'hour': apt.time.hour,
-                'service_type': apt.service_type,
-                'duration': apt.duration,
-                'status': apt.status,
-                'user_id': apt.user_id
-            })
-        
-        df = pd.DataFrame(data)
+        df = self.load_appointment_frame(start_date, end_date)
         if not df.empty:
-            df['date'] = pd.to_datetime(df['date'])
+            df['day_of_week'] = df['date'].dt.weekday.astype('int8')
+            df['month'] = df['date'].dt.month.astype('int8')
+            df['year'] = df['date'].dt.year.astype('int16')
             df['is_weekend'] = df['day_of_week'].isin([5, 6])
             df['is_holiday'] = self._is_holiday(df['date'])
-            df['season'] = df['month'].apply(self._get_season)
+            df['season'] = df['month'].map({month: self._get_season(month) for month in range(1, 13)}).astype('category')
+        
+        return df
+    
+    def load_appointment_frame(self, start_date: date, end_date: date, chunksize: int = 1000) -> pd.DataFrame:
+        """Stream the appointment columns used by the ML code straight from the cursor into a typed DataFrame"""
+        stmt = db.select(
+            Appointment.id,
+            Appointment.date,
+            db.extract('hour', Appointment.time).label('hour'),
+            Appointment.service_type,
+            Appointment.duration,
+            Appointment.status,
+            Appointment.user_id
+        ).where(
+            Appointment.date >= start_date,
+            Appointment.date <= end_date,
+            Appointment.is_deleted == False
+        )
         
+        # Coerce each chunk as it arrives so only compact arrays are kept around
+        chunks = [
+            chunk.astype({'id': 'int64', 'hour': 'int8', 'duration': 'float32', 'user_id': 'float64'})
+            for chunk in pd.read_sql(stmt, db.session.connection(), chunksize=chunksize)
+        ]
+        if not chunks:
+            return pd.DataFrame(columns=['id', 'date', 'hour', 'service_type', 'duration', 'status', 'user_id'])
+        
+        df = pd.concat(chunks, ignore_index=True)
+        df['date'] = pd.to_datetime(df['date'])
+        df['duration'] = df['duration'].fillna(60).astype('int16')
+        df['user_id'] = df['user_id'].astype('Int64')
+        df['service_type'] = df['service_type'].astype('category')
+        df['status'] = df['status'].astype('category')
         return df
     
     def _is_holiday(self, dates: pd.Series) -> pd.Series:
@@ -80,9 +104,10 @@ class AdvancedAnalytics:
     
     def predict_appointment_demand_ml(self, days_ahead: int = 30) -> Dict:
         """Predict appointment demand using machine learning"""
-        df = self.prepare_appointment_data()
+        end_date = date.today()
+        counts_by_date = daily_appointment_counts(end_date - timedelta(days=365), end_date)
         
-        if df.empty:
+        if not counts_by_date:
             return {
                 'predictions': [0] * days_ahead,
                 'confidence_level': 'low',
@@ -90,8 +115,11 @@ class AdvancedAnalytics:
                 'error': 'Insufficient data for prediction'
             }
         
-        # Aggregate daily appointments
-        daily_counts = df.groupby('date').size().reset_index(name='appointments')
+        # Daily appointments from the maintained rollup
+        daily_counts = pd.DataFrame({
+            'date': pd.to_datetime(list(counts_by_date.keys())),
+            'appointments': np.fromiter(counts_by_date.values(), dtype=np.int64, count=len(counts_by_date))
+        })
         daily_counts['day_of_week'] = daily_counts['date'].dt.weekday
         daily_counts['month'] = daily_counts['date'].dt.month
         daily_counts['is_weekend'] = daily_counts['day_of_week'].isin([5, 6])
@@ -99,8 +127,10 @@ class AdvancedAnalytics:
         # Create features
         daily_counts['lag_1'] = daily_counts['appointments'].shift(1)
         daily_counts['lag_7'] = daily_counts['appointments'].shift(7)
-        daily_counts['rolling_mean_7'] = daily_counts['appointments'].rolling(7).mean()
-        daily_counts['rolling_std_7'] = daily_counts['appointments'].rolling(7).std()
+        # Rolling stats cover the 7 days before the target, as RecursiveForecaster builds them at inference
+        previous = daily_counts['appointments'].shift(1)
+        daily_counts['rolling_mean_7'] = previous.rolling(7).mean()
+        daily_counts['rolling_std_7'] = previous.rolling(7).std()
         
         # Drop NaN values
         daily_counts = daily_counts.dropna()
@@ -115,6 +145,49 @@ class AdvancedAnalytics:
         
         # Prepare features and target
         features = ['day_of_week', 'month', 'is_weekend', 'lag_1', 'lag_7', 'rolling_mean_7', 'rolling_std_7']
+        
+        # Today's count is still moving, so only completed days decide whether the data is new
+        history = daily_counts[daily_counts['date'] < pd.Timestamp(date.today())]
+        fingerprint = model_registry.fingerprint(
+            np.array([self.DEMAND_FEATURES_VERSION]),
+            history['date'].to_numpy(dtype='datetime64[ns]'),
+            history['appointments'].to_numpy(dtype='int64')
+        )
+        ml_models = config_value('ML_MODELS')
+        training_interval = ml_models['appointment_prediction']['training_interval']
+        
+        model, metadata = model_registry.get_or_train(
+            'appointment_prediction', fingerprint, training_interval,
+            lambda: self._train_demand_model(daily_counts, features)
+        )
+        r2 = metadata['model_score']
+        
+        # Generate predictions
+        forecaster = RecursiveForecaster(model, features)
+        predictions = forecaster.forecast(
+            daily_counts['appointments'].to_numpy(),
+            daily_counts['date'].max(),
+            days_ahead
+        )
+        
+        confidence_level = 'high' if r2 > 0.7 else 'medium' if r2 > 0.5 else 'low'
+        
+        return {
+            'predictions': predictions,
+            'confidence_level': confidence_level,
+            'method': 'random_forest',
+            'model_score': r2,
+            'mse': metadata['mse'],
+            'feature_importance': dict(zip(features, model.feature_importances_)),
+            'trained_at': metadata['trained_at']
+        }
+    
+    def _train_demand_model(self, daily_counts: pd.DataFrame, features: List[str]) -> Tuple[RandomForestRegressor, Dict]:
+        """Fit the demand forecaster and report its hold-out scores"""
+        from sklearn.ensemble import RandomForestRegressor
+        from sklearn.metrics import mean_squared_error, r2_score
+        from sklearn.model_selection import train_test_split
+        
         X = daily_counts[features]
         y = daily_counts['appointments']
         
@@ -127,72 +200,82 @@ class AdvancedAnalytics:
         
         # Evaluate model
         y_pred = model.predict(X_test)
-        mse = mean_squared_error(y_test, y_pred)
-        r2 = r2_score(y_test, y_pred)
-        
-        # Generate predictions
-        last_date = daily_counts['date'].max()
-        predictions = []
-        
-        for i in range(days_ahead):
-            pred_date = last_date + timedelta(days=i+1)
-            
-            # Create feature vector for prediction
-            pred_features = pd.DataFrame([{
-                'day_of_week': pred_date.weekday(),
-                'month': pred_date.month,
-                'is_weekend': pred_date.weekday() in [5, 6],
-                'lag_1': daily_counts['appointments'].iloc[-1] if i == 0 else predictions[-1],
-                'lag_7': daily_counts['appointments'].iloc[-7] if len(daily_counts) >= 7 else daily_counts['appointments'].mean(),
-                'rolling_mean_7': daily_counts['appointments'].tail(7).mean(),
-                'rolling_std_7': daily_counts['appointments'].tail(7).std()
-            }])
-            
-            pred = model.predict(pred_features)[0]
-            predictions.append(max(0, round(pred)))
-        
-        confidence_level = 'high' if r2 > 0.7 else 'medium' if r2 > 0.5 else 'low'
-        
-        return {
-            'predictions': predictions,
-            'confidence_level': confidence_level,
-            'method': 'random_forest',
-            'model_score': r2,
-            'mse': mse,
-            'feature_importance': dict(zip(features, model.feature_importances_))
+        metadata = {
+            'model_score': float(r2_score(y_test, y_pred)),
+            'mse': float(mean_squared_error(y_test, y_pred)),
+            'features': features,
+            'training_rows': len(daily_counts)
         }
+        return model, metadata
+    
+    def patient_feature_table(self) -> pd.DataFrame:
+        """Per-patient appointment features shared by the behavior and churn analyses
+        
+        The table is reused while the shared 'appointment' and 'user' response cache tags are
+        unchanged. Those tags are bumped on every commit that touches either table, from any
+        worker, including soft deletes and bulk writes that call mark_changed(). Writes that
+        bypass both are picked up after patient_features_ttl seconds at most.
+        """
+        # Versions are read before building so a concurrent commit is never masked
+        versions = response_cache.tag_versions(Appointment.__tablename__, User.__tablename__)
+        with self._patient_features_lock:
+            cached = self._patient_features
+            if (cached is not None and cached[1] == versions
+                    and clock.monotonic() - cached[0] < self.patient_features_ttl):
+                return cached[2]
+        
+        features = self._build_patient_features()
+        with self._patient_features_lock:
+            self._patient_features = (clock.monotonic(), versions, features)
+        return features
+    
+    def invalidate_patient_features(self):
+        """Drop the cached patient feature table"""
+        with self._patient_features_lock:
+            self._patient_features = None
+    
+    def _build_patient_features(self) -> pd.DataFrame:
+        """One grouped query over active patients' appointments, one row per patient"""
+        stmt = db.select(
+            Appointment.user_id,
+            db.func.count(Appointment.id).label('total_appointments'),
+            db.func.sum(db.case((Appointment.status == 'completed', 1), else_=0)).label('completed_appointments'),
+            db.func.sum(db.case((Appointment.status == 'cancelled', 1), else_=0)).label('cancelled_appointments'),
+            db.func.min(Appointment.date).label('first_visit'),
+            db.func.max(Appointment.date).label('last_visit')
+        ).join(
+            User, User.id == Appointment.user_id
+        ).where(
+            User.is_deleted == False,
+            Appointment.is_deleted == False
+        ).group_by(Appointment.user_id)
+        
+        df = pd.read_sql(stmt, db.session.connection())
+        df = df.astype({'total_appointments': 'int64', 'completed_appointments': 'int64', 'cancelled_appointments': 'int64'})
+        df['first_visit'] = pd.to_datetime(df['first_visit'])
+        df['last_visit'] = pd.to_datetime(df['last_visit'])
+        
+        total = df['total_appointments']
+        df['completion_rate'] = df['completed_appointments'] / total
+        df['cancellation_rate'] = df['cancelled_appointments'] / total
+        gaps = (df['last_visit'] - df['first_visit']).dt.days / (total - 1)
+        df['avg_days_between_visits'] = gaps.where(total > 1, 0)
+        return df
+    
+    def _days_since(self, visits: pd.Series) -> pd.Series:
+        return (pd.Timestamp(date.today()) - visits).dt.days
     
     def analyze_patient_behavior(self) -> Dict:
         """Analyze patient behavior patterns"""
-        users = User.query.filter(User.is_deleted == False).all()
-        appointments = Appointment.query.filter(Appointment.is_deleted == False).all()
+        features = self.patient_feature_table()
         
-        # Patient engagement analysis
-        engagement_data = []
-        for user in users:
-            user_appointments = [apt for apt in appointments if apt.user_id == user.id]
-            
-            if user_appointments:
-                first_apt = min(user_appointments, key=lambda x: x.date)
-                last_apt = max(user_appointments, key=lambda x: x.date)
-                total_apts = len(user_appointments)
-                completed_apts = len([apt for apt in user_appointments if apt.status == 'completed'])
-                cancelled_apts = len([apt for apt in user_appointments if apt.status == 'cancelled'])
-                
-                engagement_data.append({
-                    'user_id': user.id,
-                    'total_appointments': total_apts,
-                    'completed_appointments': completed_apts,
-                    'cancelled_appointments': cancelled_apts,
-                    'completion_rate': completed_apts / total_apts if total_apts > 0 else 0,
-                    'days_since_last_visit': (date.today() - last_apt.date).days,
-                    'avg_days_between_visits': (last_apt.date - first_apt.date).days / (total_apts - 1) if total_apts > 1 else 0
-                })
-        
-        if not engagement_data:
+        if features.empty:
             return {'error': 'No appointment data available'}
         
-        df = pd.DataFrame(engagement_data)
+        # Patient engagement analysis
+        df = features[['user_id', 'total_appointments', 'completed_appointments', 'cancelled_appointments',
+                       'completion_rate', 'avg_days_between_visits']].copy()
+        df['days_since_last_visit'] = self._days_since(features['last_visit'])
         
         # Segment patients
         df['engagement_segment'] = pd.cut(df['completion_rate'], 
@@ -204,8 +287,8 @@ class AdvancedAnalytics:
                                        labels=['New', 'Occasional', 'Regular', 'Frequent'])
         
         return {
-            'total_patients': len(users),
-            'active_patients': len([u for u in users if any(apt.status == 'completed' for apt in appointments if apt.user_id == u.id)]),
+            'total_patients': User.query.filter(User.is_deleted == False).count(),
+            'active_patients': int((df['completed_appointments'] > 0).sum()),
             'engagement_segments': df['engagement_segment'].value_counts().to_dict(),
             'frequency_segments': df['frequency_segment'].value_counts().to_dict(),
             'avg_completion_rate': df['completion_rate'].mean(),
@@ -216,43 +299,25 @@ class AdvancedAnalytics:
     
     def predict_patient_churn(self) -> Dict:
         """Predict which patients are likely to churn"""
-        users = User.query.filter(User.is_deleted == False).all()
-        appointments = Appointment.query.filter(Appointment.is_deleted == False).all()
+        features = self.patient_feature_table()
         
-        churn_data = []
-        for user in users:
-            user_appointments = [apt for apt in appointments if apt.user_id == user.id]
-            
-            if user_appointments:
-                last_apt = max(user_appointments, key=lambda x: x.date)
-                days_since_last = (date.today() - last_apt.date).days
-                total_apts = len(user_appointments)
-                cancelled_rate = len([apt for apt in user_appointments if apt.status == 'cancelled']) / total_apts
-                
-                # Churn probability based on behavior patterns
-                churn_prob = 0
-                if days_since_last > 365:
-                    churn_prob += 0.4
-                if cancelled_rate > 0.5:
-                    churn_prob += 0.3
-                if total_apts < 2:
-                    churn_prob += 0.2
-                if days_since_last > 180:
-                    churn_prob += 0.1
-                
-                churn_data.append({
-                    'user_id': user.id,
-                    'days_since_last_visit': days_since_last,
-                    'total_appointments': total_apts,
-                    'cancellation_rate': cancelled_rate,
-                    'churn_probability': min(1.0, churn_prob),
-                    'risk_level': 'High' if churn_prob > 0.6 else 'Medium' if churn_prob > 0.3 else 'Low'
-                })
-        
-        if not churn_data:
+        if features.empty:
             return {'error': 'No data available for churn analysis'}
         
-        df = pd.DataFrame(churn_data)
+        df = features[['user_id']].copy()
+        df['days_since_last_visit'] = self._days_since(features['last_visit'])
+        df['total_appointments'] = features['total_appointments']
+        df['cancellation_rate'] = features['cancellation_rate']
+        
+        # Churn probability based on behavior patterns
+        churn_prob = (
+            0.4 * (df['days_since_last_visit'] > 365)
+            + 0.3 * (df['cancellation_rate'] > 0.5)
+            + 0.2 * (df['total_appointments'] < 2)
+            + 0.1 * (df['days_since_last_visit'] > 180)
+        )
+        df['churn_probability'] = churn_prob.clip(upper=1.0)
+        df['risk_level'] = np.select([churn_prob > 0.6, churn_prob > 0.3], ['High', 'Medium'], default='Low')
         
         return {
             'high_risk_patients': len(df[df['risk_level'] == 'High']),
@@ -370,16 +435,8 @@ class AdvancedAnalytics:
         current_month = date.today().replace(day=1)
         last_month = (current_month - timedelta(days=1)).replace(day=1)
         
-        current_month_apts = Appointment.query.filter(
-            Appointment.date >= current_month,
-            Appointment.is_deleted == False
-        ).count()
-        
-        last_month_apts = Appointment.query.filter(
-            Appointment.date >= last_month,
-            Appointment.date < current_month,
-            Appointment.is_deleted == False
-        ).count()
+        current_month_apts = count_appointments(current_month)
+        last_month_apts = count_appointments(last_month, current_month - timedelta(days=1))
         
         if last_month_apts > 0:
             return ((current_month_apts - last_month_apts) / last_month_apts) * 100
@@ -410,7 +467,7 @@ class AdvancedAnalytics:
         
         return recommendations
     
-    def create_advanced_visualizations(self) -> Dict:
+    def create_advanced_visualizations(self, preset: str = None) -> Dict:
         """Create advanced data visualizations"""
         df = self.prepare_appointment_data()
         
@@ -421,36 +478,20 @@ class AdvancedAnalytics:
         
         # Time series plot
         daily_counts = df.groupby('date').size()
-        plt.figure(figsize=(12, 6))
-        daily_counts.plot(kind='line', color=self.colors[0])
-        plt.title('Appointment Trends Over Time')
-        plt.xlabel('Date')
-        plt.ylabel('Number of Appointments')
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        
-        buffer = BytesIO()
-        plt.savefig(buffer, format='png', dpi=300, bbox_inches='tight')
-        buffer.seek(0)
-        visualizations['time_series'] = base64.b64encode(buffer.getvalue()).decode()
-        plt.close()
+        visualizations['time_series'] = chart_renderer.render_base64('time_series', {
+            'dates': [d.strftime('%Y-%m-%d') for d in daily_counts.index],
+            'counts': daily_counts.tolist()
+        }, preset)
         
         # Heatmap of appointments by day and hour
         pivot_table = df.pivot_table(index='day_of_week', columns='hour', values='id', aggfunc='count', fill_value=0)
-        plt.figure(figsize=(12, 8))
-        sns.heatmap(pivot_table, annot=True, fmt='d', cmap='YlOrRd')
-        plt.title('Appointment Heatmap: Day vs Hour')
-        plt.xlabel('Hour of Day')
-        plt.ylabel('Day of Week')
-        plt.tight_layout()
-        
-        buffer = BytesIO()
-        plt.savefig(buffer, format='png', dpi=300, bbox_inches='tight')
-        buffer.seek(0)
-        visualizations['heatmap'] = base64.b64encode(buffer.getvalue()).decode()
-        plt.close()
+        visualizations['heatmap'] = chart_renderer.render_base64('heatmap', {
+            'index': pivot_table.index.tolist(),
+            'columns': pivot_table.columns.tolist(),
+            'values': pivot_table.values.tolist()
+        }, preset)
         
         return visualizations
 
 # Initialize the advanced analytics
-advanced_analytics = AdvancedAnalytics() 
\ No newline at end of file
+advanced_analytics = AdvancedAnalytics() 
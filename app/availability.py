@@ -0,0 +1,340 @@
+import json
+import threading
+import time as clock
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+from config import Config
+from .models import db, Appointment, Resource, SlotReservation
+
+# Statuses that do not occupy the chair
+INACTIVE_STATUSES = ('cancelled',)
+
+class DayAvailability:
+    """Occupancy bitmap for one working day, one bit per fixed-size minute bucket
+    
+    Bit i is set while at least one booking overlaps bucket i. Per-bucket counts
+    back the bitmap so overlapping bookings can be released independently.
+    """
+    
+    def __init__(self, open_minute: int, close_minute: int, granularity: int):
+        self.open_minute = open_minute
+        self.granularity = granularity
+        self.size = max(0, (close_minute - open_minute) // granularity)
+        self.full_mask = (1 << self.size) - 1
+        self.occupied = 0
+        self.counts = bytearray(self.size)
+    
+    def _bucket_range(self, start_minute: int, duration: int) -> Tuple[int, int]:
+        offset = start_minute - self.open_minute
+        first = max(0, offset // self.granularity)
+        last = min(self.size, -(-(offset + duration) // self.granularity))  # ceil
+        return first, last
+    
+    def book(self, start_minute: int, duration: int):
+        """Mark the buckets covered by a booking as occupied"""
+        first, last = self._bucket_range(start_minute, duration)
+        for bucket in range(first, last):
+            if self.counts[bucket] == 0:
+                self.occupied |= 1 << bucket
+            self.counts[bucket] = min(255, self.counts[bucket] + 1)
+    
+    def release(self, start_minute: int, duration: int):
+        """Free the buckets covered by a cancelled or moved booking"""
+        first, last = self._bucket_range(start_minute, duration)
+        for bucket in range(first, last):
+            if self.counts[bucket] == 0:
+                continue
+            self.counts[bucket] -= 1
+            if self.counts[bucket] == 0:
+                self.occupied &= ~(1 << bucket)
+    
+    def free_runs(self, duration: int) -> int:
+        """Bitmask of buckets that start a free run long enough for the duration"""
+        needed = -(-duration // self.granularity)
+        if needed <= 0 or needed > self.size:
+            return 0
+        
+        # Sliding-window AND over the whole day at once, doubling the window each pass
+        runs = ~self.occupied & self.full_mask
+        span = 1
+        while span < needed:
+            shift = min(span, needed - span)
+            runs &= runs >> shift
+            span += shift
+        return runs
+    
+    def free_starts(self, duration: int, step: int) -> List[int]:
+        """Start minutes (every `step` minutes from opening) with room for the duration"""
+        runs = self.free_runs(duration)
+        step_buckets = max(1, step // self.granularity)
+        
+        starts = []
+        for bucket in range(0, self.size, step_buckets):
+            if runs >> bucket & 1:
+                starts.append(self.open_minute + bucket * self.granularity)
+        return starts
+    
+    def is_free(self, start_minute: int, duration: int) -> bool:
+        """Whether a booking at start_minute fits inside opening hours without overlapping another"""
+        close_minute = self.open_minute + self.size * self.granularity
+        if start_minute < self.open_minute or start_minute + duration > close_minute:
+            return False
+        first, last = self._bucket_range(start_minute, duration)
+        mask = ((1 << (last - first)) - 1) << first
+        return not self.occupied & mask
+
+class DaySchedule:
+    """Availability of every resource on one date; a start is offered while any resource can take it"""
+    
+    def __init__(self, granularity: int):
+        self.granularity = granularity
+        self.resources: Dict[int, DayAvailability] = {}
+    
+    def free_starts(self, duration: int, step: int) -> List[int]:
+        """Start minutes (every `step` minutes from the earliest opening) where at least one resource has room"""
+        if not self.resources:
+            return []
+        
+        # OR the per-resource run masks after aligning them on the earliest opening
+        origin = min(day.open_minute for day in self.resources.values())
+        runs = 0
+        for day in self.resources.values():
+            runs |= day.free_runs(duration) << ((day.open_minute - origin) // self.granularity)
+        step_buckets = max(1, step // self.granularity)
+        
+        starts = []
+        bucket = 0
+        while runs >> bucket:
+            if runs >> bucket & 1:
+                starts.append(origin + bucket * self.granularity)
+            bucket += step_buckets
+        return starts
+    
+    def free_resources(self, start_minute: int, duration: int) -> List[int]:
+        """Resources that can take a booking at start_minute, least booked first"""
+        free = [resource_id for resource_id, day in self.resources.items() if day.is_free(start_minute, duration)]
+        return sorted(free, key=lambda resource_id: (bin(self.resources[resource_id].occupied).count('1'), resource_id))
+    
+    def is_free(self, start_minute: int, duration: int) -> bool:
+        """Whether any resource can take a booking at start_minute"""
+        return any(day.is_free(start_minute, duration) for day in self.resources.values())
+
+def to_minute(value: time) -> int:
+    return value.hour * 60 + value.minute
+
+def from_minute(minute: int) -> str:
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+def _parse_hours(hours: Optional[Dict[str, Optional[str]]]) -> Optional[Tuple[int, int]]:
+    if not hours or not hours['start']:
+        return None
+    start = datetime.strptime(hours['start'], '%H:%M').time()
+    end = datetime.strptime(hours['end'], '%H:%M').time()
+    return to_minute(start), to_minute(end)
+
+class AvailabilityIndex:
+    """Per-resource, per-day availability bitmaps, built from the database once and kept current from commits"""
+    
+    _instances: List['AvailabilityIndex'] = []
+    
+    def __init__(self, working_hours: Dict[str, Dict[str, Optional[str]]], granularity: int, ttl: int = 60):
+        # Clinic hours, used by resources that do not define their own
+        self.working_hours = working_hours
+        self.granularity = granularity
+        # Other workers' commits are not seen by this process, so days are rebuilt after ttl seconds
+        self.ttl = ttl
+        self._days: Dict[date, Tuple[float, Optional[DaySchedule]]] = {}
+        self._lock = threading.RLock()
+        AvailabilityIndex._instances.append(self)
+    
+    def _load_resources(self) -> List[Tuple[int, Dict[str, Dict[str, Optional[str]]]]]:
+        """(id, weekly hours) of every bookable resource, in assignment order"""
+        rows = db.session.query(Resource.id, Resource.working_hours).filter(
+            Resource.is_active == True,
+            Resource.is_deleted == False
+        ).order_by(Resource.sort_order, Resource.id).all()
+        return [(resource_id, json.loads(hours) if hours else self.working_hours) for resource_id, hours in rows]
+    
+    def has_resources(self) -> bool:
+        """Whether any bookable resource exists; without one no slot can ever be offered"""
+        return db.session.query(Resource.id).filter(
+            Resource.is_active == True,
+            Resource.is_deleted == False
+        ).first() is not None
+    
+    def _new_day(self, target_date: date, resources) -> Optional[DaySchedule]:
+        weekday = target_date.strftime('%A').lower()
+        schedule = DaySchedule(self.granularity)
+        for resource_id, working_hours in resources:
+            hours = _parse_hours(working_hours.get(weekday))
+            if hours:
+                schedule.resources[resource_id] = DayAvailability(hours[0], hours[1], self.granularity)
+        return schedule if schedule.resources else None
+    
+    def get_day(self, target_date: date) -> Optional[DaySchedule]:
+        """Availability of all resources on a date, or None when nobody works that day"""
+        return self.get_days(target_date, target_date)[target_date]
+    
+    def get_days(self, start_date: date, end_date: date) -> Dict[date, Optional[DaySchedule]]:
+        """Availability for every date in [start_date, end_date], loading missing days in one query"""
+        days = {}
+        missing = []
+        now = clock.monotonic()
+        
+        with self._lock:
+            current = start_date
+            while current <= end_date:
+                cached = self._days.get(current)
+                if cached and now - cached[0] < self.ttl:
+                    days[current] = cached[1]
+                else:
+                    missing.append(current)
+                current += timedelta(days=1)
+        
+        if missing:
+            resources = self._load_resources()
+            built = {target_date: self._new_day(target_date, resources) for target_date in missing}
+            open_dates = [target_date for target_date, day in built.items() if day is not None]
+            
+            if open_dates:
+                rows = db.session.query(
+                    Appointment.date, Appointment.time, Appointment.duration, Appointment.resource_id
+                ).filter(
+                    Appointment.date >= open_dates[0],
+                    Appointment.date <= open_dates[-1],
+                    Appointment.is_deleted == False,
+                    Appointment.status.notin_(INACTIVE_STATUSES)
+                ).all()
+                
+                # Single pass over the window's bookings, each routed to its resource's day;
+                # unassigned legacy bookings count against the first resource
+                default_resource = resources[0][0] if resources else None
+                for booking_date, start, duration, resource_id in rows:
+                    schedule = built.get(booking_date)
+                    if schedule is None:
+                        continue
+                    day = schedule.resources.get(resource_id if resource_id is not None else default_resource)
+                    if day is not None:
+                        day.book(to_minute(start), duration or 60)
+            
+            with self._lock:
+                for target_date, day in built.items():
+                    self._days[target_date] = (now, day)
+            days.update(built)
+        
+        return days
+    
+    def apply(self, target_date: date, start: time, duration: int, resource_id: Optional[int], booked: bool):
+        """Incrementally book or release a slot on a cached day"""
+        with self._lock:
+            cached = self._days.get(target_date)
+            if not cached or cached[1] is None:
+                return
+            day = cached[1].resources.get(resource_id)
+            if day is None:
+                # Unknown or unassigned resource; rebuild the day on next read
+                self._days.pop(target_date, None)
+            elif booked:
+                day.book(to_minute(start), duration or 60)
+            else:
+                day.release(to_minute(start), duration or 60)
+    
+    def invalidate(self, target_date: date = None):
+        """Drop one cached day, or all of them"""
+        with self._lock:
+            if target_date is None:
+                self._days.clear()
+            else:
+                self._days.pop(target_date, None)
+
+def _slot_state(target: Appointment, previous: bool = False) -> Optional[Tuple[date, time, int, Optional[int]]]:
+    """(date, time, duration, resource_id) the appointment occupies, before or after the pending change"""
+    values = {}
+    state = inspect(target)
+    for name in ('date', 'time', 'duration', 'resource_id', 'status', 'is_deleted'):
+        history = state.attrs[name].history
+        if previous and history.deleted:
+            values[name] = history.deleted[0]
+        else:
+            values[name] = getattr(target, name)
+    
+    if values['is_deleted'] or values['status'] in INACTIVE_STATUSES:
+        return None
+    return values['date'], values['time'], values['duration'] or 60, values['resource_id']
+
+def _queue_change(target: Appointment, old_slot, new_slot):
+    session = object_session(target)
+    if session is None or old_slot == new_slot:
+        return
+    session.info.setdefault('availability_changes', []).append((old_slot, new_slot))
+
+def reservation_rows(appointment_id: int, slot: Tuple[date, time, int, Optional[int]]) -> List[Dict]:
+    """SlotReservation rows covering a booking, one per APPOINTMENT_SLOT_INTERVAL bucket of its resource"""
+    booking_date, start, duration, resource_id = slot
+    granularity = Config.APPOINTMENT_SLOT_INTERVAL
+    begin = to_minute(start)
+    return [
+        {'appointment_id': appointment_id, 'resource_id': resource_id, 'date': booking_date,
+         'slot_minute': minute, 'created_at': datetime.utcnow()}
+        for minute in range(begin - begin % granularity, begin + duration, granularity)
+    ]
+
+def _reserve(connection, appointment_id: int, old_slot, new_slot):
+    """Move an appointment's slot reservations inside the flush that changes it"""
+    if old_slot == new_slot:
+        return
+    if old_slot:
+        connection.execute(SlotReservation.__table__.delete().where(
+            SlotReservation.appointment_id == appointment_id
+        ))
+    if new_slot:
+        # Raises IntegrityError when another booking already holds any of these buckets on the same resource
+        connection.execute(SlotReservation.__table__.insert(), reservation_rows(appointment_id, new_slot))
+
+@event.listens_for(Appointment, 'before_insert')
+def _assign_default_resource(mapper, connection, target):
+    """Bookings created outside the scheduler go to the first bookable resource"""
+    if target.resource_id is None:
+        target.resource_id = connection.execute(
+            db.select(Resource.id)
+            .where(Resource.is_active == True, Resource.is_deleted == False)
+            .order_by(Resource.sort_order, Resource.id)
+            .limit(1)
+        ).scalar()
+
+@event.listens_for(Appointment, 'after_insert')
+def _track_appointment_insert(mapper, connection, target):
+    new_slot = _slot_state(target)
+    _reserve(connection, target.id, None, new_slot)
+    _queue_change(target, None, new_slot)
+
+@event.listens_for(Appointment, 'after_update')
+def _track_appointment_update(mapper, connection, target):
+    old_slot, new_slot = _slot_state(target, previous=True), _slot_state(target)
+    _reserve(connection, target.id, old_slot, new_slot)
+    _queue_change(target, old_slot, new_slot)
+
+@event.listens_for(Appointment, 'after_delete')
+def _track_appointment_delete(mapper, connection, target):
+    old_slot = _slot_state(target, previous=True)
+    _reserve(connection, target.id, old_slot, None)
+    _queue_change(target, old_slot, None)
+
+@event.listens_for(Session, 'after_commit')
+def _apply_availability_changes(session):
+    """Only committed bookings and cancellations reach the index"""
+    changes = session.info.pop('availability_changes', None)
+    if not changes:
+        return
+    for index in AvailabilityIndex._instances:
+        for old_slot, new_slot in changes:
+            if old_slot:
+                index.apply(*old_slot, booked=False)
+            if new_slot:
+                index.apply(*new_slot, booked=True)
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_availability_changes(session, previous_transaction):
+    session.info.pop('availability_changes', None)
@@ -0,0 +1,172 @@
+import base64
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from io import BytesIO
+from typing import Callable, Dict, List, Optional
+from .extensions import cache, config_value
+
+logger = logging.getLogger(__name__)
+
+COLORS = ['#007bff', '#28a745', '#ffc107', '#dc3545', '#6c757d', '#17a2b8', '#6f42c1', '#fd7e14']
+
+FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+# Chart drawers; each draws one chart type onto a fresh Figure and Axes
+def _draw_appointment_trends(fig, ax, data: Dict, colors: List[str]):
+    dates = [datetime.strptime(d, '%Y-%m-%d') for d in data['dates']]
+    ax.plot(dates, data['counts'], label='Daily Appointments', color=colors[0], alpha=0.7)
+    ax.plot(dates, data['moving_average'], label='7-Day Moving Average', color=colors[1], linewidth=2)
+    ax.set_title(f"Appointment Trends (Last {max(len(dates) - 1, 1)} Days)")
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Number of Appointments')
+    ax.legend()
+    ax.grid(True, alpha=0.3)
+    fig.autofmt_xdate()
+
+def _draw_service_popularity(fig, ax, data: Dict, colors: List[str]):
+    services = list(data.keys())
+    counts = list(data.values())
+    bars = ax.bar(services, counts, color=colors[:len(services)])
+    ax.set_title('Service Popularity')
+    ax.set_xlabel('Service')
+    ax.set_ylabel('Number of Appointments')
+    ax.tick_params(axis='x', rotation=45)
+    
+    # Add value labels on bars
+    for bar, count in zip(bars, counts):
+        ax.text(bar.get_x() + bar.get_width()/2, bar.get_height() + 0.1,
+               str(count), ha='center', va='bottom')
+
+def _draw_age_distribution(fig, ax, data: Dict, colors: List[str]):
+    age_groups = list(data.keys())
+    counts = list(data.values())
+    ax.pie(counts, labels=age_groups, autopct='%1.1f%%', colors=colors[:len(age_groups)])
+    ax.set_title('Age Distribution')
+
+def _draw_time_series(fig, ax, data: Dict, colors: List[str]):
+    dates = [datetime.strptime(d, '%Y-%m-%d') for d in data['dates']]
+    ax.plot(dates, data['counts'], color=colors[0])
+    ax.set_title('Appointment Trends Over Time')
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Number of Appointments')
+    ax.tick_params(axis='x', rotation=45)
+
+def _draw_heatmap(fig, ax, data: Dict, colors: List[str]):
+    import seaborn as sns
+    sns.heatmap(data['values'], xticklabels=data['columns'], yticklabels=data['index'],
+                annot=True, fmt='d', cmap='YlOrRd', ax=ax)
+    ax.set_title('Appointment Heatmap: Day vs Hour')
+    ax.set_xlabel('Hour of Day')
+    ax.set_ylabel('Day of Week')
+
+CHARTS: Dict[str, Callable] = {
+    'appointment_trends': _draw_appointment_trends,
+    'service_popularity': _draw_service_popularity,
+    'age_distribution': _draw_age_distribution,
+    'time_series': _draw_time_series,
+    'heatmap': _draw_heatmap
+}
+
+def render_chart(kind: str, data: Dict, options: Dict, fmt: str = 'png') -> bytes:
+    """Draw one chart with the object-oriented Figure API; runs in a pool worker, touches no global pyplot state"""
+    from matplotlib.figure import Figure
+    
+    fig = Figure(figsize=tuple(options['figsize']))
+    ax = fig.subplots()
+    CHARTS[kind](fig, ax, data, options.get('colors', COLORS))
+    fig.tight_layout()
+    
+    buffer = BytesIO()
+    fig.savefig(buffer, format=fmt, dpi=options['dpi'], bbox_inches='tight')
+    return buffer.getvalue()
+
+class ChartRenderer:
+    """Renders charts in a process pool and keeps the images in the shared cache by content hash
+    
+    The key covers the chart type, the input data, the preset and the format, so a chart is
+    rendered once per distinct input; concurrent requests for the same chart share one render.
+    """
+    
+    def __init__(self, prefix: str = 'chart'):
+        self.prefix = prefix
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Future] = {}
+    
+    def options(self, preset: str = None) -> Dict:
+        """Figure size and dpi for a named preset"""
+        presets = config_value('CHART_PRESETS')
+        preset = preset or config_value('CHART_DEFAULT_PRESET')
+        if preset not in presets:
+            raise ValueError(f"Unknown chart preset: {preset}")
+        return dict(presets[preset], colors=COLORS)
+    
+    def digest(self, kind: str, data: Dict, preset: str = None, fmt: str = 'png') -> str:
+        """Content hash identifying the rendered image"""
+        payload = json.dumps([kind, data, self.options(preset), fmt], sort_keys=True, default=str, separators=(',', ':'))
+        return hashlib.sha256(payload.encode()).hexdigest()
+    
+    def _pool(self) -> ProcessPoolExecutor:
+        # A forked web worker must not reuse its parent's pool
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ProcessPoolExecutor(
+                max_workers=config_value('CHART_RENDER_WORKERS'),
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            self._executor_pid = os.getpid()
+        return self._executor
+    
+    def _submit(self, *args) -> Future:
+        try:
+            return self._pool().submit(render_chart, *args)
+        except BrokenProcessPool:
+            logger.error("Chart rendering pool broke; starting a new one")
+            self._executor = None
+            return self._pool().submit(render_chart, *args)
+    
+    def render(self, kind: str, data: Dict, preset: str = None, fmt: str = 'png') -> bytes:
+        """Rendered image bytes, from the cache when this exact chart was drawn before"""
+        if kind not in CHARTS:
+            raise ValueError(f"Unknown chart type: {kind}")
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported chart format: {fmt}")
+        
+        digest = self.digest(kind, data, preset, fmt)
+        key = f"{self.prefix}:{digest}"
+        image = cache.get(key)
+        if image is not None:
+            return image
+        
+        options = self.options(preset)
+        if not config_value('CHART_RENDER_WORKERS'):
+            image = render_chart(kind, data, options, fmt)
+        else:
+            with self._lock:
+                future = self._pending.get(digest)
+                owner = future is None
+                if owner:
+                    future = self._submit(kind, data, options, fmt)
+                    self._pending[digest] = future
+            try:
+                image = future.result(timeout=config_value('CHART_RENDER_TIMEOUT'))
+            finally:
+                if owner:
+                    with self._lock:
+                        self._pending.pop(digest, None)
+        
+        cache.set(key, image, timeout=config_value('CHART_CACHE_TIMEOUT'))
+        return image
+    
+    def render_base64(self, kind: str, data: Dict, preset: str = None, fmt: str = 'png') -> str:
+        return base64.b64encode(self.render(kind, data, preset, fmt)).decode()
+
+# Initialize the chart renderer
+chart_renderer = ChartRenderer()
@@ -1,13 +1,14 @@
-import pandas as pd
-import numpy as np
 from datetime import datetime, date, timedelta
-from typing import Dict, List, Tuple, Optional
+from typing import IO, Dict, List, Tuple, Optional
 from .models import db, User, Appointment, MedicalRecord, DentalHistory, Service, Notification
+from .rollups import daily_appointment_counts
+from .charts import chart_renderer
+from .lazy import lazy_import
+from .exports import ExportSheet, export_engine, query_rows
 import json
-import matplotlib.pyplot as plt
-import seaborn as sns
-from io import BytesIO
-import base64
+
+# Loaded on first use so booting the app and CLI commands skip the scientific stack
+np = lazy_import('numpy')
 
 class DataProcessor:
     """Advanced data processing and analytics for dental clinic"""
@@ -20,23 +21,16 @@ class DataProcessor:
         end_date = date.today()
         start_date = end_date - timedelta(days=days)
         
-        # Get appointments in date range
-        appointments = Appointment.query.filter(
-            Appointment.date >= start_date,
-            Appointment.date <= end_date
-        ).all()
+        # Per-day totals from the maintained rollup
+        counts_by_date = daily_appointment_counts(start_date, end_date, include_deleted=True)
         
         # Create daily counts
         daily_counts = {}
         current_date = start_date
         while current_date <= end_date:
-            daily_counts[current_date] = 0
+            daily_counts[current_date] = counts_by_date.get(current_date, 0)
             current_date += timedelta(days=1)
         
-        for apt in appointments:
-            if apt.date in daily_counts:
-                daily_counts[apt.date] += 1
-        
         # Calculate trends
         dates = list(daily_counts.keys())
         counts = list(daily_counts.values())
@@ -108,32 +102,23 @@ class DataProcessor:
     def service_analysis(self) -> Dict:
         """Analyze service patterns and profitability"""
         services = Service.query.all()
-        appointments = Appointment.query.all()
+        appointment_counts = self._aggregate_appointments_by_service()
+        revenue_by_service = self._aggregate_revenue_by_procedure()
         
         service_stats = {}
         for service in services:
-            service_appointments = [apt for apt in appointments if apt.service_type == service.name]
+            total, completed, cancelled = appointment_counts.get(service.name, (0, 0, 0))
             
             service_stats[service.name] = {
-                'total_appointments': len(service_appointments),
-                'completed': len([apt for apt in service_appointments if apt.status == 'completed']),
-                'cancelled': len([apt for apt in service_appointments if apt.status == 'cancelled']),
+                'total_appointments': total,
+                'completed': completed,
+                'cancelled': cancelled,
                 'average_duration': service.duration or 60,
                 'base_cost': service.base_cost or 0,
                 'category': service.category,
-                'completion_rate': len([apt for apt in service_appointments if apt.status == 'completed']) / len(service_appointments) * 100 if service_appointments else 0
+                'completion_rate': completed / total * 100 if total else 0
             }
         
-        # Calculate revenue by service
-        dental_records = DentalHistory.query.all()
-        revenue_by_service = {}
-        
-        for record in dental_records:
-            service_name = record.procedure_type
-            if service_name not in revenue_by_service:
-                revenue_by_service[service_name] = 0
-            revenue_by_service[service_name] += record.cost or 0
-        
         # Add revenue to service stats
         for service_name, revenue in revenue_by_service.items():
             if service_name in service_stats:
@@ -147,28 +132,44 @@ class DataProcessor:
             'total_services': len(services)
         }
     
+    def _aggregate_appointments_by_service(self) -> Dict[str, Tuple[int, int, int]]:
+        """Count total, completed and cancelled appointments per service type in SQL"""
+        rows = db.session.query(
+            Appointment.service_type,
+            db.func.count(Appointment.id),
+            db.func.sum(db.case((Appointment.status == 'completed', 1), else_=0)),
+            db.func.sum(db.case((Appointment.status == 'cancelled', 1), else_=0))
+        ).group_by(Appointment.service_type).all()
+        
+        return {
+            service_type: (total, int(completed or 0), int(cancelled or 0))
+            for service_type, total, completed, cancelled in rows
+        }
+    
+    def _aggregate_revenue_by_procedure(self) -> Dict[str, float]:
+        """Sum dental procedure costs per procedure type in SQL"""
+        rows = db.session.query(
+            DentalHistory.procedure_type,
+            db.func.coalesce(db.func.sum(DentalHistory.cost), 0)
+        ).group_by(DentalHistory.procedure_type).all()
+        
+        return {procedure_type: revenue for procedure_type, revenue in rows}
+    
     def predict_appointment_demand(self, days_ahead: int = 30) -> Dict:
         """Predict appointment demand using simple forecasting"""
         # Get historical data
         end_date = date.today()
         start_date = end_date - timedelta(days=90)  # 3 months of data
         
-        appointments = Appointment.query.filter(
-            Appointment.date >= start_date,
-            Appointment.date <= end_date
-        ).all()
+        counts_by_date = daily_appointment_counts(start_date, end_date, include_deleted=True)
         
         # Create daily appointment counts
         daily_counts = {}
         current_date = start_date
         while current_date <= end_date:
-            daily_counts[current_date] = 0
+            daily_counts[current_date] = counts_by_date.get(current_date, 0)
             current_date += timedelta(days=1)
         
-        for apt in appointments:
-            if apt.date in daily_counts:
-                daily_counts[apt.date] += 1
-        
         counts = list(daily_counts.values())
         
         # Simple forecasting using moving average and trend
@@ -201,43 +202,86 @@ class DataProcessor:
                 'trend_direction': 'unknown'
             }
     
-    def generate_health_insights(self) -> Dict:
+    def generate_health_insights(self, top: int = 10) -> Dict:
         """Generate insights about patient health patterns"""
-        medical_records = MedicalRecord.query.all()
-        dental_history = DentalHistory.query.all()
-        
         # Analyze common medical conditions
-        conditions = {}
-        for record in medical_records:
-            if record.record_type == 'medical':
-                condition = record.title.lower()
-                conditions[condition] = conditions.get(condition, 0) + 1
+        conditions = self._top_counts(MedicalRecord.title, top, MedicalRecord.record_type == 'medical')
         
         # Analyze dental procedures
-        procedures = {}
-        for record in dental_history:
-            procedure = record.procedure_type.lower()
-            procedures[procedure] = procedures.get(procedure, 0) + 1
+        procedures = self._top_counts(DentalHistory.procedure_type, top)
         
         # Find correlations between conditions and procedures
-        correlations = {}
-        for user in User.query.all():
-            user_conditions = [r.title.lower() for r in medical_records if r.user_id == user.id and r.record_type == 'medical']
-            user_procedures = [r.procedure_type.lower() for r in dental_history if r.user_id == user.id]
-            
-            for condition in user_conditions:
-                for procedure in user_procedures:
-                    key = f"{condition} -> {procedure}"
-                    correlations[key] = correlations.get(key, 0) + 1
+        correlations = {
+            f"{condition_name} -> {procedure_name}": count
+            for condition_name, procedure_name, count in self._condition_procedure_pairs(top)
+        }
         
         return {
-            'common_conditions': dict(sorted(conditions.items(), key=lambda x: x[1], reverse=True)[:10]),
-            'common_procedures': dict(sorted(procedures.items(), key=lambda x: x[1], reverse=True)[:10]),
-            'condition_procedure_correlations': dict(sorted(correlations.items(), key=lambda x: x[1], reverse=True)[:10]),
-            'total_medical_records': len(medical_records),
-            'total_dental_procedures': len(dental_history)
+            'common_conditions': conditions,
+            'common_procedures': procedures,
+            'condition_procedure_correlations': correlations,
+            'total_medical_records': db.session.scalar(db.select(db.func.count(MedicalRecord.id))),
+            'total_dental_procedures': db.session.scalar(db.select(db.func.count(DentalHistory.id)))
         }
     
+    @staticmethod
+    def _largest(counts: Dict, top: int) -> List[Tuple]:
+        return sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:top]
+    
+    def _top_counts(self, key, top: int, *criteria) -> Dict[str, int]:
+        """Count rows per key in SQL and keep the `top` largest counts
+        
+        SQL groups by the exact value; case is folded here with str.lower(), because
+        SQLite's lower() only folds ASCII and would split non-Latin titles.
+        """
+        rows = db.session.execute(db.select(key, db.func.count()).where(*criteria).group_by(key)).all()
+        counts: Dict[str, int] = {}
+        for name, total in rows:
+            name = name.lower()
+            counts[name] = counts.get(name, 0) + total
+        return dict(self._largest(counts, top))
+    
+    def _condition_procedure_pairs(self, top: int) -> List[Tuple[str, str, int]]:
+        """Most frequent (condition, procedure) pairs across patients, counted in SQL
+        
+        Each patient contributes conditions x procedures pairs. Both sides are reduced
+        to per-patient counts first, so the join is over distinct (patient, name) rows
+        and each pair's total is the sum of the products of those counts. Pairs are
+        grouped by exact title and case-folded in Python, as in _top_counts().
+        """
+        per_user_conditions = db.select(
+            MedicalRecord.user_id.label('user_id'),
+            MedicalRecord.title.label('name'),
+            db.func.count().label('n')
+        ).where(MedicalRecord.record_type == 'medical').group_by(
+            MedicalRecord.user_id, MedicalRecord.title
+        ).subquery()
+        
+        per_user_procedures = db.select(
+            DentalHistory.user_id.label('user_id'),
+            DentalHistory.procedure_type.label('name'),
+            db.func.count().label('n')
+        ).group_by(
+            DentalHistory.user_id, DentalHistory.procedure_type
+        ).subquery()
+        
+        pairs = db.func.sum(per_user_conditions.c.n * per_user_procedures.c.n)
+        query = db.select(
+            per_user_conditions.c.name, per_user_procedures.c.name, pairs
+        ).join(
+            per_user_procedures, per_user_procedures.c.user_id == per_user_conditions.c.user_id
+        ).join(
+            User, User.id == per_user_conditions.c.user_id
+        ).group_by(
+            per_user_conditions.c.name, per_user_procedures.c.name
+        )
+        
+        counts: Dict[Tuple[str, str], int] = {}
+        for condition, procedure, count in db.session.execute(query).all():
+            pair = (condition.lower(), procedure.lower())
+            counts[pair] = counts.get(pair, 0) + int(count)
+        return [(condition, procedure, count) for (condition, procedure), count in self._largest(counts, top)]
+    
     def create_performance_report(self) -> Dict:
         """Create comprehensive performance report"""
         # Get all the analytics
@@ -266,20 +310,21 @@ class DataProcessor:
             'service_analysis': service_analysis,
             'demand_prediction': demand_prediction,
             'health_insights': health_insights,
-            'recommendations': self.generate_recommendations()
+            'recommendations': self.generate_recommendations(appointment_trends, service_analysis, demographics)
         }
     
-    def generate_recommendations(self) -> List[str]:
-        """Generate business recommendations based on data analysis"""
+    def generate_recommendations(self, trends: Dict = None, service_analysis: Dict = None,
+                                 demographics: Dict = None) -> List[str]:
+        """Generate business recommendations based on data analysis, reusing any results already computed"""
         recommendations = []
         
         # Analyze appointment trends
-        trends = self.get_appointment_trends()
+        trends = trends or self.get_appointment_trends()
         if trends['average_daily'] < 5:
             recommendations.append("Consider implementing marketing campaigns to increase appointment bookings")
         
         # Analyze service popularity
-        service_analysis = self.service_analysis()
+        service_analysis = service_analysis or self.service_analysis()
         if service_analysis['service_statistics']:
             most_popular = service_analysis['most_popular_service']
             least_popular = min(service_analysis['service_statistics'].items(), key=lambda x: x[1]['total_appointments'])[0]
@@ -293,101 +338,75 @@ class DataProcessor:
             recommendations.append(f"Investigate reasons for low completion rates in: {', '.join(low_completion_services)}")
         
         # Analyze demographics
-        demographics = self.analyze_user_demographics()
+        demographics = demographics or self.analyze_user_demographics()
         if demographics['average_age'] > 50:
             recommendations.append("Consider services and marketing targeted at younger demographics")
         
         return recommendations
     
-    def export_to_excel(self, report_data: Dict) -> BytesIO:
-        """Export report data to Excel format"""
-        # Create Excel writer
-        output = BytesIO()
-        
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            # KPI Summary
-            kpi_df = pd.DataFrame([report_data['kpis']])
-            kpi_df.to_excel(writer, sheet_name='KPI Summary', index=False)
-            
-            # Appointment Trends
-            trends_df = pd.DataFrame({
-                'Date': report_data['appointment_trends']['dates'],
-                'Appointments': report_data['appointment_trends']['counts'],
-                'Moving Average': report_data['appointment_trends']['moving_average']
-            })
-            trends_df.to_excel(writer, sheet_name='Appointment Trends', index=False)
-            
-            # Service Analysis
-            service_data = []
-            for service_name, stats in report_data['service_analysis']['service_statistics'].items():
-                service_data.append({
-                    'Service': service_name,
-                    'Total Appointments': stats['total_appointments'],
-                    'Completed': stats['completed'],
-                    'Cancelled': stats['cancelled'],
-                    'Completion Rate (%)': stats['completion_rate'],
-                    'Total Revenue': stats.get('total_revenue', 0),
-                    'Category': stats['category']
-                })
-            service_df = pd.DataFrame(service_data)
-            service_df.to_excel(writer, sheet_name='Service Analysis', index=False)
-            
-            # Demographics
-            demo_data = []
-            for age_group, count in report_data['demographics']['age_distribution'].items():
-                demo_data.append({'Age Group': age_group, 'Count': count})
-            demo_df = pd.DataFrame(demo_data)
-            demo_df.to_excel(writer, sheet_name='Demographics', index=False)
-        
-        output.seek(0)
-        return output
+    def report_sheets(self, report_data: Dict) -> List[ExportSheet]:
+        """Performance report as export sheets; the appointment detail sheet is streamed from the database"""
+        kpis = report_data['kpis']
+        trends = report_data['appointment_trends']
+        services = report_data['service_analysis']['service_statistics']
+        
+        return [
+            ExportSheet('KPI Summary', list(kpis.keys()), [list(kpis.values())]),
+            ExportSheet('Appointment Trends', ['Date', 'Appointments', 'Moving Average'],
+                        zip(trends['dates'], trends['counts'], trends['moving_average'])),
+            ExportSheet('Service Analysis',
+                        ['Service', 'Total Appointments', 'Completed', 'Cancelled', 'Completion Rate (%)', 'Total Revenue', 'Category'],
+                        [(name, stats['total_appointments'], stats['completed'], stats['cancelled'],
+                          stats['completion_rate'], stats.get('total_revenue', 0), stats['category'])
+                         for name, stats in services.items()]),
+            ExportSheet('Demographics', ['Age Group', 'Count'], report_data['demographics']['age_distribution'].items()),
+            ExportSheet('Appointments', ['ID', 'Date', 'Time', 'Service', 'Status', 'Duration', 'Cost', 'Patient ID'],
+                        query_rows(db.select(
+                            Appointment.id, Appointment.date, Appointment.time, Appointment.service_type,
+                            Appointment.status, Appointment.duration, Appointment.cost, Appointment.user_id
+                        ).where(Appointment.is_deleted.isnot(True)).order_by(Appointment.date.desc(), Appointment.time.desc())))
+        ]
     
-    def create_visualization(self, data_type: str, data: Dict) -> str:
+    def export_to_excel(self, report_data: Dict) -> IO[bytes]:
+        """Export report data to Excel format, written row by row into a temporary file"""
+        return export_engine.xlsx_file(self.report_sheets(report_data))
+    
+    def create_visualization(self, data_type: str, data: Dict, preset: str = None) -> str:
         """Create data visualizations and return as base64 encoded image"""
-        plt.style.use('default')
-        fig, ax = plt.subplots(figsize=(10, 6))
-        
-        if data_type == 'appointment_trends':
-            dates = [datetime.strptime(d, '%Y-%m-%d') for d in data['dates']]
-            ax.plot(dates, data['counts'], label='Daily Appointments', color='#007bff', alpha=0.7)
-            ax.plot(dates, data['moving_average'], label='7-Day Moving Average', color='#28a745', linewidth=2)
-            ax.set_title('Appointment Trends (Last 30 Days)')
-            ax.set_xlabel('Date')
-            ax.set_ylabel('Number of Appointments')
-            ax.legend()
-            ax.grid(True, alpha=0.3)
-        
-        elif data_type == 'service_popularity':
-            services = list(data.keys())
-            counts = list(data.values())
-            bars = ax.bar(services, counts, color=self.colors[:len(services)])
-            ax.set_title('Service Popularity')
-            ax.set_xlabel('Service')
-            ax.set_ylabel('Number of Appointments')
-            ax.tick_params(axis='x', rotation=45)
-            
-            # Add value labels on bars
-            for bar, count in zip(bars, counts):
-                ax.text(bar.get_x() + bar.get_width()/2, bar.get_height() + 0.1,
-                       str(count), ha='center', va='bottom')
-        
-        elif data_type == 'age_distribution':
-            age_groups = list(data.keys())
-            counts = list(data.values())
-            ax.pie(counts, labels=age_groups, autopct='%1.1f%%', colors=self.colors[:len(age_groups)])
-            ax.set_title('Age Distribution')
-        
-        plt.tight_layout()
-        
-        # Convert to base64
-        buffer = BytesIO()
-        plt.savefig(buffer, format='png', dpi=300, bbox_inches='tight')
-        buffer.seek(0)
-        image_png = buffer.getvalue()
-        buffer.close()
-        plt.close()
-        
-        return base64.b64encode(image_png).decode()
+        return chart_renderer.render_base64(data_type, data, preset)
+    
+    def chart_input(self, chart_type: str, report: Dict = None) -> Dict:
+        """Raw data behind a chart, taken from a precomputed performance report when one is given"""
+        report = report or {}
+        if chart_type == 'appointment_trends':
+            return report.get('appointment_trends') or self.get_appointment_trends()
+        if chart_type == 'service_popularity':
+            analysis = report.get('service_analysis') or self.service_analysis()
+            return {name: stats['total_appointments'] for name, stats in analysis['service_statistics'].items()}
+        if chart_type == 'age_distribution':
+            return (report.get('demographics') or self.analyze_user_demographics())['age_distribution']
+        raise ValueError(f"Unknown chart type: {chart_type}")
+    
+    def chart_series(self, chart_type: str, data: Dict) -> Dict:
+        """Compact columnar series (shared labels, one value array per series) for client-side charts"""
+        if chart_type == 'appointment_trends':
+            return {
+                'chart': chart_type,
+                'kind': 'line',
+                'labels': data['dates'],
+                'series': [
+                    {'name': 'Daily Appointments', 'values': [int(count) for count in data['counts']]},
+                    {'name': '7-Day Moving Average', 'values': [round(float(value), 2) for value in data['moving_average']]}
+                ]
+            }
+        
+        kind = 'bar' if chart_type == 'service_popularity' else 'pie'
+        return {
+            'chart': chart_type,
+            'kind': kind,
+            'labels': list(data.keys()),
+            'series': [{'name': 'Appointments' if kind == 'bar' else 'Patients', 'values': [int(v) for v in data.values()]}]
+        }
 
 # Initialize global instance
 data_processor = DataProcessor() 
\ No newline at end of file
@@ -10,6 +10,11 @@ from .utils import scheduler, analytics, record_manager, reminder_system, data_e
 from .data_processor import data_processor
 from .advanced_analytics import advanced_analytics
 from .realtime_service import get_realtime_service
+from .response_cache import cache_response
+from .rate_limiter import rate_limit
+from .exports import export_engine
+from .notifications import create_notifications
+from .export_jobs import ExportQueueFull, export_jobs
 from functools import wraps
 import logging
 
@@ -19,41 +24,6 @@ logger = logging.getLogger(__name__)
 
 bp = Blueprint('enhanced', __name__)
 
-# Rate limiting decorator
-def rate_limit(limit=100, window=3600):
-    """Rate limiting decorator"""
-    def decorator(f):
-        @wraps(f)
-        def wrapped(*args, **kwargs):
-            key = f"rate_limit:{request.remote_addr}:{f.__name__}"
-            current = current_app.cache.get(key) or 0
-            
-            if current >= limit:
-                return jsonify({'error': 'Rate limit exceeded'}), 429
-            
-            current_app.cache.set(key, current + 1, timeout=window)
-            return f(*args, **kwargs)
-        return wrapped
-    return decorator
-
-# Cache decorator
-def cache_response(timeout=300):
-    """Cache response decorator"""
-    def decorator(f):
-        @wraps(f)
-        def wrapped(*args, **kwargs):
-            cache_key = f"cache:{f.__name__}:{request.args.get('cache_key', 'default')}"
-            cached = current_app.cache.get(cache_key)
-            
-            if cached:
-                return cached
-            
-            result = f(*args, **kwargs)
-            current_app.cache.set(cache_key, result, timeout=timeout)
-            return result
-        return wrapped
-    return decorator
-
 # Admin required decorator
 def admin_required(f):
     @wraps(f)
@@ -92,21 +62,19 @@ def validate_password(password):
 def create_notification(user_id, title, message, notification_type='general', priority='normal', action_url=None):
     """Create notification with enhanced features"""
     try:
-        notification = Notification(
-            user_id=user_id,
-            title=title,
-            message=message,
-            notification_type=notification_type,
-            priority=priority,
-            action_url=action_url
-        )
-        db.session.add(notification)
-        db.session.commit()
-        
-        # Send real-time notification
+        # The real-time service stores the notification itself before pushing it
         realtime_service = get_realtime_service()
         if realtime_service:
             realtime_service.send_notification(user_id, title, message, notification_type, priority, action_url)
+        else:
+            create_notifications([{
+                'user_id': user_id,
+                'title': title,
+                'message': message,
+                'notification_type': notification_type,
+                'priority': priority,
+                'action_url': action_url
+            }])
         
         logger.info(f"Notification created for user {user_id}: {title}")
         return True
@@ -117,7 +85,7 @@ def create_notification(user_id, title, message, notification_type='general', pr
 # Enhanced Dashboard Route
 @bp.route('/enhanced-dashboard')
 @login_required
-@cache_response(timeout=60)
+@cache_response(timeout=60, tags=('appointment', 'medical_record', 'notification'))
 def enhanced_dashboard():
     """Enhanced dashboard with real-time data and ML insights"""
     try:
@@ -254,7 +222,7 @@ def get_recent_activities(user_id, limit=10):
 @bp.route('/enhanced-analytics')
 @login_required
 @admin_required
-@cache_response(timeout=300)
+@cache_response(timeout=300, per_user=False, tags=('appointment', 'user', 'medical_record', 'dental_history', 'service'))
 def enhanced_analytics():
     """Enhanced analytics with ML insights"""
     try:
@@ -407,21 +375,29 @@ def enhanced_book_appointment():
         if existing_appointment:
             return jsonify({'error': 'You already have an appointment on this date'}), 400
         
-        # Create appointment
-        appointment = Appointment(
-            user_id=current_user.id,
-            name=current_user.full_name,
-            email=current_user.email,
-            phone=current_user.phone,
-            date=appointment_date,
-            time=datetime.strptime(appointment_time, '%H:%M').time(),
-            service_type=service_type,
-            message=notes,
-            status='scheduled'
-        )
-        
-        db.session.add(appointment)
-        db.session.commit()
+        start_time = datetime.strptime(appointment_time, '%H:%M').time()
+        duration = scheduler.appointment_durations.get(service_type, 60)
+        candidates = scheduler.free_resources(appointment_date, start_time, duration)
+        
+        # Create appointment on a free chair; the slot reservation rows inserted with it reject overlaps atomically
+        appointment = None
+        if candidates:
+            appointment = scheduler.create_booking(
+                candidates,
+                user_id=current_user.id,
+                name=current_user.full_name,
+                email=current_user.email,
+                phone=current_user.phone,
+                date=appointment_date,
+                time=start_time,
+                service_type=service_type,
+                duration=duration,
+                message=notes,
+                status='scheduled'
+            )
+        
+        if appointment is None:
+            return jsonify({'error': 'Selected time slot is no longer available'}), 409
         
         # Create notification
         create_notification(
@@ -462,17 +438,17 @@ def enhanced_health_monitor():
         # Get user's health data
         medical_records = MedicalRecord.query.filter_by(
             user_id=current_user.id,
-            is_deleted == False
+            is_deleted=False
         ).all()
         
         dental_history = DentalHistory.query.filter_by(
             user_id=current_user.id,
-            is_deleted == False
+            is_deleted=False
         ).all()
         
         appointments = Appointment.query.filter_by(
             user_id=current_user.id,
-            is_deleted == False
+            is_deleted=False
         ).all()
         
         # Calculate health metrics
@@ -648,24 +624,34 @@ def enhanced_admin_real_time_stats():
 @login_required
 @rate_limit(limit=5, window=3600)
 def enhanced_export_health_report():
-    """Export comprehensive health report"""
+    """Export comprehensive health report as Excel (or ?format=csv, ndjson, json; ?async=1 queues a job)"""
+    if request.args.get('async', type=int):
+        try:
+            job = export_jobs.submit(current_user, 'health_report', request.args.get('format', 'xlsx'))
+        except ExportQueueFull as e:
+            return jsonify({'error': str(e)}), 429
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        job['status_url'] = url_for('main.get_export_job', job_id=job['id'])
+        return jsonify(job), 202
+    
     try:
-        # Generate comprehensive health report
-        report_data = generate_health_report(current_user.id)
-        
-        # Export to Excel
-        excel_file = data_exporter.export_health_report(report_data)
+        summary = {
+            'Name': current_user.full_name,
+            'Email': current_user.email,
+            'Phone': current_user.phone,
+            'Date of Birth': current_user.date_of_birth,
+            'Age': current_user.get_age(),
+            'Health Score': calculate_health_score(current_user.id),
+            'Generated At': datetime.utcnow()
+        }
         
         # Create filename with timestamp
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"health_report_{current_user.username}_{timestamp}.xlsx"
+        filename = f"health_report_{current_user.username}_{timestamp}"
         
-        return send_file(
-            excel_file,
-            as_attachment=True,
-            download_name=filename,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
+        return export_engine.response(data_exporter.health_report_sheets(current_user.id, summary),
+                                      request.args.get('format', 'xlsx'), filename)
     
     except Exception as e:
         logger.error(f"Error exporting health report: {str(e)}")
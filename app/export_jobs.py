@@ -0,0 +1,161 @@
+import logging
+import os
+import threading
+import time as clock
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from .extensions import cache, config_value, db
+from .exports import ExportSheet, export_engine
+from .models import User
+from .realtime_service import get_realtime_service
+
+logger = logging.getLogger(__name__)
+
+class ExportQueueFull(Exception):
+    """Raised when EXPORT_MAX_PENDING_JOBS exports are already queued or running"""
+
+class ExportJobQueue:
+    """Runs report exports in a bounded background pool and keeps the files on local disk
+    
+    Job state lives in the shared cache so any worker can answer a poll; progress is also
+    pushed to the owner's socket room. Finished files are removed after EXPORT_ARTIFACT_TTL.
+    """
+    
+    def __init__(self, prefix: str = 'export:job'):
+        self.prefix = prefix
+        self.builders: Dict[str, Tuple[Callable[[User], Tuple[List[ExportSheet], str]], bool]] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._app = None
+    
+    def register(self, kind: str, build: Callable[[User], Tuple[List[ExportSheet], str]], admin_only: bool = False):
+        """Add an export kind; build(user) returns the sheets and a base file name"""
+        self.builders[kind] = (build, admin_only)
+    
+    def init_app(self, app):
+        self._app = app
+    
+    def artifact_dir(self) -> str:
+        directory = config_value('EXPORT_ARTIFACT_DIR', self._app) or os.path.join(self._app.instance_path, 'exports')
+        os.makedirs(directory, exist_ok=True)
+        return directory
+    
+    def _key(self, job_id: str) -> str:
+        return f"{self.prefix}:{job_id}"
+    
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=config_value('EXPORT_WORKERS', self._app),
+                                                thread_name_prefix='export')
+            self._executor_pid = os.getpid()
+        return self._executor
+    
+    def get(self, job_id: str) -> Optional[Dict]:
+        return cache.get(self._key(job_id))
+    
+    def _save(self, job: Dict):
+        cache.set(self._key(job['id']), job, timeout=config_value('EXPORT_ARTIFACT_TTL', self._app))
+        service = get_realtime_service()
+        if service is not None:
+            service.send_export_progress(job['user_id'], self.public(job))
+    
+    def public(self, job: Dict) -> Dict:
+        """Job state as returned to clients"""
+        return {key: value for key, value in job.items() if key != 'path'}
+    
+    def submit(self, user: User, kind: str, fmt: str) -> Dict:
+        """Queue an export for user and return its initial state"""
+        if kind not in self.builders:
+            raise ValueError(f"Unknown export: {kind}")
+        if self.builders[kind][1] and not user.is_admin:
+            raise PermissionError('Admin access required')
+        export_engine.check_format(fmt)
+        
+        with self._lock:
+            if self._pending >= config_value('EXPORT_MAX_PENDING_JOBS', self._app):
+                raise ExportQueueFull('Too many exports in progress, try again shortly')
+            self._pending += 1
+        
+        job = {
+            'id': uuid.uuid4().hex,
+            'kind': kind,
+            'format': fmt,
+            'user_id': user.id,
+            'status': 'queued',
+            'rows': 0,
+            'filename': None,
+            'error': None,
+            'created_at': datetime.utcnow().isoformat(),
+            'finished_at': None
+        }
+        state = self.public(job)
+        self._save(job)
+        try:
+            self._pool().submit(self._run, job)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        self.cleanup()
+        return state
+    
+    def _counted(self, job: Dict, rows: Iterable) -> Iterator:
+        interval = config_value('EXPORT_PROGRESS_INTERVAL', self._app)
+        for row in rows:
+            yield row
+            job['rows'] += 1
+            if job['rows'] % interval == 0:
+                self._save(job)
+    
+    def _run(self, job: Dict):
+        with self._app.app_context():
+            path = os.path.join(self.artifact_dir(), f"{job['id']}.{job['format']}")
+            partial = f"{path}.part"
+            try:
+                job['status'] = 'running'
+                self._save(job)
+                
+                build = self.builders[job['kind']][0]
+                sheets, filename = build(db.session.get(User, job['user_id']))
+                sheets = [ExportSheet(sheet.name, sheet.columns, self._counted(job, sheet.rows)) for sheet in sheets]
+                with open(partial, 'wb') as output:
+                    export_engine.write(sheets, job['format'], output)
+                os.replace(partial, path)
+                
+                job.update(status='done', path=path, filename=f"{filename}.{job['format']}")
+            except Exception as e:
+                logger.error(f"Error running export job {job['id']}: {str(e)}")
+                job.update(status='failed', error=str(e))
+                if os.path.exists(partial):
+                    os.remove(partial)
+            finally:
+                job['finished_at'] = datetime.utcnow().isoformat()
+                self._save(job)
+                db.session.remove()
+                with self._lock:
+                    self._pending -= 1
+    
+    def artifact(self, job: Dict) -> Optional[str]:
+        """Path of a finished export, if it is still on disk"""
+        path = job.get('path')
+        if job['status'] == 'done' and path and os.path.exists(path):
+            return path
+        return None
+    
+    def cleanup(self):
+        """Delete artifacts older than EXPORT_ARTIFACT_TTL"""
+        cutoff = clock.time() - config_value('EXPORT_ARTIFACT_TTL', self._app)
+        with os.scandir(self.artifact_dir()) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file() and entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                except OSError:
+                    continue
+
+# Initialize the export job queue
+export_jobs = ExportJobQueue()
@@ -0,0 +1,156 @@
+import csv
+import io
+import json
+import tempfile
+from datetime import date, datetime, time
+from typing import Any, Callable, Dict, IO, Iterable, Iterator, List, NamedTuple, Sequence
+from flask import Response, send_file, stream_with_context
+from .extensions import config_value, db
+
+MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+}
+
+# Rows buffered between two chunks of a streamed response
+CHUNK_ROWS = 500
+
+class ExportSheet(NamedTuple):
+    """One table of an export; rows may be a lazy iterator such as query_rows()"""
+    name: str
+    columns: List[str]
+    rows: Iterable[Sequence[Any]]
+
+def _plain(value: Any) -> Any:
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    return value
+
+def query_rows(statement, limit: int = None) -> Iterator[tuple]:
+    """Rows of a select() fetched EXPORT_BATCH_SIZE at a time through a server-side cursor, capped at EXPORT_MAX_RECORDS"""
+    limit = config_value('EXPORT_MAX_RECORDS') if limit is None else limit
+    if limit:
+        statement = statement.limit(limit)
+    result = db.session.execute(statement.execution_options(yield_per=config_value('EXPORT_BATCH_SIZE')))
+    for row in result:
+        yield tuple(row)
+
+class ExportEngine:
+    """Writes export sheets as streamed CSV/NDJSON/JSON responses or a write-only xlsx workbook on disk
+    
+    Rows are consumed one at a time from each sheet, so memory stays flat however many
+    rows a query returns.
+    """
+    
+    def formats(self) -> List[str]:
+        """Formats that are both enabled in EXPORT_FORMATS and have a writer"""
+        return [fmt for fmt in config_value('EXPORT_FORMATS') if fmt in MIMETYPES]
+    
+    def check_format(self, fmt: str):
+        if fmt not in self.formats():
+            raise ValueError(f"Unsupported export format: {fmt} (available: {', '.join(self.formats())})")
+    
+    def csv_chunks(self, sheets: List[ExportSheet]) -> Iterator[str]:
+        """CSV text; with several sheets each section starts with its name and they are separated by a blank row"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        
+        def drain() -> str:
+            chunk = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            return chunk
+        
+        for index, sheet in enumerate(sheets):
+            if len(sheets) > 1:
+                if index:
+                    writer.writerow([])
+                writer.writerow([sheet.name])
+            writer.writerow(sheet.columns)
+            for count, row in enumerate(sheet.rows, 1):
+                writer.writerow([_plain(value) for value in row])
+                if count % CHUNK_ROWS == 0:
+                    yield drain()
+            yield drain()
+    
+    def ndjson_chunks(self, sheets: List[ExportSheet]) -> Iterator[str]:
+        """One JSON object per line, tagged with its sheet name"""
+        lines = []
+        for sheet in sheets:
+            for row in sheet.rows:
+                record = {'sheet': sheet.name}
+                record.update(zip(sheet.columns, (_plain(value) for value in row)))
+                lines.append(json.dumps(record, default=str))
+                if len(lines) >= CHUNK_ROWS:
+                    yield '\n'.join(lines) + '\n'
+                    lines = []
+        if lines:
+            yield '\n'.join(lines) + '\n'
+    
+    def json_chunks(self, sheets: List[ExportSheet]) -> Iterator[str]:
+        """A single JSON object mapping each sheet name to its list of row objects, written incrementally"""
+        yield '{'
+        for index, sheet in enumerate(sheets):
+            yield f"{',' if index else ''}{json.dumps(sheet.name)}:["
+            lines, separator = [], ''
+            for row in sheet.rows:
+                lines.append(json.dumps(dict(zip(sheet.columns, (_plain(value) for value in row))), default=str))
+                if len(lines) >= CHUNK_ROWS:
+                    yield separator + ','.join(lines)
+                    lines, separator = [], ','
+            if lines:
+                yield separator + ','.join(lines)
+            yield ']'
+        yield '}'
+    
+    def write_xlsx(self, sheets: List[ExportSheet], output: IO[bytes]) -> IO[bytes]:
+        """Write a write-only openpyxl workbook (rows go straight to disk) into output"""
+        from openpyxl import Workbook
+        
+        workbook = Workbook(write_only=True)
+        for sheet in sheets:
+            worksheet = workbook.create_sheet(title=sheet.name[:31])
+            worksheet.append(sheet.columns)
+            for row in sheet.rows:
+                worksheet.append(list(row))
+        workbook.save(output)
+        output.seek(0)
+        return output
+    
+    def xlsx_file(self, sheets: List[ExportSheet]) -> IO[bytes]:
+        """Workbook in an anonymous temp file that disappears once it is closed"""
+        return self.write_xlsx(sheets, tempfile.TemporaryFile(suffix='.xlsx'))
+    
+    def text_chunks(self, sheets: List[ExportSheet], fmt: str) -> Iterator[str]:
+        writers: Dict[str, Callable[[List[ExportSheet]], Iterator[str]]] = {
+            'csv': self.csv_chunks,
+            'ndjson': self.ndjson_chunks,
+            'json': self.json_chunks
+        }
+        return writers[fmt](sheets)
+    
+    def write(self, sheets: List[ExportSheet], fmt: str, output: IO[bytes]) -> IO[bytes]:
+        """Write the sheets in any enabled format into a binary file"""
+        self.check_format(fmt)
+        if fmt == 'xlsx':
+            return self.write_xlsx(sheets, output)
+        for chunk in self.text_chunks(sheets, fmt):
+            output.write(chunk.encode())
+        return output
+    
+    def response(self, sheets: List[ExportSheet], fmt: str, filename: str) -> Response:
+        """Download response for the sheets; text formats are streamed chunk by chunk"""
+        self.check_format(fmt)
+        download_name = f"{filename}.{fmt}"
+        if fmt == 'xlsx':
+            return send_file(self.xlsx_file(sheets), as_attachment=True, download_name=download_name,
+                             mimetype=MIMETYPES[fmt])
+        
+        response = Response(stream_with_context(self.text_chunks(sheets, fmt)), mimetype=MIMETYPES[fmt])
+        response.headers['Content-Disposition'] = f'attachment; filename={download_name}'
+        return response
+
+# Initialize the export engine
+export_engine = ExportEngine()
@@ -1,7 +1,19 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
+from flask_caching import Cache
+from flask import current_app, has_app_context
+from config import Config
 
 db = SQLAlchemy()
 migrate = Migrate()
-login_manager = LoginManager() 
\ No newline at end of file
+login_manager = LoginManager()
+cache = Cache()
+
+def config_value(name: str, app=None):
+    """A setting from app (the current app by default), falling back to the Config default outside an app"""
+    if app is None and has_app_context():
+        app = current_app
+    if app is None:
+        return getattr(Config, name)
+    return app.config.get(name, getattr(Config, name))
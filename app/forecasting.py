@@ -0,0 +1,89 @@
+from __future__ import annotations
+from typing import Any, List
+from .lazy import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+class RecursiveForecaster:
+    """Multi-step recursive forecaster for the daily demand model
+    
+    Feature rows are written into one preallocated float32 matrix and the lag and
+    rolling-window statistics are kept in a ring buffer that is updated in place
+    with each new prediction, so a step costs one tree traversal per estimator and
+    no DataFrame construction. Calendar features for every horizon are computed in
+    a single vectorized pass, which keeps 365+ day horizons cheap.
+    """
+    
+    WINDOW = 7
+    
+    def __init__(self, model: Any, features: List[str]):
+        self.model = model
+        self.features = features
+        # Tree ensembles are evaluated estimator by estimator with input checks disabled
+        self.estimators = getattr(model, 'estimators_', None)
+    
+    def forecast(self, history: np.ndarray, last_date: pd.Timestamp, days_ahead: int) -> List[int]:
+        """Predict days_ahead daily counts following the observed history"""
+        if days_ahead <= 0:
+            return []
+        
+        history = np.asarray(history, dtype=np.float64)
+        window = np.empty(self.WINDOW, dtype=np.float64)
+        tail = history[-self.WINDOW:]
+        window[:] = tail.mean() if len(tail) else 0
+        window[self.WINDOW - len(tail):] = tail
+        head = 0  # index of the oldest value in the ring buffer
+        
+        running_sum = window.sum()
+        running_sq = np.square(window).sum()
+        
+        # Calendar features for all horizons at once
+        future_dates = pd.date_range(last_date + pd.Timedelta(days=1), periods=days_ahead, freq='D')
+        X = np.zeros((days_ahead, len(self.features)), dtype=np.float32)
+        column = {name: i for i, name in enumerate(self.features)}
+        if 'day_of_week' in column:
+            X[:, column['day_of_week']] = future_dates.weekday
+        if 'month' in column:
+            X[:, column['month']] = future_dates.month
+        if 'is_weekend' in column:
+            X[:, column['is_weekend']] = future_dates.weekday >= 5
+        
+        lag_1 = column.get('lag_1')
+        lag_7 = column.get('lag_7')
+        rolling_mean = column.get('rolling_mean_7')
+        rolling_std = column.get('rolling_std_7')
+        
+        predictions = np.empty(days_ahead, dtype=np.int64)
+        for step in range(days_ahead):
+            row = X[step:step + 1]
+            newest = window[(head - 1) % self.WINDOW]
+            if lag_1 is not None:
+                row[0, lag_1] = newest
+            if lag_7 is not None:
+                row[0, lag_7] = window[head]
+            if rolling_mean is not None:
+                row[0, rolling_mean] = running_sum / self.WINDOW
+            if rolling_std is not None:
+                variance = (running_sq - running_sum * running_sum / self.WINDOW) / (self.WINDOW - 1)
+                row[0, rolling_std] = np.sqrt(max(variance, 0.0))
+            
+            value = max(0, round(self._predict_row(row)))
+            predictions[step] = value
+            
+            # Slide the window: drop the oldest value, append the new prediction
+            oldest = window[head]
+            running_sum += value - oldest
+            running_sq += value * value - oldest * oldest
+            window[head] = value
+            head = (head + 1) % self.WINDOW
+        
+        return predictions.tolist()
+    
+    def _predict_row(self, row: np.ndarray) -> float:
+        if self.estimators is None:
+            return float(self.model.predict(row)[0])
+        total = 0.0
+        for estimator in self.estimators:
+            total += estimator.predict(row, check_input=False)[0]
+        return float(total / len(self.estimators))
@@ -0,0 +1,27 @@
+import importlib
+from types import ModuleType
+
+class LazyModule(ModuleType):
+    """Stand-in for a heavy module that imports the real one on first attribute access"""
+    
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__['_module'] = None
+    
+    def _load(self) -> ModuleType:
+        module = self.__dict__['_module']
+        if module is None:
+            # import_module holds the import lock, so concurrent first uses import once
+            module = importlib.import_module(self.__name__)
+            self.__dict__['_module'] = module
+        return module
+    
+    def __getattr__(self, name: str):
+        return getattr(self._load(), name)
+    
+    def __dir__(self):
+        return dir(self._load())
+
+def lazy_import(name: str) -> ModuleType:
+    """Module proxy for heavy optional dependencies (pandas, numpy, joblib) that loads it when first used"""
+    return LazyModule(name)
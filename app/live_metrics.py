@@ -0,0 +1,127 @@
+import logging
+import time as clock
+from datetime import date, timedelta
+from typing import Dict, Optional
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+from .extensions import cache, config_value
+from .models import db, User, Appointment
+from .rollups import appointment_counts_by_status
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ('total_users', 'active_appointments')
+
+def _value(state, name: str, previous: bool):
+    history = state.attrs[name].history
+    if previous and history.deleted:
+        return history.deleted[0]
+    return getattr(state.object, name)
+
+def _contribution(target, previous: bool = False) -> Dict[str, int]:
+    """What one row adds to each counter, before or after the pending change"""
+    state = inspect(target)
+    if isinstance(target, User):
+        return {'total_users': int(not _value(state, 'is_deleted', previous))}
+    return {'active_appointments': int(_value(state, 'status', previous) == 'scheduled'
+                                       and not _value(state, 'is_deleted', previous))}
+
+class LiveMetrics:
+    """System health counters kept current from model events instead of recounted on every broadcast
+    
+    Counters live in the shared cache and move by the net change of each committed
+    transaction; they are recounted from the database every METRICS_RESYNC_INTERVAL to
+    absorb bulk writes that bypass the ORM. The overdue count comes from the appointment
+    rollup. changes() reports only the values that moved since the last broadcast.
+    """
+    
+    def __init__(self, prefix: str = 'metrics'):
+        self.prefix = prefix
+        self._last: Dict[str, int] = {}
+    
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}:{name}"
+    
+    def recount(self) -> Dict[str, int]:
+        """Count every counter from the database and store the result"""
+        counts = {
+            'total_users': db.session.execute(
+                db.select(db.func.count(User.id)).where(User.is_deleted == False)
+            ).scalar(),
+            'active_appointments': db.session.execute(
+                db.select(db.func.count(Appointment.id)).where(
+                    Appointment.status == 'scheduled',
+                    Appointment.is_deleted == False
+                )
+            ).scalar()
+        }
+        cache.set_many({self._key(name): value for name, value in counts.items()}, timeout=0)
+        cache.set(self._key('counted_at'), clock.time(), timeout=0)
+        return counts
+    
+    def apply(self, deltas: Dict[str, int]):
+        """Add committed deltas to the stored counters; counters not stored yet are left for recount()"""
+        for name, delta in deltas.items():
+            if delta and cache.get(self._key(name)) is not None:
+                cache.cache.inc(self._key(name), delta)
+    
+    def counters(self) -> Dict[str, int]:
+        counted_at = cache.get(self._key('counted_at'))
+        values = cache.get_many(*[self._key(name) for name in COUNTERS])
+        if (counted_at is None or None in values
+                or clock.time() - counted_at > config_value('METRICS_RESYNC_INTERVAL')):
+            return self.recount()
+        return dict(zip(COUNTERS, values))
+    
+    def snapshot(self, connected_users: int = 0) -> Dict[str, int]:
+        """Every system health value"""
+        health = self.counters()
+        yesterday = date.today() - timedelta(days=1)
+        health['overdue_appointments'] = appointment_counts_by_status(end_date=yesterday).get('scheduled', 0)
+        health['connected_users'] = connected_users
+        return health
+    
+    def changes(self, health: Dict[str, int]) -> Dict[str, int]:
+        """Values that differ from the previous call's"""
+        changed = {name: value for name, value in health.items() if self._last.get(name) != value}
+        self._last = dict(health)
+        return changed
+
+def _track(session: Optional[Session], old: Dict[str, int], new: Dict[str, int]):
+    if session is None:
+        return
+    deltas = session.info.setdefault('live_metric_deltas', {})
+    for name in set(old) | set(new):
+        deltas[name] = deltas.get(name, 0) + new.get(name, 0) - old.get(name, 0)
+
+@event.listens_for(User, 'after_insert')
+@event.listens_for(Appointment, 'after_insert')
+def _count_insert(mapper, connection, target):
+    _track(object_session(target), {}, _contribution(target))
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(Appointment, 'after_update')
+def _count_update(mapper, connection, target):
+    _track(object_session(target), _contribution(target, previous=True), _contribution(target))
+
+@event.listens_for(User, 'after_delete')
+@event.listens_for(Appointment, 'after_delete')
+def _count_delete(mapper, connection, target):
+    _track(object_session(target), _contribution(target, previous=True), {})
+
+@event.listens_for(Session, 'after_commit')
+def _apply_metric_deltas(session):
+    deltas = session.info.pop('live_metric_deltas', None)
+    if not deltas:
+        return
+    try:
+        live_metrics.apply(deltas)
+    except Exception as e:
+        logger.error(f"Error updating live metrics: {str(e)}")
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_metric_deltas(session, previous_transaction):
+    session.info.pop('live_metric_deltas', None)
+
+# Initialize the live metrics
+live_metrics = LiveMetrics()
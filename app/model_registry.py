@@ -0,0 +1,113 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Tuple
+from .extensions import config_value
+from .lazy import lazy_import
+
+joblib = lazy_import('joblib')
+np = lazy_import('numpy')
+
+class ModelRegistry:
+    """Persist trained ML models together with the data fingerprint and time they were trained on"""
+    
+    def __init__(self, base_path: str = None):
+        self.base_path = base_path
+        self._cache: Dict[str, Tuple[float, Any, Dict]] = {}  # name -> (mtime, model, metadata)
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+    
+    def _resolve_path(self) -> str:
+        """Directory holding the model files (Config.ML_MODEL_PATH unless overridden)"""
+        path = self.base_path or config_value('ML_MODEL_PATH')
+        os.makedirs(path, exist_ok=True)
+        return path
+    
+    def _lock_for(self, name: str) -> threading.Lock:
+        with self._guard:
+            if name not in self._locks:
+                self._locks[name] = threading.Lock()
+            return self._locks[name]
+    
+    @staticmethod
+    def fingerprint(*arrays) -> str:
+        """Stable hash of the training inputs, used to detect new data"""
+        digest = hashlib.sha256()
+        for array in arrays:
+            digest.update(np.ascontiguousarray(array).tobytes())
+        return digest.hexdigest()
+    
+    def load(self, name: str) -> Optional[Tuple[Any, Dict]]:
+        """Load a model and its metadata, reusing the in-memory copy while the file is unchanged"""
+        base = self._resolve_path()
+        model_file = os.path.join(base, f'{name}.joblib')
+        meta_file = os.path.join(base, f'{name}.json')
+        
+        if not os.path.exists(model_file) or not os.path.exists(meta_file):
+            return None
+        
+        mtime = os.path.getmtime(model_file)
+        cached = self._cache.get(name)
+        if cached and cached[0] == mtime:
+            return cached[1], cached[2]
+        
+        try:
+            model = joblib.load(model_file)
+            with open(meta_file) as f:
+                metadata = json.load(f)
+        except Exception:
+            return None
+        
+        self._cache[name] = (mtime, model, metadata)
+        return model, metadata
+    
+    def save(self, name: str, model: Any, metadata: Dict) -> Dict:
+        """Atomically write a model and its metadata"""
+        base = self._resolve_path()
+        metadata = dict(metadata, trained_at=metadata.get('trained_at') or datetime.utcnow().isoformat())
+        
+        for suffix, writer in (
+            ('.json', lambda f: f.write(json.dumps(metadata).encode())),
+            ('.joblib', lambda f: joblib.dump(model, f)),
+        ):
+            handle, tmp_path = tempfile.mkstemp(dir=base, prefix=f'.{name}', suffix=suffix)
+            with os.fdopen(handle, 'wb') as f:
+                writer(f)
+            os.replace(tmp_path, os.path.join(base, f'{name}{suffix}'))
+        
+        self._cache[name] = (os.path.getmtime(os.path.join(base, f'{name}.joblib')), model, metadata)
+        return metadata
+    
+    @staticmethod
+    def needs_training(metadata: Optional[Dict], fingerprint: str, interval_days: int) -> bool:
+        """Retrain when there is no model, the data changed, or the training interval has elapsed"""
+        if not metadata:
+            return True
+        if metadata.get('fingerprint') != fingerprint:
+            return True
+        trained_at = datetime.fromisoformat(metadata['trained_at'])
+        return datetime.utcnow() - trained_at >= timedelta(days=interval_days)
+    
+    def get_or_train(self, name: str, fingerprint: str, interval_days: int,
+                     train: Callable[[], Tuple[Any, Dict]]) -> Tuple[Any, Dict]:
+        """Return the persisted model, training it first only if it is missing or stale"""
+        entry = self.load(name)
+        if entry and not self.needs_training(entry[1], fingerprint, interval_days):
+            return entry
+        
+        # Only one request trains; the others wait and pick up the fresh model
+        with self._lock_for(name):
+            entry = self.load(name)
+            if entry and not self.needs_training(entry[1], fingerprint, interval_days):
+                return entry
+            
+            model, metadata = train()
+            metadata['fingerprint'] = fingerprint
+            metadata['trained_at'] = datetime.utcnow().isoformat()
+            return model, self.save(name, model, metadata)
+
+# Global instance
+model_registry = ModelRegistry()
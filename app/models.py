@@ -202,9 +202,30 @@ class Article(db.Model, TimestampMixin, SoftDeleteMixin):
     def __repr__(self):
         return f'<Article {self.title}>'
 
+class Resource(db.Model, TimestampMixin, SoftDeleteMixin):
+    """A chair or dentist that serves one appointment at a time"""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    resource_type = db.Column(db.String(20), default='chair')  # chair, dentist
+    working_hours = db.Column(db.Text, nullable=True)  # JSON string, same shape as AppointmentScheduler.working_hours; clinic hours when empty
+    sort_order = db.Column(db.Integer, default=0)  # assignment order when loads are equal
+    is_active = db.Column(db.Boolean, default=True)
+
+    def set_working_hours(self, working_hours):
+        self.working_hours = json.dumps(working_hours)
+
+    def get_working_hours(self):
+        if self.working_hours:
+            return json.loads(self.working_hours)
+        return None
+
+    def __repr__(self):
+        return f'<Resource {self.name}>'
+
 class Appointment(db.Model, TimestampMixin, SoftDeleteMixin):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    resource_id = db.Column(db.Integer, db.ForeignKey('resource.id'), nullable=True)  # chair or dentist serving the booking
     name = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(20), nullable=False)
@@ -229,6 +250,7 @@ class Appointment(db.Model, TimestampMixin, SoftDeleteMixin):
         Index('idx_appointment_date_status', 'date', 'status'),
         Index('idx_appointment_user', 'user_id'),
         Index('idx_appointment_status', 'status'),
+        Index('idx_appointment_resource_date', 'resource_id', 'date'),
     )
 
     @validates('email')
@@ -254,6 +276,41 @@ class Appointment(db.Model, TimestampMixin, SoftDeleteMixin):
     def __repr__(self):
         return f'<Appointment {self.name} {self.date}>'
 
+class SlotReservation(db.Model):
+    """One row per booked time bucket of a resource; the unique key makes a double booking fail at insert"""
+    id = db.Column(db.Integer, primary_key=True)
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointment.id', ondelete='CASCADE'), nullable=False)
+    resource_id = db.Column(db.Integer, db.ForeignKey('resource.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    slot_minute = db.Column(db.Integer, nullable=False)  # minutes since midnight, aligned to APPOINTMENT_SLOT_INTERVAL
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('resource_id', 'date', 'slot_minute', name='uq_slot_reservation_slot'),
+        Index('idx_slot_reservation_appointment', 'appointment_id'),
+    )
+
+    def __repr__(self):
+        return f'<SlotReservation {self.resource_id} {self.date} {self.slot_minute}>'
+
+class AppointmentRollup(db.Model):
+    """Appointment totals per day, service and status, maintained incrementally from Appointment writes"""
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False)
+    service_type = db.Column(db.String(100), nullable=False, default='')  # '' for appointments without a service
+    status = db.Column(db.String(20), nullable=False, default='')
+    is_deleted = db.Column(db.Boolean, nullable=False, default=False)
+    appointment_count = db.Column(db.Integer, nullable=False, default=0)
+    duration_total = db.Column(db.Integer, nullable=False, default=0)  # minutes
+    cost_total = db.Column(db.Float, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('date', 'service_type', 'status', 'is_deleted', name='uq_appointment_rollup_key'),
+    )
+
+    def __repr__(self):
+        return f'<AppointmentRollup {self.date} {self.service_type} {self.status} {self.appointment_count}>'
+
 class MedicalRecord(db.Model, TimestampMixin, SoftDeleteMixin):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -453,28 +510,27 @@ class AuditLog(db.Model, TimestampMixin):
 from datetime import timedelta
 
 # Event listeners for audit logging
+# These run inside the flush, so they insert through the flush's connection; session.add() is not allowed here
 @event.listens_for(User, 'after_update')
 def log_user_changes(mapper, connection, target):
     """Log user changes to audit trail"""
     if hasattr(target, '_changed_fields'):
-        audit_log = AuditLog(
+        connection.execute(AuditLog.__table__.insert().values(
             user_id=target.id,
             action='update',
             table_name='user',
             record_id=target.id,
-            old_values=target._changed_fields.get('old'),
-            new_values=target._changed_fields.get('new')
-        )
-        db.session.add(audit_log)
+            old_values=json.dumps(target._changed_fields.get('old'), default=str),
+            new_values=json.dumps(target._changed_fields.get('new'), default=str)
+        ))
 
 @event.listens_for(Appointment, 'after_insert')
 def log_appointment_creation(mapper, connection, target):
     """Log appointment creation"""
-    audit_log = AuditLog(
+    connection.execute(AuditLog.__table__.insert().values(
         user_id=target.user_id,
         action='create',
         table_name='appointment',
         record_id=target.id,
-        new_values={'appointment_id': target.id, 'date': str(target.date)}
-    )
-    db.session.add(audit_log) 
\ No newline at end of file
+        new_values=json.dumps({'appointment_id': target.id, 'date': str(target.date)})
+    )) 
\ No newline at end of file
@@ -0,0 +1,84 @@
+from datetime import datetime
+from typing import Dict, List
+from .extensions import config_value
+from .models import db, Appointment, Notification
+from .response_cache import mark_changed
+
+def create_notifications(notifications: List[Dict], commit: bool = True) -> List[Dict]:
+    """Insert many notifications at once and return them as socket payloads
+    
+    Each dict takes user_id, title and message plus the optional notification_type,
+    priority, action_url and expires_at. Rows go out NOTIFICATION_BATCH_SIZE at a time
+    as one executemany INSERT ... RETURNING id where the database supports it.
+    """
+    if not notifications:
+        return []
+    
+    now = datetime.utcnow()
+    rows = [{
+        'user_id': notification['user_id'],
+        'title': notification['title'],
+        'message': notification['message'],
+        'notification_type': notification.get('notification_type', 'general'),
+        'priority': notification.get('priority', 'normal'),
+        'action_url': notification.get('action_url'),
+        'expires_at': notification.get('expires_at'),
+        'is_read': False,
+        'created_at': now,
+        'updated_at': now
+    } for notification in notifications]
+    
+    returning = getattr(db.session.get_bind().dialect, 'insert_executemany_returning_sort_by_parameter_order', False)
+    batch_size = config_value('NOTIFICATION_BATCH_SIZE')
+    ids = []
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        if returning:
+            result = db.session.execute(
+                db.insert(Notification).returning(Notification.id, sort_by_parameter_order=True), batch
+            )
+            ids.extend(result.scalars().all())
+        else:
+            # The ORM still batches these into executemany inserts when it flushes
+            objects = [Notification(**row) for row in batch]
+            db.session.add_all(objects)
+            db.session.flush()
+            ids.extend(notification.id for notification in objects)
+    
+    mark_changed(db.session, Notification.__tablename__, {row['user_id'] for row in rows})
+    if commit:
+        db.session.commit()
+    
+    return [{
+        'id': notification_id,
+        'user_id': row['user_id'],
+        'title': row['title'],
+        'message': row['message'],
+        'type': row['notification_type'],
+        'priority': row['priority'],
+        'action_url': row['action_url'],
+        'created_at': now.isoformat(),
+        'is_read': False
+    } for notification_id, row in zip(ids, rows)]
+
+def claim_reminders(owners: Dict[int, int]) -> List[int]:
+    """Mark the reminders of the given appointments (id -> user id) as sent and return the ids this call claimed
+    
+    The reminder_sent guard makes the claim atomic, so concurrent senders never claim the
+    same reminder twice; only the returned ids should be notified. The caller commits.
+    """
+    if not owners:
+        return []
+    
+    claim = (db.update(Appointment)
+             .where(Appointment.id.in_(owners), Appointment.reminder_sent.isnot(True))
+             .values(reminder_sent=True, reminder_sent_at=datetime.utcnow())
+             .execution_options(synchronize_session=False))
+    if db.session.get_bind().dialect.update_returning:
+        claimed = db.session.execute(claim.returning(Appointment.id)).scalars().all()
+    else:
+        claimed = [appointment_id for appointment_id in owners
+                   if db.session.execute(claim.where(Appointment.id == appointment_id)).rowcount]
+    
+    mark_changed(db.session, Appointment.__tablename__, {owners[appointment_id] for appointment_id in claimed})
+    return claimed
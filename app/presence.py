@@ -0,0 +1,189 @@
+import os
+import socket
+import sqlite3
+import threading
+import time as clock
+import uuid
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Set
+from .extensions import config_value
+from .shared_cache import SQLiteConnections
+
+class PresenceRegistry(ABC):
+    """Which users have an open Socket.IO session
+    
+    Implementations must be safe to call from concurrent handler threads. Messages are never
+    sent to the session IDs kept here; they go to per-user rooms, so presence is only
+    consulted to skip users with nobody listening and to report counts.
+    """
+    
+    @abstractmethod
+    def connect(self, user_id: int, session_id: str):
+        ...
+    
+    @abstractmethod
+    def disconnect(self, session_id: str) -> Optional[int]:
+        """Forget a session and return the user it belonged to"""
+        ...
+    
+    @abstractmethod
+    def user_for(self, session_id: str) -> Optional[int]:
+        ...
+    
+    @abstractmethod
+    def is_connected(self, user_id: int) -> bool:
+        ...
+    
+    @abstractmethod
+    def connected_users(self, user_ids: List[int]) -> Set[int]:
+        """The subset of user_ids with at least one open session, in one lookup"""
+        ...
+    
+    @abstractmethod
+    def count(self) -> int:
+        """Number of distinct connected users"""
+        ...
+
+class MemoryPresence(PresenceRegistry):
+    """Presence for a single worker process, guarded by a lock"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, int] = {}  # session_id -> user_id
+        self._users: Dict[int, Set[str]] = {}  # user_id -> session_ids
+    
+    def connect(self, user_id: int, session_id: str):
+        with self._lock:
+            self._sessions[session_id] = user_id
+            self._users.setdefault(user_id, set()).add(session_id)
+    
+    def disconnect(self, session_id: str) -> Optional[int]:
+        with self._lock:
+            user_id = self._sessions.pop(session_id, None)
+            if user_id is not None:
+                sessions = self._users.get(user_id, set())
+                sessions.discard(session_id)
+                if not sessions:
+                    self._users.pop(user_id, None)
+            return user_id
+    
+    def user_for(self, session_id: str) -> Optional[int]:
+        with self._lock:
+            return self._sessions.get(session_id)
+    
+    def is_connected(self, user_id: int) -> bool:
+        with self._lock:
+            return bool(self._users.get(user_id))
+    
+    def connected_users(self, user_ids: List[int]) -> Set[int]:
+        with self._lock:
+            return {user_id for user_id in user_ids if self._users.get(user_id)}
+    
+    def count(self) -> int:
+        with self._lock:
+            return len(self._users)
+
+class SQLitePresence(PresenceRegistry):
+    """Presence shared by every worker process on one host, stored in a SQLite file
+    
+    Each worker tags its rows with its own id and refreshes them every PRESENCE_TTL / 3
+    seconds from a heartbeat thread. Readers ignore rows older than PRESENCE_TTL, so the
+    sessions of a worker that died without disconnecting them drop out on their own.
+    """
+    
+    def __init__(self, path: str, ttl: int = 90):
+        self.path = path
+        self.ttl = ttl
+        self._connections = SQLiteConnections(path)
+        self._lock = threading.Lock()
+        self._worker: Optional[str] = None
+        self._heartbeat: Optional[threading.Thread] = None
+        
+        connection = self._connection()
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS presence ('
+            'session_id TEXT PRIMARY KEY, user_id INTEGER NOT NULL, worker TEXT NOT NULL, seen REAL NOT NULL)'
+        )
+        connection.execute('CREATE INDEX IF NOT EXISTS idx_presence_user ON presence (user_id, seen)')
+        connection.execute('CREATE INDEX IF NOT EXISTS idx_presence_worker ON presence (worker)')
+    
+    def _connection(self) -> sqlite3.Connection:
+        return self._connections.get()
+    
+    def _worker_id(self) -> str:
+        # Forked workers must not share their parent's id or heartbeat
+        with self._lock:
+            if self._worker is None or not self._worker.endswith(f":{os.getpid()}"):
+                self._worker = f"{socket.gethostname()}:{uuid.uuid4().hex[:8]}:{os.getpid()}"
+                self._heartbeat = threading.Thread(target=self._beat, args=(self._worker,),
+                                                   name='presence-heartbeat', daemon=True)
+                self._heartbeat.start()
+            return self._worker
+    
+    def _beat(self, worker: str):
+        while self._worker == worker:
+            clock.sleep(self.ttl / 3)
+            try:
+                connection = self._connection()
+                now = clock.time()
+                connection.execute('UPDATE presence SET seen = ? WHERE worker = ?', (now, worker))
+                connection.execute('DELETE FROM presence WHERE seen <= ?', (now - self.ttl,))
+            except sqlite3.Error:
+                continue
+    
+    def _live(self) -> float:
+        return clock.time() - self.ttl
+    
+    def connect(self, user_id: int, session_id: str):
+        self._connection().execute(
+            'INSERT OR REPLACE INTO presence (session_id, user_id, worker, seen) VALUES (?, ?, ?, ?)',
+            (session_id, user_id, self._worker_id(), clock.time())
+        )
+    
+    def disconnect(self, session_id: str) -> Optional[int]:
+        connection = self._connection()
+        row = connection.execute('SELECT user_id FROM presence WHERE session_id = ?', (session_id,)).fetchone()
+        if row is None:
+            return None
+        connection.execute('DELETE FROM presence WHERE session_id = ?', (session_id,))
+        return row[0]
+    
+    def user_for(self, session_id: str) -> Optional[int]:
+        row = self._connection().execute(
+            'SELECT user_id FROM presence WHERE session_id = ? AND seen > ?', (session_id, self._live())
+        ).fetchone()
+        return row[0] if row else None
+    
+    def is_connected(self, user_id: int) -> bool:
+        row = self._connection().execute(
+            'SELECT 1 FROM presence WHERE user_id = ? AND seen > ? LIMIT 1', (user_id, self._live())
+        ).fetchone()
+        return row is not None
+    
+    def connected_users(self, user_ids: List[int]) -> Set[int]:
+        user_ids = list(set(user_ids))
+        if not user_ids:
+            return set()
+        rows = self._connection().execute(
+            f"SELECT DISTINCT user_id FROM presence WHERE seen > ? AND user_id IN ({','.join('?' * len(user_ids))})",
+            [self._live(), *user_ids]
+        ).fetchall()
+        return {row[0] for row in rows}
+    
+    def count(self) -> int:
+        return self._connection().execute(
+            'SELECT COUNT(DISTINCT user_id) FROM presence WHERE seen > ?', (self._live(),)
+        ).fetchone()[0]
+
+PRESENCE_BACKENDS = ('memory', 'sqlite')
+
+def create_presence(app) -> PresenceRegistry:
+    """Presence registry selected by PRESENCE_BACKEND"""
+    backend = config_value('PRESENCE_BACKEND', app)
+    if backend == 'memory':
+        return MemoryPresence()
+    if backend == 'sqlite':
+        path = config_value('PRESENCE_SQLITE_PATH', app)
+        return SQLitePresence(path or os.path.join(app.instance_path, 'presence.sqlite3'),
+                              ttl=config_value('PRESENCE_TTL', app))
+    raise ValueError(f"Unknown presence backend: {backend} (expected one of {', '.join(PRESENCE_BACKENDS)})")
@@ -0,0 +1,119 @@
+import re
+import threading
+import time as clock
+from functools import wraps
+from typing import NamedTuple, Tuple
+from flask import jsonify, request
+from flask_login import current_user
+from .extensions import cache, config_value
+
+# Backends whose inc() is atomic across threads and processes; others are guarded by a process lock
+ATOMIC_BACKENDS = ('SQLiteCache', 'RedisCache', 'RedisSentinelCache', 'RedisClusterCache',
+                   'MemcachedCache', 'SASLMemcachedCache')
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+def parse_limit(limit: str) -> Tuple[int, int]:
+    """'1000 per hour' / '10/minute' / '5 per 30 seconds' -> (requests, window seconds)"""
+    match = re.fullmatch(r'\s*(\d+)\s*(?:per|/)\s*(\d+)?\s*(second|minute|hour|day)s?\s*', limit.lower())
+    if not match:
+        raise ValueError(f'Invalid rate limit: {limit!r}')
+    count, multiplier, period = match.groups()
+    return int(count), int(multiplier or 1) * PERIODS[period]
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: int
+
+class RateLimiter:
+    """Sliding-window request limits backed by the shared cache
+    
+    Each key keeps two integer counters, the current and the previous fixed window.
+    The request rate is estimated as previous * (share of it still inside the sliding
+    window) + current, so memory is O(1) per key and every decision is one atomic
+    increment plus one read.
+    """
+    
+    def __init__(self, prefix: str = 'ratelimit'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+    
+    def init_app(self, app):
+        """Apply API_RATE_LIMIT per user (or per address when anonymous) across every /api/ route"""
+        app.before_request(self._check_api_quota)
+    
+    def identity(self) -> str:
+        if current_user.is_authenticated:
+            return f"user:{current_user.id}"
+        return f"ip:{request.remote_addr}"
+    
+    def _increment(self, backend, key: str, window: int) -> int:
+        # Counters live for two windows: the current one and the one the estimate still weighs
+        if type(backend).__name__ in ATOMIC_BACKENDS:
+            backend.add(key, 0, timeout=2 * window)
+            return backend.inc(key)
+        with self._lock:
+            count = (backend.get(key) or 0) + 1
+            backend.set(key, count, timeout=2 * window)
+            return count
+    
+    def hit(self, key: str, limit: int, window: int) -> RateLimitResult:
+        """Count one request against key and decide whether it is within limit per window"""
+        backend = cache.cache
+        now = clock.time()
+        current_window, elapsed = divmod(now, window)
+        current_key = f"{self.prefix}:{key}:{window}:{int(current_window)}"
+        previous_key = f"{self.prefix}:{key}:{window}:{int(current_window) - 1}"
+        
+        current = self._increment(backend, current_key, window)
+        previous = backend.get(previous_key) or 0
+        
+        weight = 1 - elapsed / window
+        estimated = previous * weight + current
+        if estimated <= limit:
+            return RateLimitResult(True, limit, int(limit - estimated), 0)
+        
+        # Earliest time the previous window's share has decayed enough to admit a request
+        if previous and current <= limit:
+            retry_after = (estimated - limit) / previous * window
+        else:
+            retry_after = window - elapsed
+        return RateLimitResult(False, limit, 0, max(1, int(retry_after + 0.999)))
+    
+    def _rejected(self, result: RateLimitResult):
+        response = jsonify({'error': 'Rate limit exceeded', 'retry_after': result.retry_after})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(result.retry_after)
+        response.headers['X-RateLimit-Limit'] = str(result.limit)
+        response.headers['X-RateLimit-Remaining'] = '0'
+        return response
+    
+    def _check_api_quota(self):
+        if request.endpoint is None or not request.path.startswith('/api/'):
+            return None
+        limit, window = parse_limit(config_value('API_RATE_LIMIT'))
+        result = self.hit(f"api:{self.identity()}", limit, window)
+        if not result.allowed:
+            return self._rejected(result)
+        return None
+    
+    def limit(self, limit=100, window=3600):
+        """Per-route quota for each user; limit may also be given as a string like '50 per hour'"""
+        if isinstance(limit, str):
+            limit, window = parse_limit(limit)
+        
+        def decorator(f):
+            @wraps(f)
+            def wrapped(*args, **kwargs):
+                result = self.hit(f"{request.endpoint}:{self.identity()}", limit, window)
+                if not result.allowed:
+                    return self._rejected(result)
+                return f(*args, **kwargs)
+            return wrapped
+        return decorator
+
+# Initialize the rate limiter
+rate_limiter = RateLimiter()
+rate_limit = rate_limiter.limit
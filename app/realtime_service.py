@@ -2,10 +2,17 @@ import asyncio
 import json
 import logging
 from datetime import datetime, timedelta
-from typing import Dict, List, Set, Optional, Any
-from flask import current_app
+from typing import Dict, List, Set, Optional, Any, Tuple
+from flask import current_app, request
 from flask_socketio import SocketIO, emit, join_room, leave_room
+from config import Config
+from .extensions import config_value
 from .models import db, User, Appointment, Notification
+from .notifications import create_notifications
+from .presence import PresenceRegistry, MemoryPresence, create_presence
+from .live_metrics import live_metrics
+from .retention import retention_engine
+from .reminder_dispatcher import reminder_dispatcher
 import threading
 import time
 
@@ -13,13 +20,59 @@ import time
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class EventCoalescer:
+    """Holds events for a short window per (event, room) and sends each burst as one emit
+    
+    A lone event goes out unchanged; several become one batch event carrying the list,
+    e.g. new_notification -> new_notifications {'notifications': [...]}.
+    """
+    
+    BATCHES = {
+        'new_notification': ('new_notifications', 'notifications'),
+        'appointment_update': ('appointment_updates', 'updates')
+    }
+    
+    def __init__(self, socketio: SocketIO, window: float):
+        self.socketio = socketio
+        self.window = window
+        self._lock = threading.Lock()
+        self._buffers: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+    
+    def emit(self, event: str, room: str, *items: Dict[str, Any]):
+        if self.window <= 0:
+            self._send(event, room, list(items))
+            return
+        with self._lock:
+            buffer = self._buffers.get((event, room))
+            if buffer is not None:
+                buffer.extend(items)
+                return
+            self._buffers[(event, room)] = list(items)
+        self.socketio.start_background_task(self._flush_later, event, room)
+    
+    def _flush_later(self, event: str, room: str):
+        self.socketio.sleep(self.window)
+        with self._lock:
+            items = self._buffers.pop((event, room), [])
+        self._send(event, room, items)
+    
+    def _send(self, event: str, room: str, items: List[Dict[str, Any]]):
+        try:
+            if len(items) == 1:
+                self.socketio.emit(event, items[0], room=room)
+            elif items:
+                batch_event, field = self.BATCHES[event]
+                self.socketio.emit(batch_event, {field: items}, room=room)
+        except Exception as e:
+            logger.error(f"Error sending {event} to {room}: {str(e)}")
+
 class RealtimeService:
     """Real-time service for WebSocket connections and live updates"""
     
-    def __init__(self, socketio: SocketIO):
+    def __init__(self, socketio: SocketIO, presence: PresenceRegistry = None, coalesce_window: float = None):
         self.socketio = socketio
-        self.connected_users: Dict[int, Set[str]] = {}  # user_id -> set of session_ids
-        self.user_sessions: Dict[str, int] = {}  # session_id -> user_id
+        self.presence = presence or MemoryPresence()
+        self.events = EventCoalescer(socketio, Config.SOCKET_COALESCE_WINDOW if coalesce_window is None else coalesce_window)
         self.appointment_reminders: Dict[int, datetime] = {}  # appointment_id -> reminder_time
         self.setup_event_handlers()
         self.start_background_tasks()
@@ -35,17 +88,9 @@ class RealtimeService:
         @self.socketio.on('disconnect')
         def handle_disconnect():
             session_id = request.sid
-            user_id = self.user_sessions.get(session_id)
+            user_id = self.presence.disconnect(session_id)
             
             if user_id:
-                # Remove from connected users
-                if user_id in self.connected_users:
-                    self.connected_users[user_id].discard(session_id)
-                    if not self.connected_users[user_id]:
-                        del self.connected_users[user_id]
-                
-                # Remove session mapping
-                del self.user_sessions[session_id]
                 logger.info(f"User {user_id} disconnected from session {session_id}")
             
             logger.info(f"Client disconnected: {session_id}")
@@ -61,20 +106,16 @@ class RealtimeService:
                     # Verify user exists
                     user = User.query.get(user_id)
                     if user and user.is_active:
-                        # Add to connected users
-                        if user_id not in self.connected_users:
-                            self.connected_users[user_id] = set()
-                        self.connected_users[user_id].add(session_id)
-                        
-                        # Map session to user
-                        self.user_sessions[session_id] = user_id
+                        # Record presence for every worker to see
+                        self.presence.connect(user_id, session_id)
                         
                         # Join user's personal room
                         join_room(f"user_{user_id}")
                         
-                        # Join admin room if user is admin
+                        # Join admin room if user is admin; later health broadcasts only carry changes
                         if user.is_admin:
                             join_room("admin_room")
+                            emit('system_health', self.system_health())
                         
                         emit('authenticated', {
                             'status': 'success',
@@ -82,8 +123,8 @@ class RealtimeService:
                             'is_admin': user.is_admin
                         })
                         
-                        # Send unread notifications
-                        self.send_unread_notifications(user_id)
+                        # Send unread notifications to this session only
+                        self.send_unread_notifications(user_id, session_id)
                         
                         logger.info(f"User {user_id} authenticated for session {session_id}")
                     else:
@@ -98,7 +139,7 @@ class RealtimeService:
         def handle_join_appointment_room(data):
             """Join appointment-specific room for real-time updates"""
             appointment_id = data.get('appointment_id')
-            user_id = self.user_sessions.get(request.sid)
+            user_id = self.presence.user_for(request.sid)
             
             if appointment_id and user_id:
                 room_name = f"appointment_{appointment_id}"
@@ -118,7 +159,7 @@ class RealtimeService:
         def handle_mark_notification_read(data):
             """Mark notification as read"""
             notification_id = data.get('notification_id')
-            user_id = self.user_sessions.get(request.sid)
+            user_id = self.presence.user_for(request.sid)
             
             if notification_id and user_id:
                 notification = Notification.query.filter_by(
@@ -138,7 +179,7 @@ class RealtimeService:
         def handle_appointment_update_request(data):
             """Handle request for appointment updates"""
             appointment_id = data.get('appointment_id')
-            user_id = self.user_sessions.get(request.sid)
+            user_id = self.presence.user_for(request.sid)
             
             if appointment_id and user_id:
                 appointment = Appointment.query.get(appointment_id)
@@ -153,59 +194,57 @@ class RealtimeService:
     
     def start_background_tasks(self):
         """Start background tasks for real-time features"""
-        def run_background_tasks():
-            while True:
-                try:
-                    self.check_appointment_reminders()
-                    self.cleanup_expired_notifications()
-                    self.send_system_updates()
-                    time.sleep(60)  # Run every minute
-                except Exception as e:
-                    logger.error(f"Background task error: {str(e)}")
-                    time.sleep(60)
-        
-        # Start background thread
-        background_thread = threading.Thread(target=run_background_tasks, daemon=True)
-        background_thread.start()
+        # Reminders, expiry sweeps and health broadcasts run when due, on the leader worker only
+        reminder_dispatcher.start(self)
     
     def send_notification(self, user_id: int, title: str, message: str, 
                          notification_type: str = 'general', priority: str = 'normal',
                          action_url: str = None, expires_at: datetime = None):
         """Send real-time notification to user"""
+        self.send_notifications([{
+            'user_id': user_id,
+            'title': title,
+            'message': message,
+            'notification_type': notification_type,
+            'priority': priority,
+            'action_url': action_url,
+            'expires_at': expires_at
+        }])
+    
+    def send_notifications(self, notifications: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Store many notifications in bulk and push them with one emit per user room"""
+        started = time.perf_counter()
         try:
-            # Create notification in database
-            notification = Notification(
-                user_id=user_id,
-                title=title,
-                message=message,
-                notification_type=notification_type,
-                priority=priority,
-                action_url=action_url,
-                expires_at=expires_at
-            )
-            db.session.add(notification)
-            db.session.commit()
+            payloads = create_notifications(notifications)
             
-            # Send to connected users
-            if user_id in self.connected_users:
-                notification_data = {
-                    'id': notification.id,
-                    'title': title,
-                    'message': message,
-                    'type': notification_type,
-                    'priority': priority,
-                    'action_url': action_url,
-                    'created_at': notification.created_at.isoformat(),
-                    'is_read': False
-                }
-                
-                for session_id in self.connected_users[user_id]:
-                    self.socketio.emit('new_notification', notification_data, room=session_id)
+            # Group per user so a burst becomes one emit per connected user
+            by_user: Dict[int, List[Dict[str, Any]]] = {}
+            for payload in payloads:
+                by_user.setdefault(payload['user_id'], []).append(payload)
+            
+            emits = 0
+            connected = self.presence.connected_users(list(by_user))
+            for user_id, user_payloads in by_user.items():
+                if user_id not in connected:
+                    continue
+                self.events.emit('new_notification', f"user_{user_id}", *user_payloads)
+                emits += 1
             
-            logger.info(f"Notification sent to user {user_id}: {title}")
+            elapsed = time.perf_counter() - started
+            stats = {
+                'created': len(payloads),
+                'emits': emits,
+                'seconds': elapsed,
+                'per_second': len(payloads) / elapsed if elapsed > 0 else 0.0
+            }
+            logger.info(f"Sent {stats['created']} notifications with {emits} emits in "
+                        f"{elapsed * 1000:.1f} ms ({stats['per_second']:.0f}/s)")
+            return stats
             
         except Exception as e:
-            logger.error(f"Error sending notification: {str(e)}")
+            db.session.rollback()
+            logger.error(f"Error sending notifications: {str(e)}")
+            return {'created': 0, 'emits': 0, 'seconds': time.perf_counter() - started, 'per_second': 0.0}
     
     def send_appointment_update(self, appointment_id: int, update_type: str, 
                                data: Dict[str, Any] = None):
@@ -219,7 +258,7 @@ class RealtimeService:
                 'data': data or {}
             }
             
-            self.socketio.emit('appointment_update', update_data, room=room_name)
+            self.events.emit('appointment_update', room_name, update_data)
             logger.info(f"Appointment update sent for appointment {appointment_id}")
             
         except Exception as e:
@@ -241,8 +280,15 @@ class RealtimeService:
         except Exception as e:
             logger.error(f"Error sending admin alert: {str(e)}")
     
-    def send_unread_notifications(self, user_id: int):
-        """Send unread notifications to user upon connection"""
+    def send_export_progress(self, user_id: int, job: Dict[str, Any]):
+        """Send export job progress to the user who requested it"""
+        try:
+            self.socketio.emit('export_progress', job, room=f"user_{user_id}")
+        except Exception as e:
+            logger.error(f"Error sending export progress: {str(e)}")
+    
+    def send_unread_notifications(self, user_id: int, session_id: str = None):
+        """Send unread notifications to a newly connected session, or to all of the user's sessions"""
         try:
             notifications = Notification.query.filter_by(
                 user_id=user_id,
@@ -252,6 +298,7 @@ class RealtimeService:
                 (Notification.expires_at > datetime.utcnow())
             ).order_by(Notification.created_at.desc()).limit(10).all()
             
+            room = session_id or f"user_{user_id}"
             for notification in notifications:
                 notification_data = {
                     'id': notification.id,
@@ -263,10 +310,7 @@ class RealtimeService:
                     'created_at': notification.created_at.isoformat(),
                     'is_read': False
                 }
-                
-                if user_id in self.connected_users:
-                    for session_id in self.connected_users[user_id]:
-                        self.socketio.emit('existing_notification', notification_data, room=session_id)
+                self.socketio.emit('existing_notification', notification_data, room=room)
             
         except Exception as e:
             logger.error(f"Error sending unread notifications: {str(e)}")
@@ -285,16 +329,18 @@ class RealtimeService:
                 Appointment.is_deleted == False
             ).all()
             
+            reminders = []
             for appointment in appointments:
-                # Send reminder notification
-                self.send_notification(
-                    user_id=appointment.user_id,
-                    title="Appointment Reminder",
-                    message=f"Your appointment is scheduled for tomorrow at {appointment.time.strftime('%I:%M %p')}",
-                    notification_type='reminder',
-                    priority='high',
-                    action_url=f"/appointment/{appointment.id}"
-                )
+                if appointment.user_id is None:
+                    continue
+                reminders.append({
+                    'user_id': appointment.user_id,
+                    'title': "Appointment Reminder",
+                    'message': f"Your appointment is scheduled for tomorrow at {appointment.time.strftime('%I:%M %p')}",
+                    'notification_type': 'reminder',
+                    'priority': 'high',
+                    'action_url': f"/appointment/{appointment.id}"
+                })
                 
                 # Mark reminder as sent
                 appointment.reminder_sent = True
@@ -302,71 +348,54 @@ class RealtimeService:
             
             db.session.commit()
             
+            # Send all reminder notifications in one batch
+            self.send_notifications(reminders)
+            
         except Exception as e:
             logger.error(f"Error checking appointment reminders: {str(e)}")
     
     def cleanup_expired_notifications(self):
         """Clean up expired notifications"""
         try:
-            expired_notifications = Notification.query.filter(
-                Notification.expires_at < datetime.utcnow()
-            ).all()
-            
-            for notification in expired_notifications:
-                db.session.delete(notification)
-            
-            db.session.commit()
-            
-            if expired_notifications:
-                logger.info(f"Cleaned up {len(expired_notifications)} expired notifications")
-                
+            retention_engine.purge('expired_notifications')
         except Exception as e:
             logger.error(f"Error cleaning up expired notifications: {str(e)}")
     
+    def system_health(self) -> Dict[str, Any]:
+        """Full system health snapshot, sent to admins when they connect"""
+        health = live_metrics.snapshot(connected_users=self.presence.count())
+        health['timestamp'] = datetime.utcnow().isoformat()
+        return health
+    
     def send_system_updates(self):
-        """Send system updates and health checks"""
+        """Send the system health values that changed since the last broadcast"""
         try:
-            # Check for overdue appointments
-            overdue_appointments = Appointment.query.filter(
-                Appointment.date < datetime.utcnow().date(),
-                Appointment.status == 'scheduled',
-                Appointment.is_deleted == False
-            ).all()
+            changes = live_metrics.changes(live_metrics.snapshot(connected_users=self.presence.count()))
+            if not changes:
+                return
             
-            if overdue_appointments:
+            # Alert when the number of overdue appointments moves, not on every tick
+            overdue = changes.get('overdue_appointments')
+            if overdue:
                 self.send_admin_alert(
                     alert_type='overdue_appointments',
-                    message=f"Found {len(overdue_appointments)} overdue appointments",
-                    data={'count': len(overdue_appointments)}
+                    message=f"Found {overdue} overdue appointments",
+                    data={'count': overdue}
                 )
             
-            # Check system health
-            total_users = User.query.filter(User.is_deleted == False).count()
-            active_appointments = Appointment.query.filter(
-                Appointment.status == 'scheduled',
-                Appointment.is_deleted == False
-            ).count()
-            
-            # Send health metrics to admin room
-            health_data = {
-                'total_users': total_users,
-                'active_appointments': active_appointments,
-                'connected_users': len(self.connected_users),
-                'timestamp': datetime.utcnow().isoformat()
-            }
-            
-            self.socketio.emit('system_health', health_data, room="admin_room")
+            changes['timestamp'] = datetime.utcnow().isoformat()
+            self.socketio.emit('system_health_delta', changes, room="admin_room")
             
         except Exception as e:
             logger.error(f"Error sending system updates: {str(e)}")
     
     def get_connected_users_count(self) -> int:
-        """Get count of currently connected users"""
-        return len(self.connected_users)
+        """Get count of currently connected users across all workers"""
+        return self.presence.count()
     
     def is_user_connected(self, user_id: int) -> bool:
-        """Check if user is currently connected"""
-        return user_id in self.connected_users and bool(self.connected_users[user_id])
+        """Check if user is currently connected to any worker"""
+        return self.presence.is_connected(user_id)
     
     def broadcast_to_all(self, event: str, data: Dict[str, Any]):
         """Broadcast event to all connected users"""
@@ -379,10 +408,22 @@ class RealtimeService:
 # Global instance
 realtime_service = None
 
-def init_realtime_service(socketio: SocketIO):
-    """Initialize the real-time service"""
+def create_socketio(app) -> SocketIO:
+    """SocketIO bound to app; with SOCKETIO_MESSAGE_QUEUE set, emits from any worker reach clients on every worker"""
+    return SocketIO(
+        app,
+        message_queue=config_value('SOCKETIO_MESSAGE_QUEUE', app),
+        async_mode=config_value('SOCKETIO_ASYNC_MODE', app)
+    )
+
+def init_realtime_service(socketio: SocketIO, presence: PresenceRegistry = None):
+    """Initialize the real-time service; presence defaults to the PRESENCE_BACKEND registry"""
     global realtime_service
-    realtime_service = RealtimeService(socketio)
+    realtime_service = RealtimeService(
+        socketio,
+        presence or create_presence(current_app),
+        config_value('SOCKET_COALESCE_WINDOW')
+    )
     return realtime_service
 
 def get_realtime_service() -> RealtimeService:
@@ -0,0 +1,268 @@
+import heapq
+import itertools
+import logging
+import threading
+import time as clock
+import uuid
+from datetime import date, datetime, time, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from .extensions import cache, config_value, db
+from .models import Appointment, Notification
+from .notifications import claim_reminders
+from .retention import retention_engine
+
+logger = logging.getLogger(__name__)
+
+class ReminderDispatcher:
+    """Wakes exactly when the next reminder, expiry sweep, retention run or periodic task is due
+    
+    Deadlines sit in a min-heap seeded from the database and updated on booking commits;
+    entries are re-checked against the database when they fire, so a stale entry for a
+    rescheduled or cancelled appointment is simply dropped. Only the worker holding the
+    leader lease in the shared cache keeps a timeline and dispatches; the others retry the
+    lease and take over if it lapses.
+    """
+    
+    LEADER_KEY = 'reminders:leader'
+    
+    def __init__(self):
+        self._heap: List[Tuple[float, int, str, Optional[int]]] = []
+        self._sequence = itertools.count()
+        self._wakeup = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._app = None
+        self._service = None
+        self._token = uuid.uuid4().hex
+        self._leader = False
+        self._lease_renewed = 0.0
+        self._synced_at: Optional[datetime] = None
+    
+    def init_app(self, app):
+        self._app = app
+    
+    def start(self, service):
+        """Start dispatching for a RealtimeService; reminders and alerts are delivered through it"""
+        if self._app is None:
+            raise RuntimeError('ReminderDispatcher.init_app() must be called before start()')
+        self._service = service
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='reminder-dispatcher', daemon=True)
+            self._thread.start()
+    
+    # Timeline
+    def push(self, due: float, kind: str, key: Optional[int] = None):
+        with self._wakeup:
+            heapq.heappush(self._heap, (due, next(self._sequence), kind, key))
+            self._wakeup.notify()
+    
+    def reminder_due(self, appointment_date: date, appointment_time: time) -> float:
+        """Epoch time the reminder for an appointment should go out"""
+        starts = datetime.combine(appointment_date, appointment_time)
+        return (starts - timedelta(hours=config_value('APPOINTMENT_REMINDER_HOURS', self._app))).timestamp()
+    
+    def schedule_appointments(self, rows: Iterable[Tuple[int, date, time]]):
+        """Queue reminders for (id, date, time) rows in one heap update"""
+        if not self._leader:
+            return  # the leader picks these up on its next resync
+        entries = [(self.reminder_due(day, start), next(self._sequence), 'reminder', appointment_id)
+                   for appointment_id, day, start in rows]
+        if not entries:
+            return
+        with self._wakeup:
+            for entry in entries:
+                heapq.heappush(self._heap, entry)
+            self._wakeup.notify()
+    
+    def schedule_retry(self, due: float, appointment_ids: List[int]):
+        with self._wakeup:
+            for appointment_id in appointment_ids:
+                heapq.heappush(self._heap, (due, next(self._sequence), 'reminder', appointment_id))
+            self._wakeup.notify()
+    
+    def _pending_reminders(self):
+        return db.select(Appointment.id, Appointment.date, Appointment.time).where(
+            Appointment.reminder_sent.isnot(True),
+            Appointment.status == 'scheduled',
+            Appointment.is_deleted.isnot(True),
+            Appointment.user_id.isnot(None),
+            Appointment.date >= date.today()
+        )
+    
+    def _seed(self):
+        """Rebuild the timeline from the database; run whenever this worker becomes leader"""
+        with self._wakeup:
+            self._heap = []
+        self._synced_at = datetime.utcnow()
+        self.schedule_appointments(db.session.execute(self._pending_reminders()).all())
+        
+        now = clock.time()
+        self.push(now, 'cleanup')
+        self.push(now, 'system')
+        self.push(now, 'retention')
+        self.push(now + config_value('REMINDER_RESYNC_INTERVAL', self._app), 'resync')
+    
+    def _resync(self):
+        """Pick up bookings committed by other workers since the last sync"""
+        since, self._synced_at = self._synced_at, datetime.utcnow()
+        self.schedule_appointments(db.session.execute(
+            self._pending_reminders().where(Appointment.updated_at >= since)
+        ).all())
+    
+    # Leader lease
+    def _hold_lease(self) -> bool:
+        lease = config_value('REMINDER_LEASE_SECONDS', self._app)
+        now = clock.monotonic()
+        if self._leader and now - self._lease_renewed < lease / 3:
+            return True
+        
+        backend = cache.cache
+        if self._leader and backend.get(self.LEADER_KEY) == self._token:
+            backend.set(self.LEADER_KEY, self._token, timeout=lease)
+        elif backend.add(self.LEADER_KEY, self._token, timeout=lease):
+            logger.info('Reminder dispatcher acquired the leader lease')
+            self._leader = True
+            self._seed()
+        else:
+            self._leader = False
+            return False
+        
+        self._leader = True
+        self._lease_renewed = now
+        return True
+    
+    # Handlers
+    def _send_reminders(self, appointment_ids: List[int]):
+        """Send every reminder that came due together as one bulk notification batch"""
+        now = clock.time()
+        rows = db.session.execute(
+            db.select(Appointment.id, Appointment.user_id, Appointment.date, Appointment.time).where(
+                Appointment.id.in_(set(appointment_ids)),
+                Appointment.user_id.isnot(None),
+                Appointment.status == 'scheduled',
+                Appointment.is_deleted.isnot(True),
+                Appointment.reminder_sent.isnot(True)
+            )
+        ).all()
+        # Rows rescheduled to later are skipped; their newer heap entries will fire instead
+        due = {row.id: row for row in rows if self.reminder_due(row.date, row.time) <= now + 1}
+        if not due:
+            return
+        
+        # Claim the reminders atomically so a lease handover can never send one twice
+        claimed = claim_reminders({appointment_id: row.user_id for appointment_id, row in due.items()})
+        db.session.commit()
+        
+        self._service.send_notifications([{
+            'user_id': due[appointment_id].user_id,
+            'title': "Appointment Reminder",
+            'message': f"Your appointment is scheduled for {due[appointment_id].date.strftime('%A, %B %d')} "
+                       f"at {due[appointment_id].time.strftime('%I:%M %p')}",
+            'notification_type': 'reminder',
+            'priority': 'high',
+            'action_url': f"/appointment/{appointment_id}"
+        } for appointment_id in claimed])
+    
+    def _cleanup(self):
+        """Sweep expired notifications, then sleep until the next one expires"""
+        self._service.cleanup_expired_notifications()
+        next_expiry = db.session.execute(
+            db.select(db.func.min(Notification.expires_at)).where(Notification.expires_at.isnot(None))
+        ).scalar()
+        due = clock.time() + config_value('NOTIFICATION_CLEANUP_INTERVAL', self._app)
+        if next_expiry is not None:
+            due = min(due, (next_expiry - datetime.utcnow()).total_seconds() + clock.time() + 1)
+        self.push(due, 'cleanup')
+    
+    def _system(self):
+        self._service.send_system_updates()
+        self.push(clock.time() + config_value('SYSTEM_UPDATE_INTERVAL', self._app), 'system')
+    
+    def _retention(self):
+        retention_engine.run()
+        self.push(clock.time() + config_value('RETENTION_INTERVAL', self._app), 'retention')
+    
+    def _resync_task(self):
+        self._resync()
+        self.push(clock.time() + config_value('REMINDER_RESYNC_INTERVAL', self._app), 'resync')
+    
+    def _dispatch(self, kind: str):
+        handlers: Dict[str, Callable] = {
+            'cleanup': self._cleanup,
+            'system': self._system,
+            'retention': self._retention,
+            'resync': self._resync_task
+        }
+        handlers[kind]()
+    
+    def _due_entries(self) -> List[Tuple[str, Optional[int]]]:
+        now = clock.time()
+        due = []
+        with self._wakeup:
+            while self._heap and self._heap[0][0] <= now:
+                _, _, kind, key = heapq.heappop(self._heap)
+                due.append((kind, key))
+        return due
+    
+    def _run(self):
+        """Worker loop: sleep until the earliest deadline or lease renewal, then run what is due"""
+        while True:
+            with self._app.app_context():
+                try:
+                    due = self._due_entries() if self._hold_lease() else []
+                    
+                    # Reminders that came due together go out as one batch
+                    reminders = [key for kind, key in due if kind == 'reminder']
+                    tasks = [(kind, key) for kind, key in due if kind != 'reminder']
+                    if reminders:
+                        tasks.insert(0, ('reminders', reminders))
+                    
+                    for kind, key in tasks:
+                        try:
+                            if kind == 'reminders':
+                                self._send_reminders(key)
+                            else:
+                                self._dispatch(kind)
+                        except Exception as e:
+                            db.session.rollback()
+                            logger.error(f"Error running {kind} task: {str(e)}")
+                            retry = clock.time() + config_value('REMINDER_RETRY_SECONDS', self._app)
+                            if kind == 'reminders':
+                                self.schedule_retry(retry, key)
+                            else:
+                                self.push(retry, kind, key)
+                except Exception as e:
+                    self._leader = False
+                    logger.error(f"Reminder dispatcher error: {str(e)}")
+                finally:
+                    db.session.remove()
+            
+            wait = config_value('REMINDER_LEASE_SECONDS', self._app) / 3
+            with self._wakeup:
+                if self._leader and self._heap:
+                    wait = max(0.0, min(wait, self._heap[0][0] - clock.time()))
+                self._wakeup.wait(timeout=wait)
+
+@event.listens_for(Appointment, 'after_insert')
+@event.listens_for(Appointment, 'after_update')
+def _track_reminder_change(mapper, connection, target):
+    session = object_session(target)
+    if session is None:
+        return
+    if target.status == 'scheduled' and not target.reminder_sent and not target.is_deleted and target.user_id:
+        session.info.setdefault('reminder_appointments', {})[target.id] = (target.id, target.date, target.time)
+
+@event.listens_for(Session, 'after_commit')
+def _schedule_committed_reminders(session):
+    """Booked or rescheduled appointments join the timeline as soon as they are committed"""
+    rows = session.info.pop('reminder_appointments', None)
+    if rows and reminder_dispatcher._app is not None:
+        reminder_dispatcher.schedule_appointments(rows.values())
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_reminder_changes(session, previous_transaction):
+    session.info.pop('reminder_appointments', None)
+
+# Initialize the reminder dispatcher
+reminder_dispatcher = ReminderDispatcher()
@@ -0,0 +1,193 @@
+import hashlib
+import itertools
+import logging
+import threading
+import time as clock
+import uuid
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlencode
+from flask import Response, copy_current_request_context, make_response, request
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from .extensions import cache
+
+logger = logging.getLogger(__name__)
+
+# Query args that only bust browser caches and never change the response
+IGNORED_ARGS = ('_',)
+
+# Response headers that belong to a single response and must not be replayed
+UNCACHED_HEADERS = ('set-cookie', 'content-length', 'etag', 'date')
+
+class ResponseCache:
+    """Rendered GET responses in the shared cache backend, keyed per endpoint, user, role and args
+    
+    Entries carry the version of every tag (model table, optionally scoped to a user) they
+    were rendered against; bumping a tag's version on commit makes those entries misses.
+    """
+    
+    def __init__(self, prefix: str = 'response'):
+        self.prefix = prefix
+    
+    def _identity(self) -> Tuple[str, str]:
+        if current_user.is_authenticated:
+            return str(current_user.id), 'admin' if current_user.is_admin else 'patient'
+        return 'anonymous', 'anonymous'
+    
+    def make_key(self, per_user: bool = True) -> str:
+        """Cache key for the current request"""
+        user, role = self._identity()
+        args = sorted((name, value) for name, value in request.args.items(multi=True) if name not in IGNORED_ARGS)
+        digest = hashlib.sha1(urlencode(args).encode()).hexdigest()
+        return f"{self.prefix}:{request.endpoint}:{user if per_user else '*'}:{role}:{digest}"
+    
+    def _tag_names(self, tags: Iterable[str], per_user: bool) -> List[str]:
+        if not per_user:
+            return list(tags)
+        user, _ = self._identity()
+        return [f"{tag}:user:{user}" for tag in tags]
+    
+    def _tag_versions(self, names: List[str]) -> Dict[str, Optional[str]]:
+        if not names:
+            return {}
+        keys = [f"{self.prefix}:tag:{name}" for name in names]
+        return dict(zip(names, cache.get_many(*keys)))
+    
+    def tag_versions(self, *tags: str) -> Dict[str, Optional[str]]:
+        """Current version of each tag; any change to the result means one of the tags was invalidated"""
+        return self._tag_versions(list(tags))
+    
+    def invalidate(self, *tags: str):
+        """Expire every entry rendered against any of the tags"""
+        if tags:
+            version = uuid.uuid4().hex
+            cache.set_many({f"{self.prefix}:tag:{tag}": version for tag in tags}, timeout=0)
+    
+    def _render(self, view: Callable, args, kwargs, key: str, tag_names: List[str],
+                timeout: int, stale: int) -> Tuple[Response, Optional[Dict]]:
+        # Versions are read before rendering so a concurrent invalidation is never masked
+        versions = self._tag_versions(tag_names)
+        response = make_response(view(*args, **kwargs))
+        if response.status_code != 200 or response.direct_passthrough:
+            return response, None
+        
+        body = response.get_data()
+        entry = {
+            'body': body,
+            'status': response.status_code,
+            'headers': [(name, value) for name, value in response.headers.items()
+                        if name.lower() not in UNCACHED_HEADERS],
+            'etag': hashlib.sha1(body).hexdigest(),
+            'created': clock.time(),
+            'tags': versions
+        }
+        cache.set(key, entry, timeout=timeout + stale)
+        return response, entry
+    
+    def _respond(self, entry: Dict, state: str, per_user: bool) -> Response:
+        if request.if_none_match.contains(entry['etag']):
+            response = Response(status=304)
+        else:
+            response = Response(entry['body'], status=entry['status'], headers=entry['headers'])
+        response.set_etag(entry['etag'])
+        response.headers['Cache-Control'] = 'private, no-cache' if per_user else 'no-cache'
+        response.headers['Vary'] = 'Cookie'
+        response.headers['X-Cache'] = state
+        return response
+    
+    def _revalidate(self, view: Callable, args, kwargs, key: str, tag_names: List[str], timeout: int, stale: int):
+        """Re-render a stale entry in the background; only one worker refreshes a key at a time"""
+        lock_key = f"{key}:refresh"
+        if not cache.add(lock_key, 1, timeout=60):
+            return
+        
+        @copy_current_request_context
+        def refresh():
+            try:
+                self._render(view, args, kwargs, key, tag_names, timeout, stale)
+            except Exception as e:
+                logger.error(f"Error revalidating cached response {key}: {str(e)}")
+            finally:
+                cache.delete(lock_key)
+        
+        threading.Thread(target=refresh, daemon=True).start()
+    
+    def cached(self, timeout: int = 300, tags: Iterable[str] = (), per_user: bool = True, stale: int = None):
+        """Cache a GET view for `timeout` seconds, then serve it stale for up to `stale` more while it re-renders
+        
+        tags are model table names; with per_user they are scoped to the requesting user so
+        one patient's changes only expire their own entries.
+        """
+        stale = timeout if stale is None else stale
+        tags = tuple(tags)
+        
+        def decorator(view):
+            @wraps(view)
+            def wrapped(*args, **kwargs):
+                if request.method != 'GET':
+                    return view(*args, **kwargs)
+                
+                key = self.make_key(per_user)
+                tag_names = self._tag_names(tags, per_user)
+                
+                entry = cache.get(key)
+                if entry and entry['tags'] == self._tag_versions(tag_names):
+                    age = clock.time() - entry['created']
+                    if age < timeout:
+                        return self._respond(entry, 'HIT', per_user)
+                    if age < timeout + stale:
+                        self._revalidate(view, args, kwargs, key, tag_names, timeout, stale)
+                        return self._respond(entry, 'STALE', per_user)
+                
+                response, entry = self._render(view, args, kwargs, key, tag_names, timeout, stale)
+                if entry is None:
+                    return response
+                return self._respond(entry, 'MISS', per_user)
+            return wrapped
+        return decorator
+
+def _changed_tags(objects) -> set:
+    """Table tags, global and per owning user, for a batch of changed model instances"""
+    tags = set()
+    for obj in objects:
+        table = getattr(obj, '__tablename__', None)
+        if not table:
+            continue
+        tags.add(table)
+        owner = obj.id if table == 'user' else getattr(obj, 'user_id', None)
+        if owner is not None:
+            tags.add(f"{table}:user:{owner}")
+    return tags
+
+def mark_changed(session, table: str, owners: Iterable = ()):
+    """Record a bulk Core write, which bypasses the flush hook, so its tags expire on commit"""
+    tags = {table}
+    tags.update(f"{table}:user:{owner}" for owner in owners if owner is not None)
+    session.info.setdefault('response_cache_tags', set()).update(tags)
+
+@event.listens_for(Session, 'after_flush')
+def _collect_response_cache_tags(session, flush_context):
+    changed = _changed_tags(itertools.chain(session.new, session.dirty, session.deleted))
+    if changed:
+        session.info.setdefault('response_cache_tags', set()).update(changed)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_response_cache(session):
+    """Only committed changes expire cached responses"""
+    tags = session.info.pop('response_cache_tags', None)
+    if not tags:
+        return
+    try:
+        response_cache.invalidate(*tags)
+    except Exception as e:
+        logger.error(f"Error invalidating cached responses: {str(e)}")
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_response_cache_tags(session, previous_transaction):
+    session.info.pop('response_cache_tags', None)
+
+# Initialize the response cache
+response_cache = ResponseCache()
+cache_response = response_cache.cached
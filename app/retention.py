@@ -0,0 +1,148 @@
+import gzip
+import json
+import logging
+import os
+import time as clock
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+from flask import current_app
+from .extensions import config_value
+from .models import db, Appointment, Article, AuditLog, DentalHistory, Insurance, Notification, Service, SlotReservation
+from .response_cache import mark_changed
+from .rollups import remove_from_rollup
+
+logger = logging.getLogger(__name__)
+
+class RetentionPolicy(NamedTuple):
+    """Rows of model matching condition(cutoff) are purged; cutoff is now minus the days in setting"""
+    name: str
+    model: Any
+    setting: Optional[str]  # config name holding the retention days; None purges against now
+    condition: Callable[[datetime], Any]
+    archive: bool = False
+    before_delete: Optional[Callable[[List[int]], None]] = None
+
+def _detach_appointments(appointment_ids: List[int]):
+    # Bulk deletes skip the mapper hooks, so the rollup and dependent rows are handled here
+    remove_from_rollup(appointment_ids)
+    db.session.execute(db.delete(SlotReservation).where(SlotReservation.appointment_id.in_(appointment_ids)))
+    db.session.execute(
+        db.update(DentalHistory).where(DentalHistory.appointment_id.in_(appointment_ids)).values(appointment_id=None)
+    )
+
+def _soft_deleted(model, cutoff: datetime):
+    return db.and_(model.is_deleted == True, model.deleted_at < cutoff)
+
+POLICIES = [
+    RetentionPolicy('expired_notifications', Notification, None, lambda now: Notification.expires_at < now),
+    RetentionPolicy('notifications', Notification, 'NOTIFICATION_RETENTION_DAYS',
+                    lambda cutoff: Notification.created_at < cutoff),
+    RetentionPolicy('audit_log', AuditLog, 'AUDIT_LOG_RETENTION_DAYS',
+                    lambda cutoff: AuditLog.created_at < cutoff, archive=True),
+    # Soft-deleted rows are only kept for analytics that include deleted records
+    RetentionPolicy('deleted_appointments', Appointment, 'ANALYTICS_RETENTION_DAYS',
+                    lambda cutoff: _soft_deleted(Appointment, cutoff), archive=True,
+                    before_delete=_detach_appointments),
+    RetentionPolicy('deleted_articles', Article, 'ANALYTICS_RETENTION_DAYS',
+                    lambda cutoff: _soft_deleted(Article, cutoff)),
+    RetentionPolicy('deleted_services', Service, 'ANALYTICS_RETENTION_DAYS',
+                    lambda cutoff: _soft_deleted(Service, cutoff)),
+    RetentionPolicy('deleted_insurances', Insurance, 'ANALYTICS_RETENTION_DAYS',
+                    lambda cutoff: _soft_deleted(Insurance, cutoff))
+]
+
+class RetentionEngine:
+    """Purges rows past their retention period with chunked, set-based DELETEs
+    
+    Each chunk of at most NOTIFICATION_BATCH_SIZE rows is selected by primary key, optionally
+    appended to a gzipped NDJSON archive, deleted and committed on its own, so no purge holds
+    the SQLite write lock for longer than one small transaction. Archiving is at-least-once:
+    a chunk whose delete fails is archived again on the next run.
+    """
+    
+    def __init__(self, policies: List[RetentionPolicy]):
+        self.policies = {policy.name: policy for policy in policies}
+    
+    def archive_dir(self) -> str:
+        directory = config_value('RETENTION_ARCHIVE_DIR') or os.path.join(current_app.instance_path, 'archive')
+        os.makedirs(directory, exist_ok=True)
+        return directory
+    
+    def cutoff(self, policy: RetentionPolicy) -> Optional[datetime]:
+        """Rows older than this are purged; None when the policy is disabled"""
+        now = datetime.utcnow()
+        if policy.setting is None:
+            return now
+        days = config_value(policy.setting)
+        if not days:
+            return None
+        return now - timedelta(days=days)
+    
+    def _archive(self, policy: RetentionPolicy, ids: List[int]):
+        table = policy.model.__table__
+        rows = db.session.execute(db.select(table).where(table.c.id.in_(ids)).order_by(table.c.id)).mappings()
+        path = os.path.join(self.archive_dir(), f"{policy.name}-{datetime.utcnow():%Y-%m}.ndjson.gz")
+        # Appending adds a gzip member per chunk; readers see one continuous stream
+        with gzip.open(path, 'at', encoding='utf-8') as archive:
+            for row in rows:
+                archive.write(json.dumps(dict(row), default=str) + '\n')
+    
+    def purge(self, name: str) -> int:
+        """Apply one policy and return the number of rows removed"""
+        policy = self.policies[name]
+        cutoff = self.cutoff(policy)
+        if cutoff is None:
+            return 0
+        
+        model = policy.model
+        owner = getattr(model, 'user_id', None)
+        columns = [model.id] if owner is None else [model.id, owner]
+        batch_size = config_value('NOTIFICATION_BATCH_SIZE')
+        pause = config_value('RETENTION_PAUSE_SECONDS')
+        
+        removed = 0
+        while True:
+            rows = db.session.execute(
+                db.select(*columns).where(policy.condition(cutoff)).order_by(model.id).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            
+            ids = [row[0] for row in rows]
+            try:
+                if policy.archive:
+                    self._archive(policy, ids)
+                if policy.before_delete:
+                    policy.before_delete(ids)
+                db.session.execute(
+                    db.delete(model).where(model.id.in_(ids)).execution_options(synchronize_session=False)
+                )
+                mark_changed(db.session, model.__tablename__, {row[1] for row in rows} if owner is not None else ())
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            
+            removed += len(ids)
+            if len(ids) < batch_size:
+                break
+            # Let other writers take the lock between chunks
+            clock.sleep(pause)
+        
+        if removed:
+            logger.info(f"Retention policy {name} removed {removed} rows")
+        return removed
+    
+    def run(self) -> Dict[str, int]:
+        """Apply every policy; a failing policy is logged and does not stop the others"""
+        results = {}
+        for name in self.policies:
+            try:
+                results[name] = self.purge(name)
+            except Exception as e:
+                logger.error(f"Error applying retention policy {name}: {str(e)}")
+                results[name] = 0
+        return results
+
+# Initialize the retention engine
+retention_engine = RetentionEngine(POLICIES)
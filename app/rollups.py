@@ -0,0 +1,145 @@
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from .models import db, Appointment, AppointmentRollup
+
+ROLLUP_KEY = ('date', 'service_type', 'status', 'is_deleted')
+
+# Dialects with INSERT ... ON CONFLICT DO UPDATE
+_UPSERT_INSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+def _rollup_state(target: Appointment, previous: bool = False) -> Optional[Tuple[Tuple, Tuple[int, int, float]]]:
+    """(rollup key, (count, duration, cost)) the appointment contributes, before or after the pending change"""
+    values = {}
+    state = inspect(target)
+    for name in ('date', 'service_type', 'status', 'is_deleted', 'duration', 'cost'):
+        history = state.attrs[name].history
+        if previous and history.deleted:
+            values[name] = history.deleted[0]
+        else:
+            values[name] = getattr(target, name)
+    
+    if values['date'] is None:
+        return None
+    key = (values['date'], values['service_type'] or '', values['status'] or '', bool(values['is_deleted']))
+    return key, (1, values['duration'] or 0, values['cost'] or 0)
+
+def _apply_delta(connection, key: Tuple, totals: Tuple[int, int, float], sign: int):
+    """Add (sign=1) or subtract (sign=-1) one appointment's totals from its rollup row"""
+    count, duration, cost = totals
+    row = dict(zip(ROLLUP_KEY, key))
+    table = AppointmentRollup.__table__
+    
+    insert = _UPSERT_INSERTS.get(connection.dialect.name)
+    if insert is not None:
+        stmt = insert(table).values(
+            appointment_count=sign * count, duration_total=sign * duration, cost_total=sign * cost, **row
+        )
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=list(ROLLUP_KEY),
+            set_={
+                'appointment_count': table.c.appointment_count + stmt.excluded.appointment_count,
+                'duration_total': table.c.duration_total + stmt.excluded.duration_total,
+                'cost_total': table.c.cost_total + stmt.excluded.cost_total
+            }
+        ))
+        return
+    
+    # Portable fallback: update the row in place, create it on first use
+    result = connection.execute(table.update().where(
+        *[table.c[name] == value for name, value in row.items()]
+    ).values(
+        appointment_count=table.c.appointment_count + sign * count,
+        duration_total=table.c.duration_total + sign * duration,
+        cost_total=table.c.cost_total + sign * cost
+    ))
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(
+            appointment_count=sign * count, duration_total=sign * duration, cost_total=sign * cost, **row
+        ))
+
+def _track(connection, old_state, new_state):
+    if old_state == new_state:
+        return
+    if old_state:
+        _apply_delta(connection, *old_state, sign=-1)
+    if new_state:
+        _apply_delta(connection, *new_state, sign=1)
+
+@event.listens_for(Appointment, 'after_insert')
+def _rollup_appointment_insert(mapper, connection, target):
+    _track(connection, None, _rollup_state(target))
+
+@event.listens_for(Appointment, 'after_update')
+def _rollup_appointment_update(mapper, connection, target):
+    _track(connection, _rollup_state(target, previous=True), _rollup_state(target))
+
+@event.listens_for(Appointment, 'after_delete')
+def _rollup_appointment_delete(mapper, connection, target):
+    _track(connection, _rollup_state(target, previous=True), None)
+
+def rebuild_appointment_rollup():
+    """Recompute the whole rollup from Appointment; needed after bulk writes that bypass the ORM"""
+    db.session.execute(db.delete(AppointmentRollup))
+    db.session.execute(db.insert(AppointmentRollup).from_select(
+        list(ROLLUP_KEY) + ['appointment_count', 'duration_total', 'cost_total'],
+        _grouped_appointments()
+    ))
+    db.session.commit()
+
+def remove_from_rollup(appointment_ids: List[int]):
+    """Subtract appointments from the rollup ahead of a bulk delete, which skips the mapper hooks"""
+    if not appointment_ids:
+        return
+    connection = db.session.connection()
+    rows = connection.execute(_grouped_appointments().where(Appointment.id.in_(appointment_ids))).all()
+    for day, service_type, status, is_deleted, count, duration, cost in rows:
+        _apply_delta(connection, (day, service_type, status, bool(is_deleted)), (count, duration, cost), sign=-1)
+
+def _grouped_appointments():
+    service_type = db.func.coalesce(Appointment.service_type, '')
+    status = db.func.coalesce(Appointment.status, '')
+    is_deleted = db.func.coalesce(Appointment.is_deleted, db.false())
+    return db.select(
+        Appointment.date, service_type, status, is_deleted,
+        db.func.count(Appointment.id),
+        db.func.coalesce(db.func.sum(Appointment.duration), 0),
+        db.func.coalesce(db.func.sum(Appointment.cost), 0)
+    ).group_by(Appointment.date, service_type, status, is_deleted)
+
+def _rollup_filter(query, start_date: Optional[date], end_date: Optional[date], include_deleted: bool):
+    if start_date is not None:
+        query = query.where(AppointmentRollup.date >= start_date)
+    if end_date is not None:
+        query = query.where(AppointmentRollup.date <= end_date)
+    if not include_deleted:
+        query = query.where(AppointmentRollup.is_deleted == False)
+    return query
+
+def daily_appointment_counts(start_date: Optional[date] = None, end_date: Optional[date] = None,
+                             include_deleted: bool = False) -> Dict[date, int]:
+    """Appointments per date in [start_date, end_date]; dates without appointments are left out"""
+    query = _rollup_filter(
+        db.select(AppointmentRollup.date, db.func.sum(AppointmentRollup.appointment_count)),
+        start_date, end_date, include_deleted
+    ).group_by(AppointmentRollup.date).order_by(AppointmentRollup.date)
+    return {day: int(count) for day, count in db.session.execute(query).all() if count}
+
+def appointment_counts_by_status(start_date: Optional[date] = None, end_date: Optional[date] = None,
+                                 include_deleted: bool = False) -> Dict[str, int]:
+    """Appointments per status in [start_date, end_date]"""
+    query = _rollup_filter(
+        db.select(AppointmentRollup.status, db.func.sum(AppointmentRollup.appointment_count)),
+        start_date, end_date, include_deleted
+    ).group_by(AppointmentRollup.status)
+    return {status: int(count) for status, count in db.session.execute(query).all() if count}
+
+def count_appointments(start_date: Optional[date] = None, end_date: Optional[date] = None,
+                       include_deleted: bool = False) -> int:
+    """Appointments in [start_date, end_date]"""
+    query = _rollup_filter(
+        db.select(db.func.coalesce(db.func.sum(AppointmentRollup.appointment_count), 0)).select_from(AppointmentRollup),
+        start_date, end_date, include_deleted
+    )
+    return int(db.session.execute(query).scalar())
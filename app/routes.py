@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session, send_file
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session, send_file, current_app
 from .models import db, Article, User, Appointment, MedicalRecord, DentalHistory, Service, Insurance, Notification
 from flask_login import login_user, logout_user, login_required, current_user
 from datetime import datetime, date, timedelta
@@ -8,6 +8,11 @@ from werkzeug.security import generate_password_hash
 import uuid
 from .utils import scheduler, analytics, record_manager, reminder_system, data_exporter, health_recommendations
 from .data_processor import data_processor
+from .snapshots import snapshot_scheduler
+from .retention import retention_engine
+from .charts import CHARTS, FORMATS as CHART_FORMATS, chart_renderer
+from .exports import MIMETYPES as EXPORT_MIMETYPES, export_engine
+from .export_jobs import ExportQueueFull, export_jobs
 
 bp = Blueprint('main', __name__)
 
@@ -54,19 +59,29 @@ def advanced_analytics():
         flash('Admin access required!', 'error')
         return redirect(url_for('main.home'))
     
-    # Get comprehensive analytics
-    appointment_trends = data_processor.get_appointment_trends()
-    demographics = data_processor.analyze_user_demographics()
-    service_analysis = data_processor.service_analysis()
-    demand_prediction = data_processor.predict_appointment_demand()
-    health_insights = data_processor.generate_health_insights()
+    # Read the precomputed analytics snapshot
+    snapshot = snapshot_scheduler.latest('performance_report')
+    report_data = snapshot['data']
     
     return render_template('advanced_analytics.html',
-                         appointment_trends=appointment_trends,
-                         demographics=demographics,
-                         service_analysis=service_analysis,
-                         demand_prediction=demand_prediction,
-                         health_insights=health_insights)
+                         appointment_trends=report_data['appointment_trends'],
+                         demographics=report_data['demographics'],
+                         service_analysis=report_data['service_analysis'],
+                         demand_prediction=report_data['demand_prediction'],
+                         health_insights=report_data['health_insights'],
+                         snapshot=snapshot)
+
+@bp.route('/admin/analytics/refresh', methods=['POST'])
+@login_required
+def refresh_analytics():
+    """Queue a recompute of the analytics snapshot"""
+    if not current_user.is_admin:
+        flash('Admin access required!', 'error')
+        return redirect(url_for('main.home'))
+    
+    snapshot_scheduler.request_refresh('performance_report')
+    flash('Analytics refresh queued. Reload the page in a moment to see the new figures.', 'info')
+    return redirect(request.referrer or url_for('main.advanced_analytics'))
 
 @bp.route('/api/analytics/trends')
 @login_required
@@ -123,53 +138,162 @@ def get_health_insights():
 @bp.route('/admin/export-report')
 @login_required
 def export_comprehensive_report():
-    """Export comprehensive report as Excel"""
+    """Export comprehensive report as Excel (or ?format=csv, ndjson, json)"""
     if not current_user.is_admin:
         flash('Admin access required!', 'error')
         return redirect(url_for('main.home'))
     
+    fmt = request.args.get('format', 'xlsx')
+    if request.args.get('async', type=int):
+        return _submit_export('performance_report', fmt)
+    
     try:
-        # Generate comprehensive report
-        report_data = data_processor.create_performance_report()
-        
-        # Export to Excel
-        excel_file = data_processor.export_to_excel(report_data)
-        
-        # Create filename with timestamp
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"clinic_report_{timestamp}.xlsx"
-        
-        return send_file(
-            excel_file,
-            as_attachment=True,
-            download_name=filename,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
+        sheets, filename = _performance_report_export(current_user)
+        return export_engine.response(sheets, fmt, filename)
     except Exception as e:
         flash(f'Error generating report: {str(e)}', 'error')
         return redirect(url_for('main.advanced_analytics'))
 
+# Background export jobs
+def _performance_report_export(user):
+    """Clinic performance report from the latest analytics snapshot"""
+    report_data = snapshot_scheduler.latest('performance_report')['data']
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return data_processor.report_sheets(report_data), f"clinic_report_{timestamp}"
+
+def _health_report_export(user):
+    """A patient's own health report"""
+    summary = {
+        'Name': user.full_name,
+        'Email': user.email,
+        'Phone': user.phone,
+        'Date of Birth': user.date_of_birth,
+        'Age': user.get_age(),
+        'Health Score': record_manager.get_medical_summary(user.id)['health_score'],
+        'Generated At': datetime.utcnow()
+    }
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return data_exporter.health_report_sheets(user.id, summary), f"health_report_{user.username}_{timestamp}"
+
+export_jobs.register('performance_report', _performance_report_export, admin_only=True)
+export_jobs.register('health_report', _health_report_export)
+
+def _submit_export(kind, fmt):
+    try:
+        job = export_jobs.submit(current_user, kind, fmt)
+    except PermissionError:
+        return jsonify({'error': 'Admin access required'}), 403
+    except ExportQueueFull as e:
+        return jsonify({'error': str(e)}), 429
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    job['status_url'] = url_for('main.get_export_job', job_id=job['id'])
+    job['download_url'] = url_for('main.download_export', job_id=job['id'])
+    return jsonify(job), 202
+
+@bp.route('/api/exports', methods=['POST'])
+@login_required
+def create_export_job():
+    """Queue a report export; progress arrives on the export_progress socket event or by polling"""
+    data = request.get_json(silent=True) or request.form
+    return _submit_export(data.get('kind', ''), data.get('format', 'xlsx'))
+
+def _owned_export_job(job_id):
+    job = export_jobs.get(job_id)
+    if job is None or (job['user_id'] != current_user.id and not current_user.is_admin):
+        return None
+    return job
+
+@bp.route('/api/exports/<job_id>')
+@login_required
+def get_export_job(job_id):
+    """Get export job status and progress"""
+    job = _owned_export_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Export not found'}), 404
+    
+    state = export_jobs.public(job)
+    if job['status'] == 'done':
+        state['download_url'] = url_for('main.download_export', job_id=job_id)
+    return jsonify(state)
+
+@bp.route('/api/exports/<job_id>/download')
+@login_required
+def download_export(job_id):
+    """Download a finished export"""
+    job = _owned_export_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Export not found'}), 404
+    if job['status'] != 'done':
+        return jsonify({'error': 'Export is not ready', 'status': job['status']}), 409
+    
+    path = export_jobs.artifact(job)
+    if path is None:
+        return jsonify({'error': 'Export has expired'}), 410
+    return send_file(path, as_attachment=True, download_name=job['filename'],
+                     mimetype=EXPORT_MIMETYPES[job['format']])
+
+def _chart_input(chart_type):
+    """Chart data from the analytics snapshot; a custom trends window is read from the rollup instead"""
+    days = request.args.get('days', type=int)
+    if chart_type == 'appointment_trends' and days and days != 30:
+        return data_processor.get_appointment_trends(min(days, 365))
+    return data_processor.chart_input(chart_type, snapshot_scheduler.latest('performance_report')['data'])
+
+@bp.route('/api/charts/<chart_type>')
+@login_required
+def get_chart_data(chart_type):
+    """Get chart series as columnar JSON for client-side rendering"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    try:
+        series = data_processor.chart_series(chart_type, _chart_input(chart_type))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    response = jsonify(series)
+    response.headers['Cache-Control'] = 'private, max-age=60'
+    response.add_etag(weak=True)
+    return response.make_conditional(request)
+
+@bp.route('/api/charts/<chart_type>/image')
+@login_required
+def get_chart_image(chart_type):
+    """Get a chart as a real PNG or SVG image (?format=svg, ?preset=print)"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    fmt = request.args.get('format', 'png')
+    preset = request.args.get('preset')
+    try:
+        data = _chart_input(chart_type)
+        digest = chart_renderer.digest(chart_type, data, preset, fmt)
+        if request.if_none_match.contains(digest):
+            response = current_app.response_class(status=304)
+        else:
+            response = current_app.response_class(chart_renderer.render(chart_type, data, preset, fmt),
+                                                  mimetype=CHART_FORMATS[fmt])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # The ETag is the content hash of the chart's inputs, so revalidation never renders
+    response.set_etag(digest)
+    response.headers['Cache-Control'] = 'private, max-age=300'
+    return response
+
 @bp.route('/api/visualization/<data_type>')
 @login_required
 def get_visualization(data_type):
-    """Get data visualization as base64 image"""
+    """Get data visualization as base64 image (superseded by /api/charts/<chart_type>)"""
     if not current_user.is_admin:
         return jsonify({'error': 'Admin access required'}), 403
+    if data_type not in CHARTS:
+        return jsonify({'error': 'Invalid visualization type'}), 400
     
     try:
-        if data_type == 'appointment_trends':
-            data = data_processor.get_appointment_trends()
-            image_data = data_processor.create_visualization('appointment_trends', data)
-        elif data_type == 'service_popularity':
-            service_analysis = data_processor.service_analysis()
-            popularity_data = {name: stats['total_appointments'] for name, stats in service_analysis['service_statistics'].items()}
-            image_data = data_processor.create_visualization('service_popularity', popularity_data)
-        elif data_type == 'age_distribution':
-            demographics = data_processor.analyze_user_demographics()
-            image_data = data_processor.create_visualization('age_distribution', demographics['age_distribution'])
-        else:
-            return jsonify({'error': 'Invalid visualization type'}), 400
-        
+        image_data = data_processor.create_visualization(data_type, _chart_input(data_type))
         return jsonify({'image': image_data})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -182,10 +306,10 @@ def performance_report():
         flash('Admin access required!', 'error')
         return redirect(url_for('main.home'))
     
-    # Generate comprehensive report
-    report_data = data_processor.create_performance_report()
+    # Read the precomputed report
+    snapshot = snapshot_scheduler.latest('performance_report')
     
-    return render_template('performance_report.html', report=report_data)
+    return render_template('performance_report.html', report=snapshot['data'], snapshot=snapshot)
 
 @bp.route('/api/analytics/recommendations')
 @login_required
@@ -215,6 +339,38 @@ def get_available_slots():
     except ValueError:
         return jsonify({'error': 'Invalid date format'}), 400
 
+@bp.route('/api/available-slots/range')
+@login_required
+def get_available_slots_range():
+    """Get available appointment slots across a date window in one request"""
+    service_type = request.args.get('service_type', 'checkup')
+    days = request.args.get('days', 7, type=int)
+    limit = request.args.get('limit', type=int)
+    
+    try:
+        start_date_str = request.args.get('start_date')
+        start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date() if start_date_str else date.today()
+        end_date_str = request.args.get('end_date')
+        end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date() if end_date_str else start_date + timedelta(days=days - 1)
+    except ValueError:
+        return jsonify({'error': 'Invalid date format'}), 400
+    
+    if end_date < start_date:
+        return jsonify({'error': 'end_date must not be before start_date'}), 400
+    if (end_date - start_date).days >= 62:
+        return jsonify({'error': 'Date window is limited to 62 days'}), 400
+    if limit is not None and limit < 1:
+        return jsonify({'error': 'limit must be positive'}), 400
+    
+    available_slots = scheduler.find_available_slots(start_date, end_date, service_type, limit)
+    return jsonify({
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'service_type': service_type,
+        'available_slots': available_slots,
+        'total': sum(len(slots) for slots in available_slots.values())
+    })
+
 @bp.route('/api/book-appointment', methods=['POST'])
 @login_required
 def book_appointment_api():
@@ -333,11 +489,8 @@ def smart_appointment_scheduler():
     recommendations = health_recommendations.get_dental_recommendations(current_user.id)
     
     # Get available dates for next 30 days
-    available_dates = []
-    for i in range(1, 31):
-        check_date = date.today() + timedelta(days=i)
-        if scheduler.get_available_slots(check_date):
-            available_dates.append(check_date)
+    window = scheduler.find_available_slots(date.today() + timedelta(days=1), date.today() + timedelta(days=30))
+    available_dates = [datetime.strptime(day, '%Y-%m-%d').date() for day in window]
     
     return render_template('smart_scheduler.html', 
                          user_stats=user_stats,
@@ -400,14 +553,25 @@ def admin_send_reminders():
         return redirect(url_for('main.home'))
     
     try:
-        reminder_system.send_appointment_reminders()
-        reminder_system.send_follow_up_reminders()
-        flash('Reminders sent successfully!', 'success')
+        sent = reminder_system.send_appointment_reminders() + reminder_system.send_follow_up_reminders()
+        flash(f'{sent} reminders sent successfully!', 'success')
     except Exception as e:
         flash(f'Error sending reminders: {str(e)}', 'error')
     
     return redirect(url_for('main.admin_analytics_dashboard'))
 
+@bp.route('/admin/retention/purge', methods=['POST'])
+@login_required
+def admin_purge_retention():
+    """Apply the data retention policies now"""
+    if not current_user.is_admin:
+        flash('Admin access required!', 'error')
+        return redirect(url_for('main.home'))
+    
+    results = retention_engine.run()
+    flash(f'Retention purge removed {sum(results.values())} rows.', 'success')
+    return redirect(request.referrer or url_for('main.admin_analytics_dashboard'))
+
 @bp.route('/api/search-services')
 def search_services():
     """Search for dental services"""
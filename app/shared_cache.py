@@ -0,0 +1,220 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time as clock
+from typing import Any, Dict, List, Optional
+from flask_caching.backends.base import BaseCache
+
+class SQLiteConnections:
+    """One autocommit WAL connection to a SQLite file per thread, reopened after a fork"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def get(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+class SQLiteCache(BaseCache):
+    """Flask-Caching backend shared by every worker process on one host, stored in a SQLite file
+
+    The database runs in WAL mode, so hits are one indexed read that never waits for writers.
+    Expired rows are skipped on read and purged periodically; past `threshold` rows the least
+    recently used ones are evicted. Integers are stored unpickled and inc()/dec() run inside
+    an IMMEDIATE transaction, so counters are exact across processes.
+    """
+
+    # Seconds an entry's access time may lag before a hit writes it back (approximate LRU)
+    TOUCH_INTERVAL = 30
+    # Writes between two expiry/threshold sweeps, per process
+    PRUNE_INTERVAL = 100
+
+    def __init__(self, path: str, default_timeout: int = 300, threshold: int = 500, key_prefix: str = '',
+                 ignore_errors: bool = False):
+        super().__init__(default_timeout=default_timeout)
+        self.path = path
+        self.threshold = threshold
+        self.key_prefix = key_prefix
+        self.ignore_errors = ignore_errors
+        self._connections = SQLiteConnections(path)
+        self._writes = 0
+
+        connection = self._connection()
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            'key TEXT PRIMARY KEY, value BLOB, expires REAL NOT NULL, accessed REAL NOT NULL)'
+        )
+        connection.execute('CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache (accessed)')
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        kwargs.update(dict(
+            path=config.get('CACHE_SQLITE_PATH') or os.path.join(app.instance_path, 'cache.sqlite3'),
+            threshold=config['CACHE_THRESHOLD'],
+            key_prefix=config['CACHE_KEY_PREFIX'] or '',
+            ignore_errors=config['CACHE_IGNORE_ERRORS']
+        ))
+        return cls(*args, **kwargs)
+
+    def _connection(self) -> sqlite3.Connection:
+        return self._connections.get()
+
+    def _key(self, key: str) -> str:
+        return f"{self.key_prefix}{key}"
+
+    def _expires(self, timeout: Optional[int]) -> float:
+        timeout = self._normalize_timeout(timeout)
+        return clock.time() + timeout if timeout > 0 else 0
+
+    def _dump(self, value: Any):
+        if type(value) is int:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def _load(self, value: Any) -> Any:
+        if isinstance(value, bytes):
+            return pickle.loads(value)
+        return value
+
+    def _alive(self, expires: float, now: float) -> bool:
+        return expires == 0 or expires > now
+
+    def _wrote(self, connection: sqlite3.Connection, count: int = 1):
+        self._writes += count
+        if self._writes >= self.PRUNE_INTERVAL:
+            self._writes = 0
+            self._prune(connection)
+
+    def _prune(self, connection: sqlite3.Connection):
+        """Drop expired rows, then the least recently used ones beyond the threshold"""
+        connection.execute('DELETE FROM cache WHERE expires != 0 AND expires <= ?', (clock.time(),))
+        if self.threshold:
+            excess = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0] - self.threshold
+            if excess > 0:
+                connection.execute(
+                    'DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed LIMIT ?)', (excess,)
+                )
+
+    def get(self, key: str) -> Any:
+        connection = self._connection()
+        row = connection.execute(
+            'SELECT value, expires, accessed FROM cache WHERE key = ?', (self._key(key),)
+        ).fetchone()
+        if row is None:
+            return None
+
+        value, expires, accessed = row
+        now = clock.time()
+        if not self._alive(expires, now):
+            return None
+        if now - accessed > self.TOUCH_INTERVAL:
+            connection.execute('UPDATE cache SET accessed = ? WHERE key = ?', (now, self._key(key)))
+        return self._load(value)
+
+    def get_many(self, *keys: str) -> List[Any]:
+        if not keys:
+            return []
+        rows = self._connection().execute(
+            f"SELECT key, value, expires FROM cache WHERE key IN ({','.join('?' * len(keys))})",
+            [self._key(key) for key in keys]
+        ).fetchall()
+
+        now = clock.time()
+        found = {key: self._load(value) for key, value, expires in rows if self._alive(expires, now)}
+        return [found.get(self._key(key)) for key in keys]
+
+    def get_dict(self, *keys: str) -> Dict[str, Any]:
+        return dict(zip(keys, self.get_many(*keys)))
+
+    def has(self, key: str) -> bool:
+        row = self._connection().execute('SELECT expires FROM cache WHERE key = ?', (self._key(key),)).fetchone()
+        return row is not None and self._alive(row[0], clock.time())
+
+    def set(self, key: str, value: Any, timeout: Optional[int] = None) -> bool:
+        connection = self._connection()
+        connection.execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)',
+            (self._key(key), self._dump(value), self._expires(timeout), clock.time())
+        )
+        self._wrote(connection)
+        return True
+
+    def set_many(self, mapping: Dict[str, Any], timeout: Optional[int] = None) -> List[Any]:
+        connection = self._connection()
+        expires, now = self._expires(timeout), clock.time()
+        connection.execute('BEGIN')
+        try:
+            connection.executemany(
+                'INSERT OR REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)',
+                [(self._key(key), self._dump(value), expires, now) for key, value in mapping.items()]
+            )
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            if not self.ignore_errors:
+                raise
+            return []
+        self._wrote(connection, len(mapping))
+        return list(mapping)
+
+    def add(self, key: str, value: Any, timeout: Optional[int] = None) -> bool:
+        """Store the value only when the key is missing or expired; atomic across processes"""
+        connection = self._connection()
+        now = clock.time()
+        cursor = connection.execute(
+            'INSERT INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires = excluded.expires, '
+            'accessed = excluded.accessed WHERE cache.expires != 0 AND cache.expires <= ?',
+            (self._key(key), self._dump(value), self._expires(timeout), now, now)
+        )
+        self._wrote(connection)
+        return cursor.rowcount == 1
+
+    def delete(self, key: str) -> bool:
+        cursor = self._connection().execute('DELETE FROM cache WHERE key = ?', (self._key(key),))
+        return cursor.rowcount > 0
+
+    def delete_many(self, *keys: str) -> List[Any]:
+        if keys:
+            self._connection().execute(
+                f"DELETE FROM cache WHERE key IN ({','.join('?' * len(keys))})", [self._key(key) for key in keys]
+            )
+        return list(keys)
+
+    def clear(self) -> bool:
+        self._connection().execute('DELETE FROM cache')
+        return True
+
+    def inc(self, key: str, delta: int = 1) -> Optional[int]:
+        """Atomically add delta to an integer entry, creating it with the default timeout"""
+        connection = self._connection()
+        now = clock.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT value, expires FROM cache WHERE key = ?', (self._key(key),)).fetchone()
+            if row is not None and self._alive(row[1], now):
+                value, expires = (self._load(row[0]) or 0) + delta, row[1]
+            else:
+                value, expires = delta, self._expires(None)
+            connection.execute(
+                'INSERT OR REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)',
+                (self._key(key), self._dump(value), expires, now)
+            )
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        self._wrote(connection)
+        return value
+
+    def dec(self, key: str, delta: int = 1) -> Optional[int]:
+        return self.inc(key, -delta)
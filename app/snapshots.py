@@ -0,0 +1,120 @@
+import logging
+import os
+import queue
+import threading
+import time as clock
+from datetime import datetime
+from typing import Callable, Dict, Optional
+from .extensions import cache, config_value, db
+from .data_processor import data_processor
+
+logger = logging.getLogger(__name__)
+
+class SnapshotScheduler:
+    """Precomputes expensive analytics in a background thread and serves the latest versioned result
+    
+    Snapshots live in the shared cache, so every worker reads the same result; a short
+    add() lock makes sure only one worker computes a given snapshot at a time.
+    """
+    
+    def __init__(self, prefix: str = 'snapshot'):
+        self.prefix = prefix
+        self.jobs: Dict[str, Callable[[], Dict]] = {}
+        self._queue: 'queue.Queue[str]' = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_pid: Optional[int] = None
+        self._started = threading.Lock()
+        self._app = None
+    
+    def register(self, name: str, compute: Callable[[], Dict]):
+        """Add a snapshot job; compute runs inside an app context"""
+        self.jobs[name] = compute
+    
+    def init_app(self, app):
+        # The worker starts with the first request so CLI commands and migrations never spawn it
+        self._app = app
+        app.before_request(self._ensure_started)
+    
+    def _interval(self) -> int:
+        return config_value('ANALYTICS_SNAPSHOT_INTERVAL', self._app)
+    
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive() and self._thread_pid == os.getpid():
+            return
+        with self._started:
+            if self._thread is None or not self._thread.is_alive() or self._thread_pid != os.getpid():
+                self._thread_pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='analytics-snapshots', daemon=True)
+                self._thread.start()
+    
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}:{name}"
+    
+    def latest(self, name: str) -> Dict:
+        """Latest snapshot entry (version, generated_at, duration_ms, data); computed inline only on a cold cache"""
+        entry = cache.get(self._key(name))
+        if entry is None:
+            entry = self.refresh(name)
+        if entry is None:
+            # Another worker holds the lock for the first snapshot; answer this request without storing
+            entry = {'version': 0, 'generated_at': datetime.utcnow(), 'duration_ms': None, 'data': self.jobs[name]()}
+        return entry
+    
+    def request_refresh(self, name: str):
+        """Queue a recompute without waiting for it"""
+        if name not in self.jobs:
+            raise KeyError(name)
+        self._ensure_started()
+        self._queue.put(name)
+    
+    def refresh(self, name: str, force: bool = True) -> Optional[Dict]:
+        """Recompute one snapshot now, unless another worker is already doing it"""
+        key = self._key(name)
+        if not force:
+            current = cache.get(key)
+            if current and (datetime.utcnow() - current['generated_at']).total_seconds() < self._interval():
+                return current
+        
+        lock_key = f"{key}:lock"
+        if not cache.add(lock_key, os.getpid(), timeout=600):
+            return cache.get(key)
+        try:
+            started = clock.perf_counter()
+            data = self.jobs[name]()
+            entry = {
+                'version': cache.cache.inc(f"{key}:version"),
+                'generated_at': datetime.utcnow(),
+                'duration_ms': round((clock.perf_counter() - started) * 1000, 1),
+                'data': data
+            }
+            cache.set(key, entry, timeout=0)
+            return entry
+        finally:
+            cache.delete(lock_key)
+    
+    def _run(self):
+        """Worker loop: refresh every job on the configured cadence, or sooner when asked"""
+        next_run = {name: 0.0 for name in self.jobs}
+        while True:
+            wait = max(0.0, min(next_run.values(), default=clock.monotonic() + 60) - clock.monotonic())
+            try:
+                due = {self._queue.get(timeout=wait)}
+                forced = True
+            except queue.Empty:
+                now = clock.monotonic()
+                due = {name for name, when in next_run.items() if when <= now}
+                forced = False
+            
+            for name in due:
+                with self._app.app_context():
+                    try:
+                        self.refresh(name, force=forced)
+                    except Exception as e:
+                        logger.error(f"Error computing {name} snapshot: {str(e)}")
+                    finally:
+                        db.session.remove()
+                next_run[name] = clock.monotonic() + self._interval()
+
+# Initialize the snapshot scheduler
+snapshot_scheduler = SnapshotScheduler()
+snapshot_scheduler.register('performance_report', data_processor.create_performance_report)
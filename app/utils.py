@@ -1,9 +1,18 @@
-from datetime import datetime, date, timedelta
+from datetime import datetime, date, time, timedelta
 from .models import db, Appointment, User, MedicalRecord, DentalHistory, Service, Notification
 import json
+import logging
 import re
 from typing import List, Dict, Optional, Tuple
 import random
+from config import Config
+from sqlalchemy.exc import IntegrityError
+from .availability import AvailabilityIndex, from_minute, to_minute
+from .rollups import appointment_counts_by_status
+from .exports import ExportSheet, query_rows
+from .notifications import claim_reminders, create_notifications
+
+logger = logging.getLogger(__name__)
 
 class AppointmentScheduler:
     """Advanced appointment scheduling system"""
@@ -27,79 +36,111 @@ class AppointmentScheduler:
             'consultation': 30,
             'emergency': 60
         }
+        self.slot_step = 30  # minutes between offered start times
+        self.availability = AvailabilityIndex(self.working_hours, Config.APPOINTMENT_SLOT_INTERVAL)
     
     def get_available_slots(self, target_date: date, service_type: str = 'checkup') -> List[str]:
         """Get available time slots for a specific date and service"""
         duration = self.appointment_durations.get(service_type, 60)
-        day_name = target_date.strftime('%A').lower()
         
-        if day_name not in self.working_hours or not self.working_hours[day_name]['start']:
+        # Per-resource bitmaps for the day (None when no chair is working)
+        day = self.availability.get_day(target_date)
+        if day is None:
             return []
         
-        start_time = datetime.strptime(self.working_hours[day_name]['start'], '%H:%M')
-        end_time = datetime.strptime(self.working_hours[day_name]['end'], '%H:%M')
-        
-        # Get existing appointments for this date
-        existing_appointments = Appointment.query.filter_by(date=target_date).all()
-        booked_times = []
-        
-        for apt in existing_appointments:
-            apt_start = apt.time
-            apt_end = (datetime.combine(date.today(), apt.time) + 
-                      timedelta(minutes=apt.duration or 60)).time()
-            booked_times.append((apt_start, apt_end))
-        
-        # Generate available slots
-        available_slots = []
-        current_time = start_time
-        
-        while current_time + timedelta(minutes=duration) <= end_time:
-            slot_start = current_time.time()
-            slot_end = (current_time + timedelta(minutes=duration)).time()
-            
-            # Check if slot conflicts with existing appointments
-            is_available = True
-            for booked_start, booked_end in booked_times:
-                if (slot_start < booked_end and slot_end > booked_start):
-                    is_available = False
-                    break
-            
-            if is_available:
-                available_slots.append(slot_start.strftime('%H:%M'))
+        return [from_minute(minute) for minute in day.free_starts(duration, self.slot_step)]
+    
+    def find_available_slots(self, start_date: date, end_date: date, service_type: str = 'checkup',
+                             limit: int = None) -> Dict[str, List[str]]:
+        """Get available slots for every date in a window, optionally only the first `limit` slots"""
+        duration = self.appointment_durations.get(service_type, 60)
+        days = self.availability.get_days(start_date, end_date)
+        
+        available = {}
+        remaining = limit
+        for target_date in sorted(days):
+            day = days[target_date]
+            if day is None:
+                continue
             
-            current_time += timedelta(minutes=30)  # 30-minute intervals
-        
-        return available_slots
+            slots = [from_minute(minute) for minute in day.free_starts(duration, self.slot_step)]
+            if remaining is not None:
+                slots = slots[:remaining]
+                remaining -= len(slots)
+            if slots:
+                available[target_date.isoformat()] = slots
+            if remaining is not None and remaining <= 0:
+                break
+        
+        return available
     
     def book_appointment(self, user_id: int, service_type: str, appointment_date: date, 
                         appointment_time: str, notes: str = None) -> Tuple[bool, str]:
-        """Book an appointment with conflict checking"""
-        # Check if slot is still available
-        available_slots = self.get_available_slots(appointment_date, service_type)
-        if appointment_time not in available_slots:
+        """Book an appointment on a free resource; the slot reservation insert is what decides conflicts"""
+        duration = self.appointment_durations.get(service_type, 60)
+        start_time = datetime.strptime(appointment_time, '%H:%M').time()
+        
+        # Cheap pre-check against the in-memory index (also rejects times outside working hours)
+        candidates = self.free_resources(appointment_date, start_time, duration)
+        if not candidates:
+            if not self.availability.has_resources():
+                # A database built with create_all() has no Resource rows until setup_admin.py or the migration adds one
+                logger.error("Booking refused: no active resource is configured")
+                return False, "Online booking is not configured yet; please contact the clinic"
             return False, "Selected time slot is no longer available"
         
+        user = User.query.get(user_id)
+        if not user:
+            return False, "Unknown user"
+        if not user.phone:
+            return False, "Please add a phone number to your profile before booking"
+        
         # Create appointment
         try:
-            appointment = Appointment(
+            appointment = self.create_booking(
+                candidates,
                 user_id=user_id,
+                name=user.full_name,
+                email=user.email,
+                phone=user.phone,
                 service_type=service_type,
                 date=appointment_date,
-                time=datetime.strptime(appointment_time, '%H:%M').time(),
-                duration=self.appointment_durations.get(service_type, 60),
+                time=start_time,
+                duration=duration,
                 notes=notes,
                 status='scheduled'
             )
-            db.session.add(appointment)
-            db.session.commit()
-            
-            # Create notification
-            self.create_appointment_notification(appointment)
-            
-            return True, "Appointment booked successfully"
         except Exception as e:
             db.session.rollback()
             return False, f"Error booking appointment: {str(e)}"
+        
+        if appointment is None:
+            return False, "Selected time slot is no longer available"
+        
+        # Create notification
+        self.create_appointment_notification(appointment)
+        
+        return True, "Appointment booked successfully"
+    
+    def free_resources(self, appointment_date: date, start_time: time, duration: int) -> List[int]:
+        """Ids of the resources that can take a booking, least booked first"""
+        day = self.availability.get_day(appointment_date)
+        if day is None:
+            return []
+        return day.free_resources(to_minute(start_time), duration)
+    
+    def create_booking(self, candidates: List[int], **fields) -> Optional[Appointment]:
+        """Commit an appointment on the first candidate resource whose slots are still free"""
+        for resource_id in candidates:
+            appointment = Appointment(resource_id=resource_id, **fields)
+            try:
+                db.session.add(appointment)
+                db.session.commit()
+                return appointment
+            except IntegrityError:
+                # Another request reserved an overlapping slot on this resource first
+                db.session.rollback()
+        return None
     
     def create_appointment_notification(self, appointment: Appointment):
         """Create notification for new appointment"""
@@ -259,53 +300,54 @@ class ReminderSystem:
     """Automated reminder system for appointments and follow-ups"""
     
     @staticmethod
-    def send_appointment_reminders():
+    def send_appointment_reminders() -> int:
         """Send reminders for upcoming appointments"""
         tomorrow = date.today() + timedelta(days=1)
-        upcoming_appointments = Appointment.query.filter_by(
-            date=tomorrow,
-            status='scheduled',
-            reminder_sent=False
+        upcoming_appointments = db.session.execute(
+            db.select(Appointment.id, Appointment.user_id, Appointment.service_type, Appointment.time)
+            .join(User, User.id == Appointment.user_id)
+            .where(
+                Appointment.date == tomorrow,
+                Appointment.status == 'scheduled',
+                Appointment.reminder_sent.isnot(True)
+            )
         ).all()
         
-        for appointment in upcoming_appointments:
-            user = User.query.get(appointment.user_id)
-            if user:
-                notification = Notification(
-                    user_id=appointment.user_id,
-                    title="Appointment Reminder",
-                    message=f"Reminder: You have a {appointment.service_type} appointment tomorrow "
-                           f"at {appointment.time.strftime('%I:%M %p')}",
-                    notification_type='reminder'
-                )
-                db.session.add(notification)
-                appointment.reminder_sent = True
-        
+        # Only reminders this call claims are sent, so overlapping runs never send one twice
+        claimed = claim_reminders({appointment.id: appointment.user_id for appointment in upcoming_appointments})
+        reminders = {appointment.id: appointment for appointment in upcoming_appointments}
+        create_notifications([{
+            'user_id': reminders[appointment_id].user_id,
+            'title': "Appointment Reminder",
+            'message': f"Reminder: You have a {reminders[appointment_id].service_type} appointment tomorrow "
+                       f"at {reminders[appointment_id].time.strftime('%I:%M %p')}",
+            'notification_type': 'reminder'
+        } for appointment_id in claimed], commit=False)
         db.session.commit()
+        return len(claimed)
     
     @staticmethod
-    def send_follow_up_reminders():
+    def send_follow_up_reminders() -> int:
         """Send follow-up reminders for completed procedures"""
         # Find appointments completed 6 months ago that need follow-up
         six_months_ago = date.today() - timedelta(days=180)
-        completed_appointments = Appointment.query.filter(
-            Appointment.date == six_months_ago,
-            Appointment.status == 'completed'
+        completed_appointments = db.session.execute(
+            db.select(Appointment.user_id, Appointment.service_type)
+            .join(User, User.id == Appointment.user_id)
+            .where(
+                Appointment.date == six_months_ago,
+                Appointment.status == 'completed'
+            )
         ).all()
         
-        for appointment in completed_appointments:
-            user = User.query.get(appointment.user_id)
-            if user:
-                notification = Notification(
-                    user_id=appointment.user_id,
-                    title="Follow-up Reminder",
-                    message=f"It's been 6 months since your {appointment.service_type}. "
-                           f"Consider scheduling a follow-up appointment.",
-                    notification_type='reminder'
-                )
-                db.session.add(notification)
-        
-        db.session.commit()
+        create_notifications([{
+            'user_id': appointment.user_id,
+            'title': "Follow-up Reminder",
+            'message': f"It's been 6 months since your {appointment.service_type}. "
+                       f"Consider scheduling a follow-up appointment.",
+            'notification_type': 'reminder'
+        } for appointment in completed_appointments])
+        return len(completed_appointments)
 
 class DataExporter:
     """Export data for reporting and analysis"""
@@ -371,6 +413,27 @@ class DataExporter:
             ]
         }
     
+    @staticmethod
+    def health_report_sheets(user_id: int, summary: Dict) -> List[ExportSheet]:
+        """Patient health report as export sheets; record sheets are streamed from the database"""
+        return [
+            ExportSheet('Summary', list(summary.keys()), [list(summary.values())]),
+            ExportSheet('Medical Records', ['Title', 'Type', 'Date', 'Description', 'Severity'],
+                        query_rows(db.select(
+                            MedicalRecord.title, MedicalRecord.record_type, MedicalRecord.date_recorded,
+                            MedicalRecord.description, MedicalRecord.severity
+                        ).where(MedicalRecord.user_id == user_id).order_by(MedicalRecord.date_recorded.desc()))),
+            ExportSheet('Dental History', ['Procedure', 'Date', 'Description', 'Cost'],
+                        query_rows(db.select(
+                            DentalHistory.procedure_type, DentalHistory.procedure_date,
+                            DentalHistory.description, DentalHistory.cost
+                        ).where(DentalHistory.user_id == user_id).order_by(DentalHistory.procedure_date.desc()))),
+            ExportSheet('Appointments', ['Date', 'Time', 'Service', 'Status'],
+                        query_rows(db.select(
+                            Appointment.date, Appointment.time, Appointment.service_type, Appointment.status
+                        ).where(Appointment.user_id == user_id).order_by(Appointment.date.desc(), Appointment.time.desc())))
+        ]
+    
     @staticmethod
     def generate_monthly_report(month: int, year: int) -> Dict:
         """Generate monthly clinic report"""
@@ -380,10 +443,8 @@ class DataExporter:
         else:
             end_date = date(year, month + 1, 1)
         
-        appointments = Appointment.query.filter(
-            Appointment.date >= start_date,
-            Appointment.date < end_date
-        ).all()
+        # Status totals from the maintained rollup
+        status_counts = appointment_counts_by_status(start_date, end_date - timedelta(days=1), include_deleted=True)
         
         new_users = User.query.filter(
             User.created_at >= start_date,
@@ -398,13 +459,13 @@ class DataExporter:
         return {
             'month': month,
             'year': year,
-            'total_appointments': len(appointments),
+            'total_appointments': sum(status_counts.values()),
             'new_users': new_users,
             'total_revenue': revenue,
             'appointments_by_status': {
-                'scheduled': len([apt for apt in appointments if apt.status == 'scheduled']),
-                'completed': len([apt for apt in appointments if apt.status == 'completed']),
-                'cancelled': len([apt for apt in appointments if apt.status == 'cancelled'])
+                'scheduled': status_counts.get('scheduled', 0),
+                'completed': status_counts.get('completed', 0),
+                'cancelled': status_counts.get('cancelled', 0)
             }
         }
 
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Compare Flask-Caching backends: simple (per process), filesystem and the shared SQLite cache
+
+Reports median per-operation latency for hits, misses and sets, then has several
+processes increment one counter to show which backends share state across workers.
+
+Usage: python benchmarks/bench_cache_backends.py [operations] [processes]
+"""
+
+import sys
+import shutil
+import tempfile
+import time
+import multiprocessing
+from statistics import median
+
+from flask import Flask
+from flask_caching import Cache
+
+from common import report
+
+PAYLOAD = {'dates': [f'2024-01-{day:02d}' for day in range(1, 31)], 'counts': list(range(30)), 'average_daily': 14.5}
+
+
+def make_cache(backend, directory):
+    config = {'CACHE_TYPE': backend, 'CACHE_DEFAULT_TIMEOUT': 300, 'CACHE_THRESHOLD': 100000}
+    if backend == 'FileSystemCache':
+        config['CACHE_DIR'] = f'{directory}/fs'
+    if backend == 'app.shared_cache.SQLiteCache':
+        config['CACHE_SQLITE_PATH'] = f'{directory}/cache.sqlite3'
+    app = Flask(__name__)
+    cache = Cache(app, config=config)
+    return app, cache
+
+
+def per_op_us(fn, operations, repeat=5):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for i in range(operations):
+            fn(i)
+        samples.append((time.perf_counter() - start) / operations * 1e6)
+    return median(samples)
+
+
+def increment(backend, directory, count):
+    # Flask-Caching's Cache has no inc(); counters are a backend operation
+    app, cache = make_cache(backend, directory)
+    with app.app_context():
+        for _ in range(count):
+            cache.cache.inc('shared_counter')
+
+
+def main(operations=2000, processes=4):
+    rows = []
+    for backend in ('SimpleCache', 'FileSystemCache', 'app.shared_cache.SQLiteCache'):
+        directory = tempfile.mkdtemp(prefix='bench_cache_')
+        try:
+            app, cache = make_cache(backend, directory)
+            with app.app_context():
+                for i in range(operations):
+                    cache.set(f'key{i}', PAYLOAD)
+                
+                hit_us = per_op_us(lambda i: cache.get(f'key{i}'), operations)
+                miss_us = per_op_us(lambda i: cache.get(f'missing{i}'), operations)
+                set_us = per_op_us(lambda i: cache.set(f'key{i}', PAYLOAD), operations, repeat=3)
+                cache.set('shared_counter', 0)
+            
+            workers = [
+                multiprocessing.Process(target=increment, args=(backend, directory, operations // 10))
+                for _ in range(processes)
+            ]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            failed = [worker.exitcode for worker in workers if worker.exitcode != 0]
+            if failed:
+                raise RuntimeError(f'{backend}: {len(failed)} increment processes failed (exit codes {failed})')
+            
+            with app.app_context():
+                seen = cache.get('shared_counter') or 0
+            rows.append((backend.rsplit('.', 1)[-1], hit_us, miss_us, set_us, f'{seen}/{processes * (operations // 10)}'))
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    
+    report('cache backends: median latency per operation (us) and cross-process counter',
+           ['backend', 'hit', 'miss', 'set', 'shared incs'], rows)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
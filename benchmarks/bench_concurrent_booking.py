@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Concurrency stress test for AppointmentScheduler.book_appointment
+
+Many threads book random slots over the same few days. Afterwards the script
+asserts that no two active appointments on the same chair overlap and prints
+the throughput of each round. Slot conflicts are counted as rejections; any
+other failure is an error, and a round with errors or without a single booking
+fails the run.
+
+Usage: python benchmarks/bench_concurrent_booking.py [threads] [attempts_per_thread] [rounds] [chairs]
+"""
+
+import sys
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+
+from common import make_app, drop_app, seed, db
+from app.models import Appointment
+from app.utils import scheduler
+
+# The message book_appointment returns when every candidate chair was taken
+SLOT_TAKEN = "Selected time slot is no longer available"
+
+
+def working_days(count):
+    days = []
+    current = date.today() + timedelta(days=1)
+    while len(days) < count:
+        if scheduler.working_hours[current.strftime('%A').lower()]['start']:
+            days.append(current)
+        current += timedelta(days=1)
+    return days
+
+
+def worker(app, days, attempts, seed_value, outcomes, errors):
+    rng = random.Random(seed_value)
+    services = list(scheduler.appointment_durations)
+    with app.app_context():
+        for _ in range(attempts):
+            target_date = rng.choice(days)
+            slot = f"{rng.randint(9, 16):02d}:{rng.choice(['00', '30'])}"
+            try:
+                ok, message = scheduler.book_appointment(rng.randint(1, 50), rng.choice(services), target_date, slot)
+            except Exception as e:
+                db.session.rollback()
+                ok, message = False, f"{type(e).__name__}: {e}"
+            if ok:
+                outcomes['booked'] += 1
+            elif message == SLOT_TAKEN:
+                outcomes['rejected'] += 1
+            else:
+                outcomes['error'] += 1
+                errors[message] += 1
+
+
+def assert_no_overlaps():
+    bookings = defaultdict(list)
+    for apt in Appointment.query.filter(Appointment.status != 'cancelled', Appointment.is_deleted == False).all():
+        start = datetime.combine(apt.date, apt.time)
+        bookings[(apt.resource_id, apt.date)].append((start, start + timedelta(minutes=apt.duration or 60)))
+    
+    for (resource_id, day), intervals in bookings.items():
+        intervals.sort()
+        for (_, prev_end), (next_start, _) in zip(intervals, intervals[1:]):
+            assert next_start >= prev_end, f"Overlapping bookings on resource {resource_id} on {day}"
+    return sum(len(v) for v in bookings.values())
+
+
+def main(threads=16, attempts=50, rounds=3, chairs=3):
+    app, path = make_app()
+    try:
+        with app.app_context():
+            seed(users=50, appointments=0, resources=chairs)
+        days = working_days(3)
+        
+        for ttl, label in ((60, 'index pre-check'), (0, 'db constraint only')):
+            scheduler.availability.ttl = ttl
+            for round_number in range(1, rounds + 1):
+                with app.app_context():
+                    Appointment.query.delete()
+                    db.session.execute(db.text('DELETE FROM slot_reservation'))
+                    db.session.commit()
+                scheduler.availability.invalidate()
+                
+                per_thread = [Counter() for _ in range(threads)]
+                errors = Counter()
+                pool = [
+                    threading.Thread(target=worker,
+                                     args=(app, days, attempts, round_number * 1000 + i, per_thread[i], errors))
+                    for i in range(threads)
+                ]
+                start = time.perf_counter()
+                for thread in pool:
+                    thread.start()
+                for thread in pool:
+                    thread.join()
+                elapsed = time.perf_counter() - start
+                outcomes = sum(per_thread, Counter())
+                
+                with app.app_context():
+                    stored = assert_no_overlaps()
+                
+                total = threads * attempts
+                print(f"[{label}, {chairs} chairs] round {round_number}: {total} attempts in {elapsed:.2f}s "
+                      f"({total / elapsed:.0f} attempts/s), booked={outcomes['booked']} "
+                      f"rejected={outcomes['rejected']} errors={outcomes['error']} stored={stored} overlaps=0")
+                
+                for message, count in errors.most_common(5):
+                    print(f"  error x{count}: {message}")
+                if outcomes['error'] or not outcomes['booked']:
+                    raise SystemExit(f"FAILED: booked={outcomes['booked']} errors={outcomes['error']}; "
+                                     "the overlap check proves nothing unless bookings succeed")
+    finally:
+        drop_app(path)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:5]])
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark DataProcessor.generate_health_insights against the previous per-user rescan
+
+The previous implementation is O(users x records), so it is only timed while
+users * records stays below LEGACY_LIMIT; larger sizes report the SQL path alone.
+
+Usage: python benchmarks/bench_health_insights.py [users:records ...]
+"""
+
+import sys
+
+from common import make_app, drop_app, seed, timeit, report, db
+from app.models import User, MedicalRecord, DentalHistory
+from app.data_processor import data_processor
+
+LEGACY_LIMIT = 5 * 10 ** 8
+
+
+def legacy_health_insights():
+    """Previous implementation: load both tables, rescan them for every user"""
+    medical_records = MedicalRecord.query.all()
+    dental_history = DentalHistory.query.all()
+    
+    conditions = {}
+    for record in medical_records:
+        if record.record_type == 'medical':
+            condition = record.title.lower()
+            conditions[condition] = conditions.get(condition, 0) + 1
+    
+    procedures = {}
+    for record in dental_history:
+        procedure = record.procedure_type.lower()
+        procedures[procedure] = procedures.get(procedure, 0) + 1
+    
+    correlations = {}
+    for user in User.query.all():
+        user_conditions = [r.title.lower() for r in medical_records if r.user_id == user.id and r.record_type == 'medical']
+        user_procedures = [r.procedure_type.lower() for r in dental_history if r.user_id == user.id]
+        for condition in user_conditions:
+            for procedure in user_procedures:
+                key = f"{condition} -> {procedure}"
+                correlations[key] = correlations.get(key, 0) + 1
+    
+    return {
+        'common_conditions': dict(sorted(conditions.items(), key=lambda x: x[1], reverse=True)[:10]),
+        'common_procedures': dict(sorted(procedures.items(), key=lambda x: x[1], reverse=True)[:10]),
+        'condition_procedure_correlations': dict(sorted(correlations.items(), key=lambda x: x[1], reverse=True)[:10]),
+        'total_medical_records': len(medical_records),
+        'total_dental_procedures': len(dental_history)
+    }
+
+
+def assert_same(legacy, current):
+    """Both paths agree; ties may be ordered differently, so compare the counts"""
+    for key in ('common_conditions', 'common_procedures', 'condition_procedure_correlations'):
+        assert sorted(legacy[key].values()) == sorted(current[key].values()), key
+        for name, count in current[key].items():
+            assert legacy[key].get(name, count) == count, (key, name)
+    assert legacy['total_medical_records'] == current['total_medical_records']
+    assert legacy['total_dental_procedures'] == current['total_dental_procedures']
+
+
+def main(sizes):
+    rows = []
+    for users, records in sizes:
+        app, path = make_app()
+        try:
+            with app.app_context():
+                seed(users=users, appointments=0, dental_records=records // 2, medical_records=records // 2)
+                
+                sql_ms = timeit(lambda: data_processor.generate_health_insights(), repeat=3)
+                if users * records <= LEGACY_LIMIT:
+                    assert_same(legacy_health_insights(), data_processor.generate_health_insights())
+                    db.session.expire_all()
+                    legacy_ms = timeit(lambda: (legacy_health_insights(), db.session.expire_all()), repeat=1)
+                    rows.append((users, records, legacy_ms, sql_ms, legacy_ms / sql_ms if sql_ms else 0.0))
+                else:
+                    rows.append((users, records, 'skipped', sql_ms, '-'))
+        finally:
+            drop_app(path)
+    
+    report('generate_health_insights: per-user rescan vs grouped join (median ms)',
+           ['users', 'records', 'rescan', 'grouped join', 'speedup'], rows)
+
+
+if __name__ == '__main__':
+    sizes = [tuple(int(part) for part in arg.split(':')) for arg in sys.argv[1:]]
+    main(sizes or [(1000, 10000), (10000, 100000), (100000, 1000000)])
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark the per-request decision cost of app.rate_limiter
+
+For each cache backend, reports the median cost of one RateLimiter.hit() call and
+checks that concurrent threads hitting one key are admitted exactly `limit` times.
+
+Usage: python benchmarks/bench_rate_limiter.py [decisions] [threads]
+"""
+
+import sys
+import shutil
+import tempfile
+import threading
+import time
+from statistics import median
+
+from flask import Flask
+
+from common import report
+from app.extensions import cache
+from app.rate_limiter import rate_limiter
+
+
+def make_app(backend, directory):
+    app = Flask(__name__)
+    app.config.update({'CACHE_TYPE': backend, 'CACHE_THRESHOLD': 100000,
+                       'CACHE_SQLITE_PATH': f'{directory}/cache.sqlite3'})
+    cache.init_app(app)
+    return app
+
+
+def decision_us(app, decisions, repeat=5):
+    samples = []
+    with app.app_context():
+        for round_number in range(repeat):
+            start = time.perf_counter()
+            for i in range(decisions):
+                rate_limiter.hit(f'bench:{round_number}:{i % 100}', 1000, 3600)
+            samples.append((time.perf_counter() - start) / decisions * 1e6)
+    return median(samples)
+
+
+def admitted_under_contention(app, threads, limit):
+    admitted = [0] * threads
+    
+    def worker(index):
+        with app.app_context():
+            for _ in range(limit):
+                if rate_limiter.hit('contended', limit, 3600).allowed:
+                    admitted[index] += 1
+    
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return sum(admitted)
+
+
+def main(decisions=5000, threads=8):
+    rows = []
+    for backend in ('SimpleCache', 'app.shared_cache.SQLiteCache'):
+        directory = tempfile.mkdtemp(prefix='bench_ratelimit_')
+        try:
+            app = make_app(backend, directory)
+            cost = decision_us(app, decisions)
+            limit = 200
+            admitted = admitted_under_contention(app, threads, limit)
+            rows.append((backend.rsplit('.', 1)[-1], cost, f'{admitted}/{limit}'))
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    
+    report('rate limiter: median decision cost (us) and admissions under contention',
+           ['backend', 'per decision', 'admitted'], rows)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Benchmark DataProcessor.service_analysis against the previous in-Python scan
+
+Usage: python benchmarks/bench_service_analysis.py [row counts...]
+"""
+
+import sys
+
+from common import make_app, drop_app, seed, timeit, report, db
+from app.models import Appointment, Service, DentalHistory
+from app.data_processor import data_processor
+
+
+def legacy_service_analysis():
+    """Previous implementation: load every row, filter per service in Python"""
+    services = Service.query.all()
+    appointments = Appointment.query.all()
+    
+    service_stats = {}
+    for service in services:
+        service_appointments = [apt for apt in appointments if apt.service_type == service.name]
+        completed = len([apt for apt in service_appointments if apt.status == 'completed'])
+        service_stats[service.name] = {
+            'total_appointments': len(service_appointments),
+            'completed': completed,
+            'cancelled': len([apt for apt in service_appointments if apt.status == 'cancelled']),
+            'completion_rate': completed / len(service_appointments) * 100 if service_appointments else 0
+        }
+    
+    revenue_by_service = {}
+    for record in DentalHistory.query.all():
+        revenue_by_service[record.procedure_type] = revenue_by_service.get(record.procedure_type, 0) + (record.cost or 0)
+    return service_stats, revenue_by_service
+
+
+def main(sizes):
+    rows = []
+    for size in sizes:
+        app, path = make_app()
+        try:
+            with app.app_context():
+                seed(users=max(10, size // 20), appointments=size, dental_records=size // 2)
+                
+                # Sanity check: both paths agree on the counts
+                legacy, _ = legacy_service_analysis()
+                current = data_processor.service_analysis()['service_statistics']
+                for name, stats in legacy.items():
+                    assert stats['total_appointments'] == current[name]['total_appointments']
+                    assert stats['completed'] == current[name]['completed']
+                db.session.expire_all()
+                
+                legacy_ms = timeit(lambda: (legacy_service_analysis(), db.session.expire_all()), repeat=3)
+                sql_ms = timeit(lambda: data_processor.service_analysis(), repeat=5)
+                rows.append((size, legacy_ms, sql_ms, legacy_ms / sql_ms if sql_ms else 0.0))
+        finally:
+            drop_app(path)
+    
+    report('service_analysis: python scan vs GROUP BY (median ms)',
+           ['appointments', 'python scan', 'group by', 'speedup'], rows)
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000])
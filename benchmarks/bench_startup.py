@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Measure create_app() cold-start wall time and peak RSS, with and without the scientific stack
+
+Each sample runs in a fresh interpreter. "eager" first imports what the analytics modules
+used to load at import time (pandas, numpy, sklearn, matplotlib, seaborn, joblib), which
+reproduces the old startup cost; "lazy" is the app as it boots now.
+
+Usage: python benchmarks/bench_startup.py [runs]
+"""
+
+import os
+import sys
+import json
+import subprocess
+from statistics import median
+
+from common import report
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EAGER_IMPORTS = ['pandas', 'numpy', 'sklearn.linear_model', 'sklearn.ensemble', 'sklearn.preprocessing',
+                 'sklearn.model_selection', 'sklearn.metrics', 'matplotlib.pyplot', 'seaborn', 'joblib']
+
+HEAVY_MODULES = ['pandas', 'numpy', 'sklearn', 'matplotlib', 'seaborn', 'joblib']
+
+PROBE = """
+import importlib, json, resource, sys, time
+start = time.perf_counter()
+for name in {imports!r}:
+    importlib.import_module(name)
+from app import create_app
+create_app()
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    'seconds': elapsed,
+    'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'loaded': [name for name in {heavy!r} if name in sys.modules]
+}}))
+"""
+
+
+def sample(imports):
+    code = PROBE.format(imports=imports, heavy=HEAVY_MODULES)
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(runs=5):
+    rows = []
+    for mode, imports in (('eager', EAGER_IMPORTS), ('lazy', [])):
+        samples = [sample(imports) for _ in range(runs)]
+        rows.append((
+            mode,
+            median(s['seconds'] for s in samples) * 1000,
+            median(s['rss_mb'] for s in samples),
+            ','.join(samples[-1]['loaded']) or '-'
+        ))
+    
+    report(f'create_app() cold start, median of {runs} fresh interpreters',
+           ['mode', 'wall ms', 'peak rss MB', 'heavy modules'], rows)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,128 @@
+"""
+Shared helpers for the benchmark scripts in this directory
+"""
+
+import os
+import sys
+import random
+import tempfile
+import time
+from datetime import date, time as dtime, timedelta
+from statistics import median
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.models import User, Appointment, Service, DentalHistory, MedicalRecord, Resource
+from app.rollups import rebuild_appointment_rollup
+
+SERVICE_NAMES = ['checkup', 'cleaning', 'filling', 'extraction', 'whitening', 'consultation', 'emergency']
+STATUSES = ['scheduled', 'confirmed', 'completed', 'completed', 'completed', 'cancelled', 'no_show']
+
+
+def make_app(config=None):
+    """Create an app bound to a throwaway SQLite database file; config overrides further settings"""
+    handle, path = tempfile.mkstemp(prefix='bench_', suffix='.db')
+    os.close(handle)
+    # No Socket.IO server or background dispatcher; benchmarks drive the code directly
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', 'REALTIME_ENABLED': False, **(config or {})})
+    with app.app_context():
+        db.create_all()
+    return app, path
+
+
+def drop_app(path):
+    """Remove the database file created by make_app"""
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def seed(users=100, appointments=1000, dental_records=0, medical_records=0, days=365, seed_value=42, resources=1):
+    """Bulk insert synthetic clinic data (must run inside an app context)"""
+    rng = random.Random(seed_value)
+    today = date.today()
+    
+    db.session.execute(db.insert(Resource), [
+        {'name': f'Chair {i}', 'resource_type': 'chair', 'sort_order': i, 'is_active': True, 'is_deleted': False}
+        for i in range(1, resources + 1)
+    ])
+    
+    db.session.execute(db.insert(Service), [
+        {'name': name, 'category': 'general', 'duration': rng.choice([30, 45, 60, 90]),
+         'base_cost': float(rng.randint(50, 400)), 'is_active': True, 'is_deleted': False}
+        for name in SERVICE_NAMES
+    ])
+    
+    db.session.execute(db.insert(User), [
+        {'username': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': 'x',
+         'first_name': 'Bench', 'last_name': f'User{i}', 'phone': '+995555123456', 'is_admin': False,
+         'is_active': True, 'is_deleted': False, 'failed_login_attempts': 0}
+        for i in range(1, users + 1)
+    ])
+    
+    rows = []
+    for i in range(appointments):
+        rows.append({
+            'user_id': rng.randint(1, users), 'name': 'Bench Patient', 'email': 'patient@example.com',
+            'phone': '+995555123456', 'resource_id': rng.randint(1, resources) if resources else None,
+            'date': today - timedelta(days=rng.randint(0, days)),
+            'time': dtime(rng.randint(9, 16), rng.choice([0, 15, 30, 45])),
+            'service_type': rng.choice(SERVICE_NAMES), 'duration': rng.choice([30, 45, 60]),
+            'status': rng.choice(STATUSES), 'cost': float(rng.randint(50, 400)),
+            'is_deleted': False, 'reminder_sent': False
+        })
+        if len(rows) >= 10000:
+            db.session.execute(db.insert(Appointment), rows)
+            rows = []
+    if rows:
+        db.session.execute(db.insert(Appointment), rows)
+    
+    rows = []
+    for i in range(dental_records):
+        rows.append({
+            'user_id': rng.randint(1, users), 'procedure_type': rng.choice(SERVICE_NAMES),
+            'cost': float(rng.randint(50, 400)), 'procedure_date': today - timedelta(days=rng.randint(0, days)),
+            'is_deleted': False
+        })
+        if len(rows) >= 10000:
+            db.session.execute(db.insert(DentalHistory), rows)
+            rows = []
+    if rows:
+        db.session.execute(db.insert(DentalHistory), rows)
+    
+    conditions = ['diabetes', 'hypertension', 'asthma', 'allergy', 'heart disease', 'pregnancy']
+    rows = []
+    for i in range(medical_records):
+        rows.append({
+            'user_id': rng.randint(1, users), 'record_type': rng.choice(['medical', 'medical', 'dental']),
+            'title': rng.choice(conditions), 'date_recorded': today - timedelta(days=rng.randint(0, days)),
+            'is_deleted': False
+        })
+        if len(rows) >= 10000:
+            db.session.execute(db.insert(MedicalRecord), rows)
+            rows = []
+    if rows:
+        db.session.execute(db.insert(MedicalRecord), rows)
+    
+    db.session.commit()
+    
+    # Core bulk inserts bypass the ORM hooks that maintain the rollup
+    rebuild_appointment_rollup()
+
+
+def timeit(fn, repeat=5):
+    """Return the median wall time of fn() in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return median(samples)
+
+
+def report(title, header, rows):
+    """Print a fixed-width results table"""
+    print(f"\n{title}")
+    print('  '.join(f'{h:>14}' for h in header))
+    for row in rows:
+        print('  '.join(f'{v:>14.2f}' if isinstance(v, float) else f'{v:>14}' for v in row))
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Smoke checks for state kept in the shared cache by background subsystems
+
+Each check runs against a throwaway database and a throwaway SQLite cache and fails
+with an AssertionError (or the original exception) when the subsystem is broken.
+
+Usage: python benchmarks/smoke_checks.py [check ...]
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+from datetime import date, time, timedelta
+
+from common import make_app, drop_app, seed, db
+from app.extensions import cache
+from app.live_metrics import live_metrics
+from app.models import User, Appointment
+from app.snapshots import snapshot_scheduler
+
+
+def check_snapshot(app):
+    """One analytics snapshot builds, is versioned and is served to the admin report"""
+    with app.app_context():
+        entry = snapshot_scheduler.refresh('performance_report')
+        assert entry is not None, 'snapshot lock was held by another worker'
+        assert isinstance(entry['version'], int) and entry['version'] >= 1, entry['version']
+        assert snapshot_scheduler.latest('performance_report')['version'] == entry['version']
+
+        admin = db.session.get(User, 1)
+        admin.is_admin = True
+        db.session.commit()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+    response = client.get('/admin/performance-report')
+    assert response.status_code == 200, response.status_code
+
+
+def check_live_metrics(app):
+    """Committing a user and an appointment moves the live counters without a recount"""
+    with app.app_context():
+        before = live_metrics.counters()
+        counted_at = cache.get(live_metrics._key('counted_at'))
+
+        user = User(username='smoke', email='smoke@example.com', password_hash='x',
+                    first_name='Smoke', last_name='Check', phone='+995555123456')
+        db.session.add(user)
+        db.session.commit()
+        db.session.add(Appointment(user_id=user.id, name='Smoke Check', email='smoke@example.com',
+                                   phone='+995555123456', service_type='Cleaning',
+                                   date=date.today() + timedelta(days=400), time=time(9), status='scheduled'))
+        db.session.commit()
+
+        after = live_metrics.counters()
+        assert cache.get(live_metrics._key('counted_at')) == counted_at, 'counters were recounted'
+        assert after['total_users'] == before['total_users'] + 1, (before, after)
+        assert after['active_appointments'] == before['active_appointments'] + 1, (before, after)
+
+
+CHECKS = {
+    'snapshot': check_snapshot,
+    'live_metrics': check_live_metrics
+}
+
+
+def main(names):
+    cache_dir = tempfile.mkdtemp(prefix='smoke_cache_')
+    app, path = make_app({'CACHE_SQLITE_PATH': os.path.join(cache_dir, 'cache.sqlite3')})
+    try:
+        with app.app_context():
+            seed(users=20, appointments=300)
+        for name in names or CHECKS:
+            CHECKS[name](app)
+            print(f"{name}: ok")
+    finally:
+        drop_app(path)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
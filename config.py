@@ -20,7 +20,8 @@ class Config:
     }
     
     # Performance and Caching
-    CACHE_TYPE = os.environ.get('CACHE_TYPE', 'simple')  # simple, redis, memcached
+    CACHE_TYPE = os.environ.get('CACHE_TYPE', 'app.shared_cache.SQLiteCache')  # shared by every worker on the host; simple, redis, memcached
+    CACHE_SQLITE_PATH = os.environ.get('CACHE_SQLITE_PATH')  # app.shared_cache.SQLiteCache file, instance/cache.sqlite3 by default
     CACHE_REDIS_URL = os.environ.get('REDIS_URL')
     CACHE_DEFAULT_TIMEOUT = 300
     CACHE_KEY_PREFIX = 'dental_clinic_'
@@ -82,12 +83,30 @@ class Config:
     
     # Analytics Configuration
     ANALYTICS_ENABLED = os.environ.get('ANALYTICS_ENABLED', 'true').lower() in ['true', 'on', '1']
-    ANALYTICS_RETENTION_DAYS = 365
+    ANALYTICS_RETENTION_DAYS = 365  # soft-deleted appointments, articles, services and insurances are purged after this
     ANALYTICS_BATCH_SIZE = 1000
+    ANALYTICS_SNAPSHOT_INTERVAL = int(os.environ.get('ANALYTICS_SNAPSHOT_INTERVAL', 900))  # seconds between precomputed report refreshes
+    
+    # Chart Rendering
+    CHART_RENDER_WORKERS = int(os.environ.get('CHART_RENDER_WORKERS', 2))  # 0 renders on the request thread
+    CHART_RENDER_TIMEOUT = 30  # seconds
+    CHART_CACHE_TIMEOUT = 86400  # rendered images are content-addressed, so they never go stale
+    CHART_DEFAULT_PRESET = 'screen'
+    CHART_PRESETS = {
+        'thumbnail': {'figsize': (5, 3), 'dpi': 72},
+        'screen': {'figsize': (10, 6), 'dpi': 100},
+        'print': {'figsize': (10, 6), 'dpi': 300}
+    }
     
     # Real-time Configuration
-    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+    REALTIME_ENABLED = os.environ.get('REALTIME_ENABLED', 'true').lower() in ['true', 'on', '1']  # Socket.IO server, reminder dispatcher and scheduled retention
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')  # e.g. redis://localhost:6379/1; required with more than one worker
     SOCKETIO_ASYNC_MODE = 'eventlet'
+    PRESENCE_BACKEND = os.environ.get('PRESENCE_BACKEND', 'sqlite')  # memory (single worker) or sqlite (all workers on one host)
+    PRESENCE_SQLITE_PATH = os.environ.get('PRESENCE_SQLITE_PATH')  # instance/presence.sqlite3 by default
+    PRESENCE_TTL = 90  # seconds a worker's sessions stay visible without a heartbeat
+    SOCKET_COALESCE_WINDOW = 0.5  # seconds appointment_update/new_notification events wait to be sent as one batch per room; 0 sends at once
+    METRICS_RESYNC_INTERVAL = 3600  # seconds between full recounts of the incrementally kept system health counters
     
     # Background Tasks (Celery)
     CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
@@ -119,11 +138,19 @@ class Config:
     
     # Notification Configuration
     NOTIFICATION_RETENTION_DAYS = 30
-    NOTIFICATION_BATCH_SIZE = 100
+    NOTIFICATION_BATCH_SIZE = 100  # also the chunk size of retention purges
+    RETENTION_INTERVAL = 86400  # seconds between retention runs on the reminder leader
+    RETENTION_PAUSE_SECONDS = 0.05  # pause between purge chunks so other writers get the database
+    RETENTION_ARCHIVE_DIR = os.environ.get('RETENTION_ARCHIVE_DIR')  # gzipped NDJSON of archived rows, instance/archive by default
     PUSH_NOTIFICATIONS_ENABLED = os.environ.get('PUSH_NOTIFICATIONS_ENABLED', 'false').lower() in ['true', 'on', '1']
     
     # Appointment Configuration
     APPOINTMENT_REMINDER_HOURS = 24
+    REMINDER_LEASE_SECONDS = 60  # leader lease on the shared cache; only the holder dispatches
+    REMINDER_RESYNC_INTERVAL = 60  # seconds between picking up bookings committed by other workers
+    REMINDER_RETRY_SECONDS = 60  # delay before a failed reminder or task is retried
+    SYSTEM_UPDATE_INTERVAL = 60  # seconds between admin system health broadcasts
+    NOTIFICATION_CLEANUP_INTERVAL = 3600  # longest wait between expired notification sweeps
     APPOINTMENT_CANCELLATION_HOURS = 24
     APPOINTMENT_DURATION_DEFAULT = 60  # minutes
     APPOINTMENT_SLOT_INTERVAL = 15  # minutes
@@ -157,9 +184,15 @@ class Config:
     }
     
     # Data Export Configuration
-    EXPORT_FORMATS = ['xlsx', 'csv', 'pdf', 'json']
-    EXPORT_MAX_RECORDS = 10000
+    EXPORT_FORMATS = ['xlsx', 'csv', 'ndjson', 'json']
+    EXPORT_MAX_RECORDS = 10000  # rows per sheet
+    EXPORT_BATCH_SIZE = 1000  # rows fetched per server-side cursor round trip
     EXPORT_TIMEOUT = 300  # seconds
+    EXPORT_WORKERS = 2  # background export jobs running at once per process
+    EXPORT_MAX_PENDING_JOBS = 20
+    EXPORT_ARTIFACT_DIR = os.environ.get('EXPORT_ARTIFACT_DIR')  # instance/exports by default
+    EXPORT_ARTIFACT_TTL = 3600  # seconds a finished export stays downloadable
+    EXPORT_PROGRESS_INTERVAL = 1000  # rows between progress updates
     
     # Audit Trail Configuration
     AUDIT_LOG_RETENTION_DAYS = 365
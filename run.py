@@ -1,6 +1,10 @@
 from app import create_app
 
 app = create_app()
+socketio = app.extensions.get('socketio')  # None when REALTIME_ENABLED is off
 
 if __name__ == "__main__":
-    app.run(debug=True) 
\ No newline at end of file
+    if socketio is not None:
+        socketio.run(app, debug=True)
+    else:
+        app.run(debug=True) 
\ No newline at end of file
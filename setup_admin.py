@@ -8,7 +8,7 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from app import create_app, db
-from app.models import User
+from app.models import User, Resource
 from werkzeug.security import generate_password_hash
 from datetime import datetime, date
 
@@ -20,6 +20,12 @@ def setup_admin():
         # Create database tables
         db.create_all()
         
+        # Bookings need at least one chair to be assigned to
+        if not Resource.query.filter_by(is_deleted=False).first():
+            db.session.add(Resource(name='Chair 1', resource_type='chair'))
+            db.session.commit()
+            print("Created default resource 'Chair 1'")
+        
         # Check if admin already exists
         admin = User.query.filter_by(username='admin').first()
         